@@ -0,0 +1,127 @@
+import hashlib
+import json
+import os
+import shutil
+import numpy as np
+
+# bump whenever the layout of any cached array changes
+CACHE_FORMAT_VERSION = 1
+HEADER_FN = 'header.json'
+
+
+def sha256_of_file(fn, block_size=1 << 24):
+    h = hashlib.sha256()
+    with open(fn, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+# size, mtime and content hash of a source file
+def file_fingerprint(fn):
+    stat = os.stat(fn)
+    return {'path': fn,
+            'size': stat.st_size,
+            'mtime': stat.st_mtime,
+            'sha256': sha256_of_file(fn)}
+
+
+# a cache is fresh if every source still has the recorded size and either the
+# same mtime or (after a touch / copy) the same content hash
+def fingerprint_is_fresh(fingerprint):
+    fn = fingerprint['path']
+    if not os.path.exists(fn):
+        return False
+    stat = os.stat(fn)
+    if stat.st_size != fingerprint['size']:
+        return False
+    if stat.st_mtime == fingerprint['mtime']:
+        return True
+    return sha256_of_file(fn) == fingerprint['sha256']
+
+
+# short id for the exact inputs a cache was built from
+# derived caches record it so they are invalidated along with their inputs
+def cache_version(header):
+    key = json.dumps({'format_version': header['format_version'],
+                      'sources': [(s['path'], s['size'], s['sha256']) for s in header['sources']],
+                      'extra': header['extra']}, sort_keys=True)
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()[:16]
+
+
+# write arrays as .npy files next to a small json header
+# the directory is built under a temporary name and swapped in, so readers never see a partial cache
+def write_array_cache(cache_dir, arrays, source_fns=(), extra=None):
+    header = {'format_version': CACHE_FORMAT_VERSION,
+              'sources': [file_fingerprint(fn) for fn in source_fns],
+              'extra': extra or {},
+              'arrays': {}}
+    tmp_dir = '{}.tmp-{}'.format(cache_dir.rstrip('/'), os.getpid())
+    if os.path.exists(tmp_dir):
+        shutil.rmtree(tmp_dir)
+    os.makedirs(tmp_dir)
+    for name, array in arrays.items():
+        array = np.ascontiguousarray(array)
+        np.save(os.path.join(tmp_dir, name + '.npy'), array)
+        header['arrays'][name] = {'dtype': array.dtype.str, 'shape': list(array.shape)}
+    header['version'] = cache_version(header)
+    with open(os.path.join(tmp_dir, HEADER_FN), 'w') as f:
+        json.dump(header, f, indent=4)
+    # move the old cache aside rather than deleting it first, so the new one is in
+    # place straight after; readers that already mapped old arrays keep them
+    old_dir = '{}.old-{}'.format(cache_dir.rstrip('/'), os.getpid())
+    if os.path.exists(cache_dir):
+        os.rename(cache_dir, old_dir)
+    os.rename(tmp_dir, cache_dir)
+    if os.path.exists(old_dir):
+        shutil.rmtree(old_dir)
+    return header
+
+
+def read_cache_header(cache_dir):
+    fn = os.path.join(cache_dir, HEADER_FN)
+    if not os.path.exists(fn):
+        return None
+    with open(fn, 'r') as f:
+        return json.load(f)
+
+
+# replace the header through a temporary file, so concurrent readers see the old
+# or the new one and never a partly written one
+def write_cache_header(cache_dir, header):
+    fn = os.path.join(cache_dir, HEADER_FN)
+    tmp_fn = '{}.tmp-{}'.format(fn, os.getpid())
+    with open(tmp_fn, 'w') as f:
+        json.dump(header, f, indent=4)
+    os.replace(tmp_fn, fn)
+
+
+# returns (arrays, header), or (None, None) if the cache is missing or stale
+# arrays are memory-mapped read-only, so concurrent processes share the page cache
+# any key in expected_extra must match what was recorded at write time
+def read_array_cache(cache_dir, mmap_mode='r', expected_extra=None):
+    header = read_cache_header(cache_dir)
+    if header is None:
+        return None, None
+    if header.get('format_version') != CACHE_FORMAT_VERSION:
+        print('Cache {} has format version {}, expected {}.'.format(cache_dir, header.get('format_version'), CACHE_FORMAT_VERSION))
+        return None, None
+    touched = False
+    for fingerprint in header['sources']:
+        if not fingerprint_is_fresh(fingerprint):
+            print('Cache {} is stale: {} changed.'.format(cache_dir, fingerprint['path']))
+            return None, None
+        mtime = os.stat(fingerprint['path']).st_mtime
+        if mtime != fingerprint['mtime']:
+            fingerprint['mtime'] = mtime
+            touched = True
+    # only the mtime moved, so record it and skip hashing next time
+    if touched:
+        write_cache_header(cache_dir, header)
+    for key, value in (expected_extra or {}).items():
+        if header['extra'].get(key) != value:
+            print('Cache {} is stale: {} does not match.'.format(cache_dir, key))
+            return None, None
+    arrays = {name: np.load(os.path.join(cache_dir, name + '.npy'), mmap_mode=mmap_mode)
+              for name in header['arrays']}
+    return arrays, header
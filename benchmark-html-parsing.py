@@ -0,0 +1,82 @@
+import argparse
+import glob
+import json
+import os
+import statistics
+import time
+import tracemalloc
+
+from get_book_genres import EXTRACTION_BACKENDS, parse_book
+from synthetic_data import write_synthetic_book_pages
+
+# per-page parse time and peak python memory of each extraction backend
+# over a directory of saved book pages (<book_id>.html), checking that every
+# backend extracts the same fields as the original bs4 / html.parser one
+# without a directory, synthetic pages are written (once) to benchmark-data/book-pages-<num_pages>
+#   python benchmark-html-parsing.py
+#   python benchmark-html-parsing.py --html_directory_path saved-pages
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--html_directory_path', type=str, default=None, help='saved pages to parse (default: synthetic pages, see generate-synthetic-book-pages.py)')
+parser.add_argument('--num_pages', type=int, default=40, help='synthetic pages to write when there is no --html_directory_path')
+parser.add_argument('--backends', type=str, nargs='*', default=list(EXTRACTION_BACKENDS), choices=EXTRACTION_BACKENDS)
+parser.add_argument('--repeats', type=int, default=3)
+parser.add_argument('--output_path', type=str, default=None, help='also write the report as json here')
+
+
+def main():
+    args = parser.parse_args()
+    html_directory_path = args.html_directory_path
+    if html_directory_path is None:
+        html_directory_path = 'benchmark-data/book-pages-{}'.format(args.num_pages)
+        if not os.path.exists(html_directory_path):
+            write_synthetic_book_pages(html_directory_path, args.num_pages)
+    pages = []
+    for fn in sorted(glob.glob(os.path.join(html_directory_path, '*.html'))):
+        with open(fn, 'rb') as f:
+            pages.append((os.path.basename(fn)[:-len('.html')], f.read()))
+    print('{} pages, {:.1f} KB on average'.format(len(pages), sum(len(p) for _, p in pages) / max(len(pages), 1) / 1024))
+
+    reference = {book_id: parse_book(book_id, page, 'bs4') for book_id, page in pages}
+
+    report = {'num_pages': len(pages), 'backends': {}}
+    for backend in args.backends:
+        seconds = []
+        mismatches = 0
+        for book_id, page in pages:
+            # best of repeats, to keep scheduler noise out of per-page numbers
+            best = float('inf')
+            for _ in range(args.repeats):
+                start = time.perf_counter()
+                book = parse_book(book_id, page, backend)
+                best = min(best, time.perf_counter() - start)
+            seconds.append(best)
+            mismatches += int(book != reference[book_id])
+
+        # memory in a separate pass, tracemalloc slows everything down
+        # note tracemalloc only sees python allocations, not lxml's C-level tree
+        peaks = []
+        for book_id, page in pages:
+            tracemalloc.start()
+            parse_book(book_id, page, backend)
+            peaks.append(tracemalloc.get_traced_memory()[1])
+            tracemalloc.stop()
+
+        report['backends'][backend] = {
+            'mean_ms_per_page': 1000 * statistics.mean(seconds),
+            'median_ms_per_page': 1000 * statistics.median(seconds),
+            'pages_per_second': len(pages) / sum(seconds),
+            'mean_peak_kb_per_page': statistics.mean(peaks) / 1024,
+            'max_peak_kb_per_page': max(peaks) / 1024,
+            'pages_differing_from_bs4': mismatches}
+        print('{}: {:.2f} ms/page median, {:.0f} KB peak on average, {} pages differ from bs4'.format(
+            backend, report['backends'][backend]['median_ms_per_page'], report['backends'][backend]['mean_peak_kb_per_page'], mismatches))
+
+    print(json.dumps(report, indent=4))
+    if args.output_path:
+        with open(args.output_path, 'w') as f:
+            json.dump(report, f, indent=4)
+
+
+if __name__ == '__main__':
+    main()
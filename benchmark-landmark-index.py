@@ -0,0 +1,97 @@
+import json
+import argparse
+import random
+import statistics
+
+from book_graph_utils import *
+
+# how long landmark indexes take to build, how big they are, and how much faster
+# the k-closest search is with them, against the plain and the bounded search
+# on the same sampled books; every result is checked against the plain search
+#   python benchmark-landmark-index.py --num_landmarks 4 16 64 --precomputed_edges
+# bound tightness is the k-th closest distance divided by the bound the landmarks
+# give before the search starts (1 is perfect), and the lower bound tightness is
+# the mean ratio of the landmark lower bound to the true distance over the results
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--num_landmarks', type=int, nargs='*', default=[4, 16, 64])
+parser.add_argument('--num_sources', type=int, default=20)
+parser.add_argument('--k', type=int, default=100)
+parser.add_argument('--precomputed_edges', action='store_true', help='search over the cached co-review matrix')
+parser.add_argument('--hub_reduction', type=str, default=None, help='benchmark on a reduced graph, e.g. cap-1000 (see hub_users.py)')
+parser.add_argument('--books_dict_path', type=str, default='librarything-books/genre_matched_books_dict.json')
+parser.add_argument('--output_path', type=str, default=None)
+parser.add_argument('--seed', type=int, default=0)
+
+
+def time_searches(graph, sources, k, bounded):
+    book_id_to_closest = {}
+    stats = {}
+    start = time.perf_counter()
+    for book_id in sources:
+        book_id_to_closest[book_id] = get_k_closest_books_in_graph(book_id, graph, k=k, bounded=bounded, stats=stats)
+    return (time.perf_counter() - start) / max(len(sources), 1), book_id_to_closest, stats
+
+
+def main():
+    args = parser.parse_args()
+    graph = open_book_graph(args.hub_reduction)
+    matrix = get_coreview_matrix(graph)
+    if args.precomputed_edges:
+        graph.attach_coreview_matrix(matrix)
+    _, sorted_by_degree = get_graph_degrees(graph)
+
+    with open(args.books_dict_path, 'r') as f:
+        genre_to_book_ids = json.load(f)
+    candidates = sorted(set(b for book_ids in genre_to_book_ids.values() for b in book_ids if graph.has_reviews(b)))
+    sources = random.Random(args.seed).sample(candidates, min(args.num_sources, len(candidates)))
+
+    plain_seconds, exact, plain_stats = time_searches(graph, sources, args.k, False)
+    bounded_seconds, bounded, bounded_stats = time_searches(graph, sources, args.k, True)
+    report = {'graph_version': graph.version, 'num_books': int(graph.num_books), 'num_sources': len(sources), 'k': args.k,
+              'precomputed_edges': args.precomputed_edges,
+              'plain': {'seconds_per_source': plain_seconds, 'relaxations': plain_stats['relaxations']},
+              'bounded': {'seconds_per_source': bounded_seconds, 'relaxations': bounded_stats['relaxations'],
+                          'identical': bounded == exact},
+              'landmarks': {}}
+    print('plain: {:.4f}s per source, bounded: {:.4f}s per source'.format(plain_seconds, bounded_seconds))
+
+    for num_landmarks in args.num_landmarks:
+        start = time.perf_counter()
+        index = LandmarkIndex.build(matrix, sorted_by_degree[:num_landmarks])
+        build_seconds = time.perf_counter() - start
+
+        bound_tightness = []
+        lower_tightness = []
+        for book_id in sources:
+            closest = exact[book_id]
+            if len(closest) < args.k:
+                continue
+            source = graph.book_index(book_id)
+            initial_bound = max(d for _, d in index.closest_upper_bounds(source, args.k))
+            bound_tightness.append(closest[-1][1] / initial_bound)
+            lower = index.lower_bounds(source)
+            lower_tightness.append(statistics.mean(lower[graph.book_index(b)] / d for b, d, _ in closest))
+
+        graph.attach_landmark_index(index)
+        seconds, results, stats = time_searches(graph, sources, args.k, True)
+        graph.attach_landmark_index(None)
+        report['landmarks'][num_landmarks] = {
+            'build_seconds': build_seconds, 'nbytes': int(index.nbytes),
+            'seconds_per_source': seconds, 'relaxations': stats['relaxations'],
+            'speedup_vs_plain': plain_seconds / seconds, 'speedup_vs_bounded': bounded_seconds / seconds,
+            'bound_tightness': statistics.mean(bound_tightness) if bound_tightness else None,
+            'lower_bound_tightness': statistics.mean(lower_tightness) if lower_tightness else None,
+            'identical': results == exact}
+        print('{} landmarks: built in {:.1f}s, {:.1f} MB, {:.4f}s per source ({:.2f}x plain, {:.2f}x bounded), {} relaxations, identical: {}'.format(
+            num_landmarks, build_seconds, index.nbytes / 1024 / 1024, seconds, plain_seconds / seconds, bounded_seconds / seconds,
+            stats['relaxations'], results == exact))
+
+    print(json.dumps(report, indent=4))
+    if args.output_path:
+        with open(args.output_path, 'w') as f:
+            json.dump(report, f, indent=4)
+
+
+if __name__ == '__main__':
+    main()
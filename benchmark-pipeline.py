@@ -0,0 +1,176 @@
+import json
+import argparse
+import glob
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tracemalloc
+
+from book_graph_utils import *
+from genre_index import GenreIndex
+from synthetic_data import write_synthetic_interactions
+
+# times and memory-profiles each stage of the pipeline on a synthetic dataset
+#   python benchmark-pipeline.py --num_rows 1000000 --output_path bench-$(git rev-parse --short HEAD).json
+#   python benchmark-pipeline.py --num_rows 1000000 --compare_path bench-<older commit>.json
+# the dataset is generated once into <working_directory_path>/data and reused
+# while the generator arguments are the same; derived caches are deleted
+# before every run so each stage starts cold
+# memory is the peak resident set size during each stage, read from /proc on
+# linux after resetting the high-water mark; --trace_memory also records the
+# tracemalloc peak, which slows the pure python stages down a lot
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--working_directory_path', type=str, default='benchmark-data')
+parser.add_argument('--num_rows', type=int, default=1000000)
+parser.add_argument('--num_users', type=int, default=None)
+parser.add_argument('--num_books', type=int, default=None)
+parser.add_argument('--seed', type=int, default=0)
+parser.add_argument('--num_sources', type=int, default=20, help='books searched from in the search stages')
+parser.add_argument('--k', type=int, default=100)
+parser.add_argument('--skip_legacy', action='store_true', help='skip the stages on the original dict representation')
+parser.add_argument('--trace_memory', action='store_true', help='also record tracemalloc peaks (slow)')
+parser.add_argument('--output_path', type=str, default=None)
+parser.add_argument('--compare_path', type=str, default=None, help='earlier report to print per-stage ratios against')
+
+all_genres_uppercase = ['Romance', 'Fantasy', 'Historical Fiction', 'Science Fiction', 'Vampires', 'Memoir', 'Horror', 'Mystery']
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__)),
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# (current, peak) resident set size in MB, None where /proc is not available
+def rss_mb():
+    try:
+        with open('/proc/self/status', 'r') as f:
+            status = dict(line.split(':', 1) for line in f if ':' in line)
+        return int(status['VmRSS'].split()[0]) / 1024, int(status['VmHWM'].split()[0]) / 1024
+    except (OSError, KeyError):
+        return None, None
+
+
+# start a new peak for rss_mb (writing 5 to clear_refs resets VmHWM)
+def reset_peak_rss():
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        pass
+
+
+# runs fn() as a named stage and records its time and memory in report['stages']
+def run_stage(report, name, fn, trace_memory):
+    print('=== {} ==='.format(name))
+    reset_peak_rss()
+    rss_before, _ = rss_mb()
+    if trace_memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    result = fn()
+    seconds = time.perf_counter() - start
+    _, peak_rss = rss_mb()
+    stage = {'name': name, 'seconds': seconds, 'rss_before_mb': rss_before, 'peak_rss_mb': peak_rss}
+    if trace_memory:
+        stage['peak_traced_mb'] = tracemalloc.get_traced_memory()[1] / 1024 / 1024
+        tracemalloc.stop()
+    report['stages'].append(stage)
+    if peak_rss is not None:
+        print('=== {}: {:.3f}s, peak rss {:.0f} MB (+{:.0f} MB) ==='.format(name, seconds, peak_rss, peak_rss - rss_before))
+    else:
+        print('=== {}: {:.3f}s ==='.format(name, seconds))
+    return result
+
+
+# random scraped-style genre lists, so the scoring stage has something to score
+def synthetic_top_genres(book_ids, seed):
+    rng = random.Random(seed)
+    shelves = all_genres_uppercase + ['Fiction', 'Nonfiction', 'Young Adult', 'Classics', 'Paranormal > Vampires', 'Historical > Historical Fiction']
+    return {book_id: rng.sample(shelves, rng.randint(1, 8)) for book_id in book_ids}
+
+
+def score_closest(book_id_to_top_genres, sources, book_id_to_closest):
+    genre_index = GenreIndex.from_top_genres(book_id_to_top_genres, all_genres_uppercase)
+    rows = genre_index.row_matrix([[b for b, _, _ in book_id_to_closest[s]] for s in sources], 10)
+    return {genre: float(genre_index.fraction_in_genre(rows, genre).mean()) for genre in all_genres_uppercase}
+
+
+def main():
+    args = parser.parse_args()
+    trace_memory = args.trace_memory
+    # paths on the command line are relative to where the benchmark was started
+    output_path = os.path.abspath(args.output_path) if args.output_path else None
+    compare_path = os.path.abspath(args.compare_path) if args.compare_path else None
+    os.makedirs(os.path.join(args.working_directory_path, 'data'), exist_ok=True)
+    os.chdir(args.working_directory_path)
+
+    dataset = {'num_rows': args.num_rows, 'num_users': args.num_users, 'num_books': args.num_books, 'seed': args.seed}
+    dataset_fn = 'data/synthetic-dataset.json'
+    existing = None
+    if os.path.exists(dataset_fn):
+        with open(dataset_fn, 'r') as f:
+            existing = json.load(f)
+    if existing != dataset:
+        write_synthetic_interactions('data', args.num_rows, num_users=args.num_users, num_books=args.num_books, seed=args.seed)
+        with open(dataset_fn, 'w') as f:
+            json.dump(dataset, f)
+    for path in glob.glob('data/cached_*'):
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+        else:
+            os.remove(path)
+
+    report = {'git_commit': git_commit(), 'time': time.strftime('%Y-%m-%dT%H:%M:%S'), 'python': sys.version.split()[0],
+              'numpy': np.__version__, 'platform': platform.platform(), 'dataset': dataset,
+              'num_sources': args.num_sources, 'k': args.k, 'trace_memory': trace_memory, 'stages': []}
+
+    fn = 'data/goodreads_interactions.csv'
+    run_stage(report, 'goodreads_read_book_graph', lambda: goodreads_read_book_graph(fn), trace_memory)
+    run_stage(report, 'build_graph_cache', get_cached_book_graph, trace_memory)
+    graph = run_stage(report, 'load_graph_cache', get_cached_book_graph, trace_memory)
+    report['dataset'].update({'reviews': int(graph.num_reviews), 'users': int(graph.num_users), 'books': int(graph.num_books)})
+
+    sources = [graph.book_id(b) for b in random.Random(args.seed).sample(range(graph.num_books), min(args.num_sources, graph.num_books))]
+    run_stage(report, 'get_books_to_degrees', lambda: get_books_to_degrees(graph, graph), trace_memory)
+    run_stage(report, 'get_k_closest_books', lambda: {s: get_k_closest_books(s, graph, graph, k=args.k) for s in sources}, trace_memory)
+    run_stage(report, 'get_k_neighbors_with_most_same_reviewers',
+              lambda: get_k_neighbors_with_most_same_reviewers_batch(sources, graph, k=args.k), trace_memory)
+    run_stage(report, 'get_book_to_edges', lambda: get_book_to_edges(graph, graph), trace_memory)
+    graph.attach_coreview_matrix(get_coreview_matrix(graph))
+    book_id_to_closest = run_stage(report, 'get_k_closest_books_precomputed_edges',
+                                   lambda: {s: get_k_closest_books(s, graph, graph, k=args.k) for s in sources}, trace_memory)
+    book_id_to_top_genres = synthetic_top_genres(graph.book_to_users.keys(), args.seed)
+    run_stage(report, 'process_all_results_scoring', lambda: score_closest(book_id_to_top_genres, sources, book_id_to_closest), trace_memory)
+
+    if not args.skip_legacy:
+        user_to_books, book_to_users = run_stage(report, 'legacy_goodreads_read_events', lambda: goodreads_read_events(fn), trace_memory)
+        run_stage(report, 'legacy_get_books_to_degrees', lambda: get_books_to_degrees(user_to_books, book_to_users), trace_memory)
+        run_stage(report, 'legacy_get_k_closest_books',
+                  lambda: {s: get_k_closest_books(s, user_to_books, book_to_users, k=args.k) for s in sources}, trace_memory)
+        run_stage(report, 'legacy_get_k_neighbors_with_most_same_reviewers',
+                  lambda: {s: get_k_neighbors_with_most_same_reviewers(s, user_to_books, book_to_users, k=args.k) for s in sources}, trace_memory)
+        run_stage(report, 'legacy_get_book_to_edges', lambda: get_book_to_edges(user_to_books, book_to_users), trace_memory)
+
+    print(json.dumps(report, indent=4))
+    if output_path:
+        with open(output_path, 'w') as f:
+            json.dump(report, f, indent=4)
+
+    if compare_path:
+        with open(compare_path, 'r') as f:
+            baseline = {stage['name']: stage for stage in json.load(f)['stages']}
+        print('Compared to {}:'.format(compare_path))
+        for stage in report['stages']:
+            if stage['name'] in baseline:
+                print('    {}: {:.3f}s vs {:.3f}s ({:.2f}x)'.format(stage['name'], stage['seconds'], baseline[stage['name']]['seconds'],
+                                                               stage['seconds'] / max(baseline[stage['name']]['seconds'], 1e-9)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+import json
+import argparse
+import random
+import time
+
+from book_graph_utils import *
+
+# compares the priority queues on the operation sequences that
+# get_k_closest_books produces on real neighborhoods: each sampled search is
+# run once while recording every add / pop, then the recording is replayed
+# against each queue so that neighbor expansion is not part of the timing
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--num_sources', type=int, default=20)
+parser.add_argument('--k', type=int, default=100)
+parser.add_argument('--repeats', type=int, default=3)
+parser.add_argument('--seed', type=int, default=0)
+parser.add_argument('--books_dict_path', type=str, default='librarything-books/genre_matched_books_dict.json')
+
+
+# PriorityQueue that logs the operations made on it
+class RecordingPriorityQueue(PriorityQueue):
+
+    def __init__(self, trace):
+        super().__init__()
+        self.trace = trace
+
+    def add_or_update_vertex(self, task, priority):
+        self.trace.append((task, priority))
+        super().add_or_update_vertex(task, priority)
+
+    def pop_vertex(self):
+        self.trace.append(None)
+        return super().pop_vertex()
+
+
+def record_trace(graph, source_book_id, k):
+    trace = []
+    get_k_closest_books_in_graph(source_book_id, graph, k=k, queue=lambda num_vertices: RecordingPriorityQueue(trace))
+    return trace
+
+
+def replay(trace, queue, graph):
+    # getting the queue and handing it back are timed too, every search pays them
+    start = time.perf_counter()
+    pq = take_search_queue(graph, queue)
+    popped = []
+    for op in trace:
+        if op is None:
+            try:
+                popped.append(pq.pop_vertex())
+            except KeyError:
+                break
+        else:
+            pq.add_or_update_vertex(*op)
+    return_search_queue(graph, queue, False, pq)
+    return time.perf_counter() - start, popped
+
+
+def main():
+    args = parser.parse_args()
+    graph = get_cached_book_graph()
+    graph.attach_neighbor_cache(LRUCache(max_bytes=1024 * 1024 * 1024))
+
+    with open(args.books_dict_path, 'r') as f:
+        genre_to_book_ids = json.load(f)
+    candidates = sorted(set(b for book_ids in genre_to_book_ids.values() for b in book_ids if b in graph.book_to_users))
+    sources = random.Random(args.seed).sample(candidates, min(args.num_sources, len(candidates)))
+
+    totals = {queue: 0.0 for queue in PRIORITY_QUEUES}
+    num_adds = 0
+    for i, book_id in enumerate(sources):
+        trace = record_trace(graph, book_id, args.k)
+        num_adds += sum(op is not None for op in trace)
+        results = {}
+        for queue in PRIORITY_QUEUES:
+            seconds = min(replay(trace, queue, graph)[0] for _ in range(args.repeats))
+            totals[queue] += seconds
+            results[queue] = replay(trace, queue, graph)[1]
+        same = all(results[queue] == results['heapq'] for queue in PRIORITY_QUEUES)
+        print('{} / {}: {} with {} operations, identical pops: {}'.format(i + 1, len(sources), book_id, len(trace), same))
+
+    report = {'num_sources': len(sources), 'k': args.k, 'num_adds': num_adds,
+              'seconds': totals,
+              'speedup_vs_heapq': {queue: totals['heapq'] / max(seconds, 1e-12) for queue, seconds in totals.items()}}
+    print(json.dumps(report, indent=4))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,252 @@
+from collections.abc import Mapping
+import numpy as np
+
+from coreview import WEIGHTED_COUNT_DTYPE
+
+
+# concatenate the index slices of the given rows of a compressed sparse matrix
+def gather_rows(indptr, indices, rows):
+    starts = indptr[rows]
+    lengths = indptr[rows + 1] - starts
+    total = int(lengths.sum())
+    if total == 0:
+        return indices[:0]
+    # position of each output element inside its row
+    offsets = np.arange(total) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    return indices[np.repeat(starts, lengths) + offsets]
+
+
+# compressed sparse user x book review matrix with dense integer ids
+# users are rows (CSR: user_indptr/user_indices -> book indices)
+# books are columns (CSC: book_indptr/book_indices -> user indices)
+# user_ids and book_ids are sorted, so they double as the id maps back to
+# csv user ids and goodreads book ids
+class BookGraph:
+
+    ARRAY_NAMES = ('user_ids', 'book_ids', 'user_indptr', 'user_indices', 'book_indptr', 'book_indices')
+
+    def __init__(self, user_ids, book_ids, user_indptr, user_indices, book_indptr, book_indices, user_weights=None, version=None):
+        # id of the cache the arrays came from, None if built in memory
+        self.version = version
+        # appended to the directories of the caches derived from this graph, so a
+        # reduced graph (see hub_users.py) does not overwrite the full graph's caches
+        self.cache_suffix = ''
+        self.user_ids = user_ids
+        self.book_ids = book_ids
+        self.user_indptr = user_indptr
+        self.user_indices = user_indices
+        self.book_indptr = book_indptr
+        self.book_indices = book_indices
+        # optional float weight of each user's co-reviews, None when every co-reviewer counts 1
+        self.user_weights = user_weights
+        # optional precomputed book x book co-review csr matrix, see attach_coreview_matrix
+        self.coreview_matrix = None
+        # optional LRU cache of expanded neighbor lists, see attach_neighbor_cache
+        self.neighbor_cache = None
+        # optional landmark distances, see attach_landmark_index
+        self.landmark_index = None
+        # indexed priority queues the k-closest searches are done with, by (queue, counting),
+        # for the next search over this graph to reset and reuse, see take_search_queue
+        self.search_queues = {}
+        self.user_to_books = UserToBooksView(self)
+        self.book_to_users = BookToUsersView(self)
+
+    @classmethod
+    def from_reviews(cls, csv_user_ids, goodreads_book_ids):
+        'Build the graph from parallel arrays of (csv user id, goodreads book id) reviews'
+        user_ids, user_index = np.unique(csv_user_ids, return_inverse=True)
+        book_ids, book_index = np.unique(goodreads_book_ids, return_inverse=True)
+        return cls.from_review_indices(user_ids, book_ids, user_index, book_index)
+
+    @classmethod
+    def from_review_indices(cls, user_ids, book_ids, user_index, book_index, user_weights=None):
+        'Build the graph from parallel arrays of (user index, book index) reviews over sorted id arrays'
+        num_users = len(user_ids)
+        num_books = len(book_ids)
+        # drop duplicate reviews, which also sorts the pairs by user then book
+        pairs = np.unique(user_index.astype(np.int64) * num_books + book_index)
+        user_index = (pairs // num_books).astype(np.int32)
+        book_index = (pairs % num_books).astype(np.int32)
+
+        user_indptr = np.zeros(num_users + 1, dtype=np.int64)
+        np.cumsum(np.bincount(user_index, minlength=num_users), out=user_indptr[1:])
+        user_indices = book_index
+
+        order = np.argsort(book_index, kind='stable')
+        book_indptr = np.zeros(num_books + 1, dtype=np.int64)
+        np.cumsum(np.bincount(book_index, minlength=num_books), out=book_indptr[1:])
+        book_indices = user_index[order]
+
+        return cls(user_ids, book_ids, user_indptr, user_indices, book_indptr, book_indices, user_weights=user_weights)
+
+    @classmethod
+    def from_arrays(cls, arrays, version=None):
+        return cls(*[arrays[name] for name in cls.ARRAY_NAMES], user_weights=arrays.get('user_weights'), version=version)
+
+    def to_arrays(self):
+        arrays = {name: getattr(self, name) for name in self.ARRAY_NAMES}
+        if self.user_weights is not None:
+            arrays['user_weights'] = self.user_weights
+        return arrays
+
+    @property
+    def num_users(self):
+        return len(self.user_ids)
+
+    @property
+    def num_books(self):
+        return len(self.book_ids)
+
+    @property
+    def num_reviews(self):
+        return len(self.user_indices)
+
+    @property
+    def nbytes(self):
+        return sum(a.nbytes for a in self.to_arrays().values())
+
+    def book_index(self, book_id):
+        'Dense index for a goodreads book id. Raise KeyError if not in the graph.'
+        return _lookup(self.book_ids, book_id)
+
+    def user_index(self, user_id):
+        'Dense index for a csv user id. Raise KeyError if not in the graph.'
+        return _lookup(self.user_ids, user_id)
+
+    def book_id(self, book_index):
+        'Goodreads book id (as the string used in the json files) for a dense index'
+        return str(self.book_ids[book_index])
+
+    def user_id(self, user_index):
+        return str(self.user_ids[user_index])
+
+    def books_of(self, user_index):
+        return self.user_indices[self.user_indptr[user_index]:self.user_indptr[user_index + 1]]
+
+    def users_of(self, book_index):
+        return self.book_indices[self.book_indptr[book_index]:self.book_indptr[book_index + 1]]
+
+    def has_reviews(self, book_id):
+        'Whether a goodreads book id is in the graph with at least one reviewer (books of a reduced graph can have none)'
+        try:
+            i = self.book_index(book_id)
+        except KeyError:
+            return False
+        return self.book_indptr[i + 1] > self.book_indptr[i]
+
+    def review_ids(self):
+        'Parallel arrays of (csv user id, goodreads book id) for every review, as passed to from_reviews'
+        return np.repeat(self.user_ids, self.user_degrees()), self.book_ids[self.user_indices]
+
+    def book_degrees_in_reviews(self):
+        return np.diff(self.book_indptr)
+
+    def user_degrees(self):
+        return np.diff(self.user_indptr)
+
+    def attach_coreview_matrix(self, matrix):
+        'Answer coreview_neighbors from a precomputed co-review matrix instead of the review matrix'
+        # only an unpruned matrix (min_count=1, top_n=None) gives exact search results
+        self.coreview_matrix = matrix
+
+    def attach_neighbor_cache(self, cache):
+        'Memoize neighbor lists expanded from the review matrix in an LRUCache keyed by book index'
+        self.neighbor_cache = cache
+
+    def attach_landmark_index(self, index):
+        'Bound the k-closest searches with the distances in a LandmarkIndex'
+        self.landmark_index = index
+
+    def coreview_neighbors(self, book_index):
+        'Return (neighbor book indices, number of co-reviewers), excluding the book itself'
+        # with user_weights, the number of co-reviewers is their summed weight
+        if self.coreview_matrix is not None:
+            start = self.coreview_matrix.indptr[book_index]
+            end = self.coreview_matrix.indptr[book_index + 1]
+            return self.coreview_matrix.indices[start:end], self.coreview_matrix.data[start:end]
+        if self.neighbor_cache is not None:
+            return self.neighbor_cache.get_or_compute(book_index, self.expand_coreview_neighbors)
+        return self.expand_coreview_neighbors(book_index)
+
+    def expand_coreview_neighbors(self, book_index):
+        users = self.users_of(book_index)
+        books = gather_rows(self.user_indptr, self.user_indices, users)
+        if self.user_weights is None:
+            neighbors, counts = np.unique(books, return_counts=True)
+        else:
+            neighbors, inverse = np.unique(books, return_inverse=True)
+            weights = np.repeat(self.user_weights[users], self.user_indptr[users + 1] - self.user_indptr[users])
+            # rounded like the weighted co-review matrix, so both paths give the same distances
+            counts = np.bincount(inverse, weights=weights, minlength=len(neighbors)).astype(WEIGHTED_COUNT_DTYPE)
+        keep = neighbors != book_index
+        return neighbors[keep], counts[keep]
+
+
+def _lookup(sorted_ids, external_id):
+    try:
+        external_id = int(external_id)
+    except (TypeError, ValueError):
+        raise KeyError(external_id)
+    i = int(np.searchsorted(sorted_ids, external_id))
+    if i == len(sorted_ids) or sorted_ids[i] != external_id:
+        raise KeyError(external_id)
+    return i
+
+
+# find the BookGraph behind whatever was passed as user_to_books / book_to_users
+# returns None for the plain dict representation
+def as_book_graph(*graph_or_views):
+    for g in graph_or_views:
+        if isinstance(g, BookGraph):
+            return g
+        if isinstance(g, _GraphView):
+            return g.graph
+    return None
+
+
+# read-only dict-like views keyed by the string ids used everywhere else,
+# so code written against user_to_books / book_to_users dicts keeps working
+class _GraphView(Mapping):
+
+    def __init__(self, graph):
+        self.graph = graph
+
+
+class UserToBooksView(_GraphView):
+
+    def __getitem__(self, user_id):
+        g = self.graph
+        return [g.book_id(b) for b in g.books_of(g.user_index(user_id))]
+
+    def __contains__(self, user_id):
+        try:
+            self.graph.user_index(user_id)
+        except KeyError:
+            return False
+        return True
+
+    def __iter__(self):
+        return (str(u) for u in self.graph.user_ids)
+
+    def __len__(self):
+        return self.graph.num_users
+
+
+class BookToUsersView(_GraphView):
+
+    def __getitem__(self, book_id):
+        g = self.graph
+        return [g.user_id(u) for u in g.users_of(g.book_index(book_id))]
+
+    def __contains__(self, book_id):
+        try:
+            self.graph.book_index(book_id)
+        except KeyError:
+            return False
+        return True
+
+    def __iter__(self):
+        return (str(b) for b in self.graph.book_ids)
+
+    def __len__(self):
+        return self.graph.num_books
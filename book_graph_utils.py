@@ -7,6 +7,21 @@ import argparse
 import operator
 import gzip
 import os
+import time
+import numpy as np
+
+from array_cache import read_array_cache, read_cache_header, write_array_cache
+from book_graph import BookGraph, as_book_graph
+from priority_queue import PriorityQueue, IndexedPriorityQueue, CountingPriorityQueue, CountingIndexedPriorityQueue, KthDistanceBound
+from lru_cache import LRUCache
+from result_store import read_json_lines, write_json_atomic
+from search_log import SearchLog, print_search_summary
+from closest_results import ClosestResults, closest_results_path, load_closest_results, write_closest_results, open_closest_checkpoint, read_closest_checkpoint, remove_closest_checkpoint
+from personalized_pagerank import forward_push, random_walks, top_k_scores
+from landmark_index import LandmarkIndex
+from hub_users import parse_hub_reduction, reduce_hub_users
+from incremental import affected_books, coreview_delta, invalidated_results, merge_reviews, update_coreview_matrix, update_degrees
+from coreview import WeightedEdgesView, approximate_coreview_degrees, compute_coreview_matrix, coreview_degrees, top_k_coreviewed, coreview_matrix_from_arrays, coreview_matrix_to_arrays
 
 def goodreads_read_events(fn):
     print('Reading all Goodreads events:')
@@ -37,6 +52,168 @@ def goodreads_read_events(fn):
 
     return user_to_books, book_to_users
 
+# array where entry i is the goodreads book id for csv book id i (-1 if unmapped)
+def get_csv_id_to_goodreads_book_id_array(book_id_map_fn='data/book_id_map.csv'):
+    df = pd.read_csv(book_id_map_fn, usecols=['book_id_csv', 'book_id'], dtype=np.int64)
+    csv_ids = df['book_id_csv'].values
+    lookup = np.full(csv_ids.max() + 1, -1, dtype=np.int64)
+    lookup[csv_ids] = df['book_id'].values
+    return lookup
+
+# default progress callback for the chunked reader: same cadence as the row-by-row reader
+def print_read_progress(rows_read, rows_kept, elapsed_seconds):
+    print('    read {} rows, kept {} reviews ({:.0f} rows/s)'.format(rows_read, rows_kept, rows_read / max(elapsed_seconds, 1e-9)))
+
+# stream goodreads_interactions.csv in chunks, yielding (csv user ids, goodreads book ids)
+# integer arrays for the reviewed rows of each chunk
+# only one chunk of raw rows is held in memory at a time
+def iter_goodreads_review_chunks(fn, book_id_map_fn='data/book_id_map.csv', chunksize=5000000, progress_callback=print_read_progress):
+    csv_id_to_goodreads_book_id = get_csv_id_to_goodreads_book_id_array(book_id_map_fn)
+    start = time.perf_counter()
+    rows_read = 0
+    rows_kept = 0
+    # columns are user_id, book_id, is_read, rating, is_reviewed
+    reader = pd.read_csv(fn, usecols=[0, 1, 4], dtype=np.int64, chunksize=chunksize)
+    for chunk in reader:
+        user_ids = chunk.iloc[:, 0].values
+        csv_book_ids = chunk.iloc[:, 1].values
+        reviewed = chunk.iloc[:, 2].values == 1
+        rows_read += len(chunk)
+        user_ids = user_ids[reviewed]
+        book_ids = csv_id_to_goodreads_book_id[csv_book_ids[reviewed]]
+        if (book_ids < 0).any():
+            raise KeyError('csv book ids missing from {}: {}'.format(book_id_map_fn, np.unique(csv_book_ids[reviewed][book_ids < 0])[:10].tolist()))
+        rows_kept += len(user_ids)
+        if progress_callback is not None:
+            progress_callback(rows_read, rows_kept, time.perf_counter() - start)
+        yield user_ids, book_ids
+
+# chunked, vectorized replacement for goodreads_read_events
+# returns parallel integer arrays of (csv user id, goodreads book id) for every review
+def goodreads_read_review_arrays(fn, book_id_map_fn='data/book_id_map.csv', chunksize=5000000, progress_callback=print_read_progress):
+    print('Reading all Goodreads events in chunks:')
+    user_chunks = []
+    book_chunks = []
+    for user_ids, book_ids in iter_goodreads_review_chunks(fn, book_id_map_fn, chunksize, progress_callback):
+        user_chunks.append(user_ids)
+        book_chunks.append(book_ids)
+    user_ids = np.concatenate(user_chunks) if user_chunks else np.zeros(0, dtype=np.int64)
+    book_ids = np.concatenate(book_chunks) if book_chunks else np.zeros(0, dtype=np.int64)
+    print('Done reading events!!!')
+    print('Number of reviews: {}'.format(len(user_ids)))
+    return user_ids, book_ids
+
+# build the compressed sparse review graph straight from the interactions file
+def goodreads_read_book_graph(fn, book_id_map_fn='data/book_id_map.csv', chunksize=5000000, progress_callback=print_read_progress):
+    user_ids, book_ids = goodreads_read_review_arrays(fn, book_id_map_fn, chunksize, progress_callback)
+    graph = BookGraph.from_reviews(user_ids, book_ids)
+    print('Number of unique users: {}'.format(graph.num_users))
+    print('Number of unique books: {}'.format(graph.num_books))
+    return graph
+
+# memory-mapped binary cache of the review graph, rebuilt when either csv changes
+# delta files folded in by update_cached_book_graph are recorded in the header
+# and read again whenever the graph has to be rebuilt
+def get_cached_book_graph(fn='data/goodreads_interactions.csv', book_id_map_fn='data/book_id_map.csv', cache_dir='data/cached_book-graph'):
+    arrays, header = read_array_cache(cache_dir)
+    if arrays is not None:
+        print('Opened cached book graph {}.'.format(header['version']))
+        return BookGraph.from_arrays(arrays, version=header['version'])
+    old_header = read_cache_header(cache_dir)
+    delta_fns = old_header['extra'].get('delta_fns', []) if old_header is not None else []
+    delta_fns = [delta_fn for delta_fn in delta_fns if os.path.exists(delta_fn)]
+    if delta_fns:
+        user_ids, book_ids = goodreads_read_review_arrays(fn, book_id_map_fn)
+        for delta_fn in delta_fns:
+            delta_user_ids, delta_book_ids = goodreads_read_review_arrays(delta_fn, book_id_map_fn)
+            user_ids = np.concatenate([user_ids, delta_user_ids])
+            book_ids = np.concatenate([book_ids, delta_book_ids])
+        graph = BookGraph.from_reviews(user_ids, book_ids)
+    else:
+        graph = goodreads_read_book_graph(fn, book_id_map_fn)
+    return save_book_graph(graph, cache_dir, [fn, book_id_map_fn], delta_fns)
+
+def save_book_graph(graph, cache_dir, source_fns, delta_fns=()):
+    print('Saving book graph!')
+    write_array_cache(cache_dir, graph.to_arrays(), source_fns=list(source_fns) + list(delta_fns), extra={'delta_fns': list(delta_fns)})
+    arrays, header = read_array_cache(cache_dir)
+    return BookGraph.from_arrays(arrays, version=header['version'])
+
+# fold a delta file of new interactions (same columns as goodreads_interactions.csv)
+# into the cached graph, and carry the cached exact degrees and unpruned co-review
+# matrix over to the new graph version by updating only the rows that changed
+# other derived caches (pruned matrices, approximate degrees) are rebuilt on next use
+# returns (new graph, goodreads ids of the books whose co-review edges changed)
+def update_cached_book_graph(delta_fn, fn='data/goodreads_interactions.csv', book_id_map_fn='data/book_id_map.csv', cache_dir='data/cached_book-graph',
+                             coreview_cache_dir='data/cached_coreview-matrix', degrees_cache_dir='data/cached_book-degrees'):
+    graph = get_cached_book_graph(fn, book_id_map_fn, cache_dir)
+    header = read_cache_header(cache_dir)
+    delta_fns = header['extra'].get('delta_fns', [])
+    if delta_fn in delta_fns:
+        print('{} was already applied.'.format(delta_fn))
+        return graph, []
+
+    user_ids, book_ids = goodreads_read_review_arrays(delta_fn, book_id_map_fn)
+    start = time.perf_counter()
+    new_graph, added_users, added_books, old_to_new_book = merge_reviews(graph, user_ids, book_ids)
+    print('{} new reviews, {} new users, {} new books.'.format(len(added_users), new_graph.num_users - graph.num_users, new_graph.num_books - graph.num_books))
+    delta = coreview_delta(new_graph, added_users, added_books)
+    affected = affected_books(delta)
+    print('Co-review edges of {} books changed ({:.1f}s).'.format(len(affected), time.perf_counter() - start))
+
+    # read the old derived caches before the graph version they are keyed on changes
+    params = {'graph_version': graph.version, 'min_count': 1, 'top_n': None}
+    coreview_arrays, _ = read_array_cache(coreview_cache_dir, expected_extra=params)
+    degree_arrays, _ = read_array_cache(degrees_cache_dir, expected_extra={'graph_version': graph.version, 'approximate': False, 'degree_format': DEGREE_FORMAT_VERSION})
+    if degree_arrays is not None:
+        degrees = np.array(degree_arrays['degrees'])
+
+    new_graph = save_book_graph(new_graph, cache_dir, [fn, book_id_map_fn], delta_fns + [delta_fn])
+    if coreview_arrays is not None:
+        print('Updating co-review matrix.')
+        matrix = update_coreview_matrix(coreview_matrix_from_arrays(coreview_arrays), delta, old_to_new_book)
+        params['graph_version'] = new_graph.version
+        write_array_cache(coreview_cache_dir, coreview_matrix_to_arrays(matrix), extra=params)
+        new_graph.attach_coreview_matrix(matrix)
+    if degree_arrays is not None:
+        print('Updating degrees.')
+        degrees, sorted_by_degree = update_degrees(new_graph, degrees, old_to_new_book, affected)
+        write_array_cache(degrees_cache_dir, {'degrees': degrees, 'sorted_by_degree': sorted_by_degree},
+                          extra={'graph_version': new_graph.version, 'approximate': False, 'degree_format': DEGREE_FORMAT_VERSION})
+    print('Updated graph in {:.1f}s.'.format(time.perf_counter() - start))
+    return new_graph, [new_graph.book_id(b) for b in affected]
+
+# a copy of the cached graph with its hub users capped, sampled or dropped, see
+# hub_users.py for the reduction names; cached as <cache_dir>_<name> and rebuilt
+# whenever the full graph changes; caches derived from the reduced graph (degrees,
+# co-review matrix) get the same _<name> suffix, so the full graph's are kept
+def get_cached_reduced_book_graph(name, fn='data/goodreads_interactions.csv', book_id_map_fn='data/book_id_map.csv', cache_dir='data/cached_book-graph'):
+    reduction = parse_hub_reduction(name)
+    graph = get_cached_book_graph(fn, book_id_map_fn, cache_dir)
+    reduced_cache_dir = '{}_{}'.format(cache_dir, name)
+    params = {'parent_version': graph.version, 'reduction': reduction}
+    arrays, header = read_array_cache(reduced_cache_dir, expected_extra=params)
+    if arrays is None:
+        print('Reducing hub users ({}).'.format(name))
+        reduced, report = reduce_hub_users(graph, reduction)
+        print('    kept {} of {} reviews, {} of {} co-review pairs'.format(
+            report['reviews_kept'], report['reviews'], report['coreview_pairs_kept'], report['coreview_pairs']))
+        print('Saving reduced book graph!')
+        write_array_cache(reduced_cache_dir, reduced.to_arrays(), extra=dict(params, report=report))
+        arrays, header = read_array_cache(reduced_cache_dir, expected_extra=params)
+    else:
+        print('Opened cached reduced book graph {}.'.format(header['version']))
+    reduced = BookGraph.from_arrays(arrays, version=header['version'])
+    reduced.cache_suffix = '_' + name
+    return reduced
+
+# the graph the search scripts run on: the full cached graph, or a reduced one
+# when hub_reduction names one
+def open_book_graph(hub_reduction=None):
+    if hub_reduction:
+        return get_cached_reduced_book_graph(hub_reduction)
+    return get_cached_book_graph()
+
 # read in cached user-book interactions if they exist
 def get_cached_goodreads_events():
     user_to_books_fn = 'data/cached_user-to-books.json'
@@ -58,7 +235,52 @@ def get_cached_goodreads_events():
         json.dump({b: list(u) for b, u in book_to_users.items()}, f)
     return user_to_books, book_to_users
 
-def get_books_to_degrees(user_to_books, book_to_users):
+# bumped whenever the way degrees are computed changes, so caches written by an
+# older version fail expected_extra and are rebuilt (2: books with no reviewers are 0)
+DEGREE_FORMAT_VERSION = 2
+
+# per-book degrees of the co-review graph, cached next to the graph they came from
+# approximate=True estimates them with HyperLogLog sketches to within relative_error
+# returns (degree per book index, book indices sorted by decreasing degree)
+def get_graph_degrees(graph, approximate=False, relative_error=0.05, cache_dir=None):
+    if cache_dir is None:
+        cache_dir = 'data/cached_book-degrees' if not approximate else 'data/cached_book-degrees_approximate'
+        cache_dir += graph.cache_suffix
+    params = {'graph_version': graph.version, 'approximate': approximate, 'degree_format': DEGREE_FORMAT_VERSION}
+    if approximate:
+        params['relative_error'] = relative_error
+    if graph.version is not None:
+        arrays, _ = read_array_cache(cache_dir, expected_extra=params)
+        if arrays is not None:
+            print('Opened cached degrees.')
+            return arrays['degrees'], arrays['sorted_by_degree']
+
+    if approximate:
+        print('Estimating degrees.')
+        degrees = approximate_coreview_degrees(graph, relative_error)
+    else:
+        print('Calculating degrees.')
+        degrees = coreview_degrees(graph)
+    print('Sorting degrees.')
+    sorted_by_degree = np.argsort(-degrees, kind='stable')
+
+    if graph.version is not None:
+        print('Saving degrees.')
+        write_array_cache(cache_dir, {'degrees': degrees, 'sorted_by_degree': sorted_by_degree}, extra=params)
+    return degrees, sorted_by_degree
+
+# approximate and relative_error only apply to a BookGraph, see get_graph_degrees
+def get_books_to_degrees(user_to_books, book_to_users, approximate=False, relative_error=0.05):
+    graph = as_book_graph(user_to_books, book_to_users)
+    if graph is not None:
+        degrees, sorted_by_degree = get_graph_degrees(graph, approximate=approximate, relative_error=relative_error)
+        sorted_ids = [graph.book_id(b) for b in sorted_by_degree]
+        sorted_degrees = degrees[sorted_by_degree].tolist()
+        book_ids_sorted_by_degree = list(zip(sorted_ids, sorted_degrees))
+        book_id_to_degree = dict(book_ids_sorted_by_degree)
+        book_id_to_degree_rank = {book_id: i for i, book_id in enumerate(sorted_ids)}
+        return book_id_to_degree, book_id_to_degree_rank, book_ids_sorted_by_degree
+
     degree_fn = 'data/cached_book-id-to-degree.json'
     ranked_fn = 'data/cached_book-id-to-degree-rank.json'
     sorted_fn = 'data/cached_book-ids-with-degrees-sorted.json'
@@ -98,9 +320,92 @@ def get_books_to_degrees(user_to_books, book_to_users):
 
     return book_id_to_degree, book_id_to_degree_rank, book_ids_sorted_by_degree
 
+# sparse book x book matrix of co-review counts, cached next to the graph it came from
+# min_count and top_n prune edges (see compute_coreview_matrix); the defaults keep every edge
+def get_coreview_matrix(graph, min_count=1, top_n=None, cache_dir=None):
+    if cache_dir is None:
+        cache_dir = 'data/cached_coreview-matrix' + graph.cache_suffix
+        if min_count > 1 or top_n is not None:
+            cache_dir += '_min-{}_top-{}'.format(min_count, top_n)
+    params = {'graph_version': graph.version, 'min_count': min_count, 'top_n': top_n}
+    if graph.version is not None:
+        arrays, _ = read_array_cache(cache_dir, expected_extra=params)
+        if arrays is not None:
+            print('Opened cached co-review matrix.')
+            return coreview_matrix_from_arrays(arrays)
+
+    print('Calculating co-review matrix!')
+    matrix = compute_coreview_matrix(graph, min_count=min_count, top_n=top_n)
+    print('Number of weighted edges: {}'.format(matrix.nnz))
+    if graph.version is not None:
+        print('Saving co-review matrix!')
+        write_array_cache(cache_dir, coreview_matrix_to_arrays(matrix), extra=params)
+        arrays, _ = read_array_cache(cache_dir, expected_extra=params)
+        matrix = coreview_matrix_from_arrays(arrays)
+    return matrix
+
+# landmark distances for the search (see landmark_index.py), from the num_landmarks
+# books of highest co-review degree, cached next to the graph they came from
+# building runs one full dijkstra per landmark over the co-review matrix
+def get_landmark_index(graph, num_landmarks=16, cache_dir=None):
+    if cache_dir is None:
+        cache_dir = 'data/cached_landmarks' + graph.cache_suffix
+    params = {'graph_version': graph.version, 'num_landmarks': num_landmarks}
+    if graph.version is not None:
+        arrays, _ = read_array_cache(cache_dir, expected_extra=params)
+        if arrays is not None:
+            print('Opened cached landmark index.')
+            return LandmarkIndex.from_arrays(arrays)
+
+    matrix = graph.coreview_matrix if graph.coreview_matrix is not None else get_coreview_matrix(graph)
+    _, sorted_by_degree = get_graph_degrees(graph)
+    print('Calculating distances from {} landmarks!'.format(num_landmarks))
+    start = time.perf_counter()
+    index = LandmarkIndex.build(matrix, sorted_by_degree[:num_landmarks])
+    print('    done in {:.1f}s, {:.1f} MB'.format(time.perf_counter() - start, index.nbytes / 1024 / 1024))
+    if graph.version is not None:
+        print('Saving landmark index!')
+        write_array_cache(cache_dir, index.to_arrays(), extra=params)
+        arrays, _ = read_array_cache(cache_dir, expected_extra=params)
+        index = LandmarkIndex.from_arrays(arrays)
+    return index
+
+# the graph a searching process answers from: the cached graph with either the
+# co-review matrix (precomputed_edges) or an LRU cache of expanded neighbor lists,
+# and a landmark index when num_landmarks > 0
+# pool workers each call this; calling it once in the parent first builds the
+# caches, so the workers only open them
+def open_search_graph(hub_reduction=None, precomputed_edges=False, neighbor_cache_mb=0, num_landmarks=0):
+    graph = open_book_graph(hub_reduction)
+    if precomputed_edges:
+        graph.attach_coreview_matrix(get_coreview_matrix(graph))
+    elif neighbor_cache_mb > 0:
+        graph.attach_neighbor_cache(LRUCache(max_bytes=neighbor_cache_mb * 1024 * 1024))
+    if num_landmarks > 0:
+        graph.attach_landmark_index(get_landmark_index(graph, num_landmarks))
+    return graph
+
+# number of co-reviewers shared with every other book, for the dict representation
+# memoized in neighbor_cache (an LRUCache keyed by book id) when one is given
+def get_coreview_counts(book_id, user_to_books, book_to_users, neighbor_cache=None):
+    if neighbor_cache is not None:
+        return neighbor_cache.get_or_compute(book_id, lambda b: get_coreview_counts(b, user_to_books, book_to_users))
+    pair_to_num_users = defaultdict(int)
+    for u in book_to_users[book_id]:
+        for b in user_to_books[u]:
+            if b == book_id:
+                continue
+            pair_to_num_users[b] += 1
+    return pair_to_num_users
+
 # edge weight is simply # of co-reviewers
 # still need to reciprocate: 1 / weight for distances
-def get_book_to_edges(user_to_books, book_to_users):
+# neighbor_cache is shared with the search functions when working on the dict representation
+def get_book_to_edges(user_to_books, book_to_users, neighbor_cache=None):
+    graph = as_book_graph(user_to_books, book_to_users)
+    if graph is not None:
+        return WeightedEdgesView(graph, get_coreview_matrix(graph))
+
     fn = 'data/cached_book-id-to-weighted-edges.json'
     if os.path.exists(fn):
         print('Reading weighted edges!')
@@ -111,29 +416,267 @@ def get_book_to_edges(user_to_books, book_to_users):
     for i, (book_id, users) in enumerate(book_to_users.items()):
         if i % 1000 == 0:
             print(i)
-        
-        pair_to_num_users = defaultdict(int)
-        for u in book_to_users[book_id]:
-            for b in user_to_books[u]:
-                if b == book_id:
-                    continue
-                pair_to_num_users[b] += 1
-
-        book_id_to_weighted_edges[book_id] = pair_to_num_users
+        book_id_to_weighted_edges[book_id] = get_coreview_counts(book_id, user_to_books, book_to_users, neighbor_cache)
     print('Saving weighted edges!')
     with open(fn, 'w') as f:
         json.dump(book_id_to_weighted_edges, f)
 
     return book_id_to_weighted_edges
 
+# an edge between two books is 1 / the number of users who reviewed both;
+# recorded with checkpoints so results under another weighting are never resumed
+CLOSEST_WEIGHTING = 'inverse-coreviewers'
+
+# neighbor_cache only applies to the dict representation; a BookGraph carries its own
+# queue picks the priority queue for a BookGraph: 'heapq' (PriorityQueue) or 'indexed' (IndexedPriorityQueue)
+# bounded, stats and profile are passed through to get_k_closest_books_in_graph
+def get_k_closest_books(source_book_id, user_to_books, book_to_users, k=10, neighbor_cache=None, queue='heapq', bounded=False, stats=None, profile=None):
+    graph = as_book_graph(user_to_books, book_to_users)
+    if graph is not None:
+        return get_k_closest_books_in_graph(source_book_id, graph, k=k, queue=queue, bounded=bounded, stats=stats, profile=profile)
+
+    if profile is not None:
+        start = time.perf_counter()
+        num_edges = 0
+    # priority queue containing (book_id, number of hops from source) prioritized by distance
+    pq = CountingPriorityQueue() if profile is not None else PriorityQueue()
+    pq.add_or_update_vertex((source_book_id, 0), 0)
+
+    closest_books = []
+    popped_books = set()
+    num_relaxations = 0
+
+    for i in range(k + 1):
+        #print('    {}/{}'.format(i, k))
+        try:
+            (current_node, current_hops), current_distance = pq.pop_vertex()
+        except KeyError as e:
+            print(e)
+            print('Only {} connected vertices.'.format(i))
+            break
+        # closest_books.append({'goodreads_book_id': current_node,
+        #                       'distance': current_distance,
+        #                       'num_hops': current_hops})
+        closest_books.append((current_node, current_distance, current_hops))
+        popped_books.add(current_node)
+        #print('    {}th closest: {} at {} away'.format(i, current_node, current_distance))
+
+        # now get all books reviewed by anyone who reviewed this book
+        # implicit to each pair is the current_node
+        #print('    Mapping neighbors to distances.')
+        pair_to_num_users = get_coreview_counts(current_node, user_to_books, book_to_users, neighbor_cache)
+        #print('    Number of neighbors: {}'.format(len(pair_to_num_users)))
+        if profile is not None:
+            num_edges += len(pair_to_num_users)
+
+        # update distances for all those books
+        #print('    Updating neighbors in priority queue.')
+        for book, num_users in pair_to_num_users.items():
+            # skip edges to books that were already visited
+            if book in popped_books:
+                continue
+            num_relaxations += 1
+            pq.add_or_update_vertex((book, current_hops + 1), current_distance + (1.0 / num_users))
+
+        #print()
+
+    if profile is not None:
+        seconds = time.perf_counter() - start
+        users = set()
+        for book, _, _ in closest_books:
+            users.update(book_to_users[book])
+        record_search_profile(profile, seconds, pq, len(closest_books), len(popped_books), num_edges, num_relaxations,
+                              len(users), sum(len(book_to_users[b]) for b, _, _ in closest_books))
+
+    # skip the first entry because it's just the source node
+    return closest_books[1:]
+
+PRIORITY_QUEUES = ('heapq', 'indexed')
+
+# fills in a profile dict for one search, see get_k_closest_books_in_graph
+# the queue counters are None for queues that do not keep them
+def record_search_profile(profile, seconds, pq, num_pops, num_popped_books, num_edges, num_relaxations, num_users, num_reviews):
+    counted = isinstance(pq, (CountingPriorityQueue, CountingIndexedPriorityQueue))
+    profile.update({'seconds': seconds,
+                    'pops': num_pops,
+                    'stale_pops': pq.stale_pops if counted else None,
+                    'pushes': pq.pushes if counted else None,
+                    'decrease_keys': pq.decrease_keys if counted else None,
+                    'peak_queue_size': pq.peak_size if counted else None,
+                    'edges_scanned': num_edges,
+                    'relaxations': num_relaxations,
+                    'books_touched': num_popped_books + len(pq) if counted else None,
+                    'users_touched': num_users,
+                    'reviews_scanned': num_reviews})
+
+# queue is one of PRIORITY_QUEUES, or a callable taking num_vertices and returning a queue
+# counting=True picks the counting version of a named queue, for profiling
+def make_priority_queue(queue, num_vertices, counting=False):
+    if callable(queue):
+        return queue(num_vertices)
+    if queue == 'heapq':
+        return CountingPriorityQueue() if counting else PriorityQueue()
+    if queue == 'indexed':
+        return CountingIndexedPriorityQueue(num_vertices) if counting else IndexedPriorityQueue(num_vertices)
+    raise ValueError('unknown priority queue {}, expected one of {}'.format(queue, PRIORITY_QUEUES))
+
+# an indexed queue holds arrays over every book, so instead of allocating one per
+# search each graph keeps the queues its searches are done with (one per worker
+# process, since a worker runs one search at a time) and hands one out again
+def take_search_queue(graph, queue, counting=False):
+    free = graph.search_queues.get((queue, counting))
+    if free:
+        return free.pop()
+    return make_priority_queue(queue, graph.num_books, counting=counting)
+
+def return_search_queue(graph, queue, counting, pq):
+    if queue == 'indexed':
+        pq.reset()
+        graph.search_queues.setdefault((queue, counting), []).append(pq)
+
+# same search over the compressed sparse graph, with dense integer vertices
+# each pop expands the book's weighted neighbors once, in O(degree) when a
+# co-review matrix is attached to the graph (otherwise from the review matrix)
+# bounded=True drops candidates farther than the best k + 1 tentative distances
+# seen so far and skips expanding the last settled book; results are identical
+# a landmark index attached to the graph turns bounded on and tightens the bound
+# before the first expansion, see landmark_index.py
+# stats, if given, is a dict that gets relaxation counts added to it
+# profile, if given, is a dict that gets filled in with what this one search did:
+# its time, pops, stale pops, pushes, decrease keys and peak size of the queue,
+# edges scanned and relaxed, books touched (settled or still queued), and the
+# distinct users and reviews behind the expanded books; without it the search
+# runs exactly as before, with plain queues and no counting
+def get_k_closest_books_in_graph(source_book_id, graph, k=10, queue='heapq', bounded=False, stats=None, profile=None):
+    if profile is not None:
+        start = time.perf_counter()
+        num_edges = 0
+    source = graph.book_index(source_book_id)
+    pq = take_search_queue(graph, queue, counting=profile is not None)
+    pq.add_or_update_vertex((source, 0), 0)
+    if graph.landmark_index is not None:
+        bounded = True
+    if bounded:
+        # k + 1 because the source itself is settled first
+        bound = KthDistanceBound(k + 1)
+        bound.update(source, 0)
+        if graph.landmark_index is not None:
+            # the true distances are at most these, so the bound starts out finite
+            for book, distance in graph.landmark_index.closest_upper_bounds(source, k):
+                bound.update(book, distance)
+
+    closest_books = []
+    popped_books = set()
+    num_relaxations = 0
+    num_avoided = 0
+
+    for i in range(k + 1):
+        try:
+            (current_node, current_hops), current_distance = pq.pop_vertex()
+        except KeyError as e:
+            print(e)
+            print('Only {} connected vertices.'.format(i))
+            break
+        closest_books.append((graph.book_id(current_node), current_distance, current_hops))
+        popped_books.add(current_node)
+
+        neighbors, num_users = graph.coreview_neighbors(current_node)
+        if bounded and i == k:
+            # the last book is settled, nothing it could relax would be returned
+            num_avoided += len(neighbors)
+            break
+        if profile is not None:
+            num_edges += len(neighbors)
+        # in float64, weighted counts are float32
+        distances = current_distance + np.divide(1.0, num_users, dtype=np.float64)
+        if bounded and bound.bound != float('inf'):
+            within_bound = distances <= bound.bound
+            num_avoided += len(distances) - int(within_bound.sum())
+            neighbors = neighbors[within_bound]
+            distances = distances[within_bound]
+        for book, distance in zip(neighbors.tolist(), distances.tolist()):
+            if book in popped_books:
+                continue
+            if bounded:
+                if distance > bound.bound:
+                    num_avoided += 1
+                    continue
+                bound.update(book, distance)
+            num_relaxations += 1
+            pq.add_or_update_vertex((book, current_hops + 1), distance)
+
+    if stats is not None:
+        stats['relaxations'] = stats.get('relaxations', 0) + num_relaxations
+        stats['relaxations_avoided'] = stats.get('relaxations_avoided', 0) + num_avoided
+    if profile is not None:
+        seconds = time.perf_counter() - start
+        expanded = [graph.book_index(b) for b, _, _ in closest_books]
+        if bounded and len(closest_books) == k + 1:
+            expanded.pop()
+        users = np.concatenate([graph.users_of(b) for b in expanded]) if expanded else np.zeros(0, dtype=np.int64)
+        record_search_profile(profile, seconds, pq, len(closest_books), len(popped_books), num_edges, num_relaxations,
+                              len(np.unique(users)), len(users))
+    return_search_queue(graph, queue, profile is not None, pq)
+
+    # skip the first entry because it's just the source node
+    return closest_books[1:]
+
+APPROXIMATE_METHODS = ('push', 'walks')
+
+# approximate closest books by personalized PageRank, see personalized_pagerank.py
+# returns a list of (book_id, score, hops) like the exact search, but ranked by
+# decreasing score (higher is closer) instead of increasing distance
+# method 'push' is deterministic and tuned by epsilon, 'walks' by num_walks
+def get_k_closest_books_approximate(source_book_id, graph, k=10, method='push', alpha=0.15, epsilon=1e-6, num_walks=10000, seed=0, stats=None):
+    source = graph.book_index(source_book_id)
+    if method == 'push':
+        scores, hops = forward_push(graph, source, alpha=alpha, epsilon=epsilon, stats=stats)
+    elif method == 'walks':
+        scores, hops = random_walks(graph, source, alpha=alpha, num_walks=num_walks, seed=seed, stats=stats)
+    else:
+        raise ValueError('unknown approximate method {}, expected one of {}'.format(method, APPROXIMATE_METHODS))
+    return [(graph.book_id(b), float(scores[b]), int(hops[b])) for b in top_k_scores(scores, source, k)]
+
+# get just one-hop paths with low edge weights
+# returns a list of (neighbor, num_reviewers)
+def get_k_neighbors_with_most_same_reviewers(source_book_id, user_to_books, book_to_users, k=10, neighbor_cache=None):
+    graph = as_book_graph(user_to_books, book_to_users)
+    if graph is not None:
+        neighbors, num_users = graph.coreview_neighbors(graph.book_index(source_book_id))
+        # stable sort so ties stay in book index order
+        order = np.argsort(-num_users, kind='stable')[:k]
+        return [(graph.book_id(b), n.item()) for b, n in zip(neighbors[order], num_users[order])]
+
+    pair_to_num_users = get_coreview_counts(source_book_id, user_to_books, book_to_users, neighbor_cache)
+    sorted_neighbors = sorted(list(pair_to_num_users.items()), key=operator.itemgetter(1), reverse=True)
+    k_truncated = min(k, len(sorted_neighbors))
+    return sorted_neighbors[:k_truncated]
+
+# batched get_k_neighbors_with_most_same_reviewers over a BookGraph
+# returns {book_id: [(neighbor, num_reviewers), ...]} for the given books
+def get_k_neighbors_with_most_same_reviewers_batch(source_book_ids, graph, k=10):
+    sources = [graph.book_index(b) for b in source_book_ids]
+    neighbors, counts = top_k_coreviewed(graph, sources, k)
+    book_id_to_neighbors = {}
+    for book_id, row_neighbors, row_counts in zip(source_book_ids, neighbors, counts):
+        found = row_neighbors >= 0
+        book_id_to_neighbors[book_id] = [(graph.book_id(b), n.item()) for b, n in zip(row_neighbors[found], row_counts[found])]
+    return book_id_to_neighbors
+
+# every scraped book record, straight from the scraper's books.jsonl store
+# or from an exported all_books.json
+def read_scraped_books(books_directory_path='all-books'):
+    store_fn = os.path.join(books_directory_path, 'books.jsonl')
+    if os.path.exists(store_fn):
+        return read_json_lines(store_fn)
+    with open(os.path.join(books_directory_path, 'all_books.json'), 'r') as f:
+        return json.load(f)
+
 # read in scraped top genres
-def read_scraped_top_genres():
+def read_scraped_top_genres(books_directory_path='all-books'):
     print('Loading genres.')
     book_id_to_top_genres = {}
-    with open('all-books/all_books.json', 'r') as f:
-        raw_json = json.load(f)
-        for d in raw_json:
-            book_id_to_top_genres[d['book_id']] =  d['genres']
+    raw_json = read_scraped_books(books_directory_path)
+    for d in raw_json:
+        book_id_to_top_genres[d['book_id']] =  d['genres']
     return book_id_to_top_genres
-
-
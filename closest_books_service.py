@@ -0,0 +1,255 @@
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import multiprocessing
+import os
+import threading
+import time
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+import requests
+
+from book_graph_utils import (APPROXIMATE_METHODS, LRUCache, get_k_closest_books, get_k_closest_books_approximate,
+                              get_k_neighbors_with_most_same_reviewers_batch, open_search_graph)
+
+# resident closest-books service: the graph is opened once per worker process
+# (memory-mapped, so the workers share the page cache), searches run in a process
+# pool, and answers are kept in an LRU cache keyed on (book_id, k, mode)
+#
+#   GET  /closest?book_id=<id>&k=<k>          one source, same lists as get_k_closest_books
+#   GET  /coreviewed?book_id=<id>&k=<k>       one source, most co-reviewed neighbors
+#   GET  /push?... and /walks?...             approximate rankings, see get_k_closest_books_approximate
+#   POST /query {"mode": ..., "k": ..., "book_ids": [...]}  a batch
+#   GET  /stats                               cache, latency and throughput counters
+#
+# answers are {"graph_version": ..., "results": {book_id: [...]}, "errors": {book_id: message}}
+# a book that is not in the graph is an error, not a failed request
+
+SERVICE_MODES = ('closest', 'coreviewed') + APPROXIMATE_METHODS
+
+
+# set in each worker by init_worker
+worker_graph = None
+worker_options = None
+
+def init_worker(hub_reduction, precomputed_edges, neighbor_cache_mb, num_landmarks, options):
+    global worker_graph, worker_options
+    worker_graph = open_search_graph(hub_reduction, precomputed_edges, neighbor_cache_mb, num_landmarks)
+    worker_options = options
+
+
+# answers a chunk of book ids in one mode, as ({book_id: result}, {book_id: error})
+def answer_chunk(task):
+    mode, k, book_ids = task
+    results = {}
+    errors = {}
+    known = [b for b in book_ids if worker_graph.has_reviews(b)]
+    for book_id in book_ids:
+        if book_id not in worker_graph.book_to_users:
+            errors[book_id] = 'not in the book graph'
+        elif not worker_graph.has_reviews(book_id):
+            errors[book_id] = 'no reviewers left in the book graph'
+    if mode == 'coreviewed':
+        if known:
+            results.update(get_k_neighbors_with_most_same_reviewers_batch(known, worker_graph, k=k))
+    elif mode == 'closest':
+        for book_id in known:
+            results[book_id] = get_k_closest_books(book_id, worker_graph, worker_graph, k=k,
+                                                   queue=worker_options['queue'], bounded=worker_options['bounded'])
+    else:
+        for book_id in known:
+            results[book_id] = get_k_closest_books_approximate(book_id, worker_graph, k=k, method=mode,
+                                                               epsilon=worker_options['epsilon'], num_walks=worker_options['num_walks'])
+    return results, errors
+
+
+# latency samples and answered-book counts, for /stats
+class ServiceStats:
+
+    def __init__(self, max_samples=10000):
+        self.lock = threading.Lock()
+        self.start = time.time()
+        self.requests = 0
+        self.books = 0
+        self.errors = 0
+        self.latencies = deque(maxlen=max_samples)           # seconds per request
+        self.recent = deque(maxlen=max_samples)              # (finish time, books answered)
+
+    def record(self, seconds, num_books, num_errors):
+        with self.lock:
+            self.requests += 1
+            self.books += num_books
+            self.errors += num_errors
+            self.latencies.append(seconds)
+            self.recent.append((time.time(), num_books))
+
+    def summary(self):
+        with self.lock:
+            now = time.time()
+            latencies = np.array(self.latencies, dtype=np.float64)
+            last_minute = sum(n for t, n in self.recent if now - t <= 60)
+            summary = {'uptime_seconds': now - self.start,
+                       'requests': self.requests,
+                       'books': self.books,
+                       'errors': self.errors,
+                       'books_per_second': self.books / max(now - self.start, 1e-9),
+                       'books_per_second_last_minute': last_minute / min(max(now - self.start, 1e-9), 60)}
+        if len(latencies):
+            summary['latency_seconds'] = {'mean': float(latencies.mean()), 'p50': float(np.percentile(latencies, 50)),
+                                          'p95': float(np.percentile(latencies, 95)), 'p99': float(np.percentile(latencies, 99)),
+                                          'max': float(latencies.max())}
+        return summary
+
+
+class ClosestBooksService:
+    'Process pool of graph searches behind an LRU cache of answers'
+
+    def __init__(self, graph_version, jobs, cache_entries, hub_reduction=None, precomputed_edges=False, neighbor_cache_mb=1024,
+                 num_landmarks=0, queue='heapq', bounded=False, epsilon=1e-6, num_walks=10000, chunk_size=8):
+        self.graph_version = graph_version
+        self.jobs = jobs
+        self.chunk_size = chunk_size
+        self.cache = LRUCache(max_entries=cache_entries)
+        self.cache_lock = threading.Lock()
+        self.stats = ServiceStats()
+        options = {'queue': queue, 'bounded': bounded, 'epsilon': epsilon, 'num_walks': num_walks}
+        self.pool = multiprocessing.Pool(jobs, initializer=init_worker, initargs=(hub_reduction, precomputed_edges, neighbor_cache_mb, num_landmarks, options))
+
+    def query(self, mode, book_ids, k):
+        'Answer a batch, as ({book_id: result}, {book_id: error}), raising ValueError for a bad mode, book_ids or k'
+        if mode not in SERVICE_MODES:
+            raise ValueError('unknown mode {}, expected one of {}'.format(mode, SERVICE_MODES))
+        # a string would be answered character by character
+        if not isinstance(book_ids, (list, tuple)) or not all(isinstance(b, (str, int)) and not isinstance(b, bool) for b in book_ids):
+            raise ValueError('book_ids must be a list of book ids')
+        if not isinstance(k, int) or isinstance(k, bool) or k < 1:
+            raise ValueError('k must be an integer of at least 1')
+        start = time.perf_counter()
+        book_ids = [str(b) for b in book_ids]
+        results = {}
+        with self.cache_lock:
+            for book_id in book_ids:
+                cached = self.cache.get((book_id, k, mode))
+                if cached is not None:
+                    results[book_id] = cached
+        # a book asked for twice in one batch is searched once
+        missing = list(dict.fromkeys(b for b in book_ids if b not in results))
+        errors = {}
+        if missing:
+            if mode == 'coreviewed':
+                # one batched sparse product is cheaper than splitting it up
+                chunks = [missing]
+            else:
+                chunks = [missing[i:i + self.chunk_size] for i in range(0, len(missing), self.chunk_size)]
+            for chunk_results, chunk_errors in self.pool.imap_unordered(answer_chunk, [(mode, k, chunk) for chunk in chunks]):
+                results.update(chunk_results)
+                errors.update(chunk_errors)
+            with self.cache_lock:
+                for book_id in missing:
+                    if book_id in results:
+                        self.cache.put((book_id, k, mode), results[book_id])
+        self.stats.record(time.perf_counter() - start, len(book_ids), len(errors))
+        return {b: results[b] for b in book_ids if b in results}, errors
+
+    def summary(self):
+        summary = {'graph_version': self.graph_version, 'jobs': self.jobs}
+        summary.update(self.stats.summary())
+        with self.cache_lock:
+            summary['cache'] = self.cache.stats()
+        return summary
+
+    def close(self):
+        self.pool.terminate()
+        self.pool.join()
+
+
+def make_handler(service, default_k):
+
+    class ClosestBooksHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            params = parse_qs(url.query)
+            if url.path == '/stats':
+                self.send_json(200, service.summary())
+                return
+            mode = url.path.strip('/')
+            if mode not in SERVICE_MODES or 'book_id' not in params:
+                self.send_json(404, {'error': 'expected /stats or /<mode>?book_id=<id>&k=<k> with mode one of {}'.format(SERVICE_MODES)})
+                return
+            try:
+                k = int(params.get('k', [default_k])[0])
+            except ValueError:
+                self.send_json(400, {'error': 'k must be an integer'})
+                return
+            self.answer(mode, params['book_id'], k)
+
+        def do_POST(self):
+            if urlparse(self.path).path != '/query':
+                self.send_json(404, {'error': 'expected POST /query'})
+                return
+            try:
+                length = int(self.headers.get('Content-Length', 0))
+                body = json.loads(self.rfile.read(length))
+                mode = body.get('mode', 'closest')
+                book_ids = body['book_ids']
+                k = body.get('k', default_k)
+            except (ValueError, KeyError, TypeError, AttributeError):
+                self.send_json(400, {'error': 'expected {"mode": ..., "k": ..., "book_ids": [...]}'})
+                return
+            self.answer(mode, book_ids, k)
+
+        def answer(self, mode, book_ids, k):
+            try:
+                results, errors = service.query(mode, book_ids, k)
+            except ValueError as e:
+                self.send_json(400, {'error': str(e)})
+                return
+            self.send_json(200, {'graph_version': service.graph_version, 'mode': mode, 'k': k, 'results': results, 'errors': errors})
+
+        def send_json(self, status, obj):
+            body = json.dumps(obj).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        # one line per request is too chatty for batch clients
+        def log_message(self, format, *args):
+            pass
+
+    return ClosestBooksHandler
+
+
+def make_server(service, host='127.0.0.1', port=8765, default_k=100):
+    return ThreadingHTTPServer((host, port), make_handler(service, default_k))
+
+
+# client for a running service, e.g. ClosestBooksClient('http://127.0.0.1:8765')
+# results come back in the same form as the local functions: closest lists of
+# (book_id, distance, hops) tuples and coreviewed lists of (book_id, count) tuples
+class ClosestBooksClient:
+
+    def __init__(self, url, timeout=None):
+        self.url = url.rstrip('/')
+        self.timeout = timeout
+        self.session = requests.Session()
+
+    def query(self, mode, book_ids, k):
+        'Returns ({book_id: result}, {book_id: error}) for a batch'
+        response = self.session.post(self.url + '/query', json={'mode': mode, 'k': k, 'book_ids': list(book_ids)}, timeout=self.timeout)
+        response.raise_for_status()
+        answer = response.json()
+        results = {b: [tuple(entry) for entry in result] for b, result in answer['results'].items()}
+        return results, answer['errors']
+
+    def stats(self):
+        response = self.session.get(self.url + '/stats', timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()
+
+    def graph_version(self):
+        return self.stats()['graph_version']
@@ -0,0 +1,176 @@
+import glob
+import hashlib
+import json
+import os
+import numpy as np
+
+from array_cache import read_array_cache, write_array_cache
+from result_store import JsonLinesStore, write_json_atomic
+
+# columnar storage for closest-books results, in the array cache layout
+# (.npy files plus header.json, memory-mapped on read)
+#   book_ids    int32 (int64 if an id needs it) sorted goodreads ids of every book in the results
+#   sources     int32  n, index into book_ids of each source book
+#   neighbors   int32  n x k, index into book_ids of each closest book, -1 past the end of a list
+#   distances   float32 n x k, nan past the end of a list
+#   hops        uint8  n x k
+# a source's list keeps the order of the search
+
+CLOSEST_SUFFIX = '-closest-books-network-distance-weighted'
+# approximate rankings (get-all-closest-books.py --approximate) keep personalized
+# PageRank scores in the distances column, higher is closer, so they are saved
+# apart as <genre>-closest-books-approximate-<method>
+APPROXIMATE_SUFFIX = '-closest-books-approximate-'
+CHECKPOINT_DIRECTORY = 'checkpoints'
+
+
+class ClosestResults:
+
+    ARRAY_NAMES = ('book_ids', 'sources', 'neighbors', 'distances', 'hops')
+
+    def __init__(self, book_ids, sources, neighbors, distances, hops):
+        self.book_ids = book_ids
+        self.sources = sources
+        self.neighbors = neighbors
+        self.distances = distances
+        self.hops = hops
+
+    @classmethod
+    def from_dict(cls, book_id_to_closest, k=None):
+        'Pack {source book id: [(book id, distance, hops), ...]} as written by the search scripts'
+        if k is None:
+            k = max((len(closest) for closest in book_id_to_closest.values()), default=0)
+        all_ids = [int(b) for b in book_id_to_closest]
+        all_ids += [int(b) for closest in book_id_to_closest.values() for b, _, _ in closest[:k]]
+        book_ids = np.unique(np.array(all_ids, dtype=np.int64))
+        # goodreads ids fit in 32 bits, which halves the id table
+        if len(book_ids) == 0 or book_ids[-1] <= np.iinfo(np.int32).max:
+            book_ids = book_ids.astype(np.int32)
+        n = len(book_id_to_closest)
+        sources = np.searchsorted(book_ids, np.array([int(b) for b in book_id_to_closest], dtype=book_ids.dtype)).astype(np.int32)
+        neighbors = np.full((n, k), -1, dtype=np.int32)
+        distances = np.full((n, k), np.nan, dtype=np.float32)
+        hops = np.zeros((n, k), dtype=np.uint8)
+        for i, closest in enumerate(book_id_to_closest.values()):
+            closest = closest[:k]
+            if not closest:
+                continue
+            ids, row_distances, row_hops = zip(*closest)
+            neighbors[i, :len(closest)] = np.searchsorted(book_ids, np.array([int(b) for b in ids], dtype=book_ids.dtype))
+            distances[i, :len(closest)] = row_distances
+            hops[i, :len(closest)] = row_hops
+        return cls(book_ids, sources, neighbors, distances, hops)
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        return cls(*[arrays[name] for name in cls.ARRAY_NAMES])
+
+    def to_arrays(self):
+        return {name: getattr(self, name) for name in self.ARRAY_NAMES}
+
+    def __len__(self):
+        return len(self.sources)
+
+    @property
+    def k(self):
+        return self.neighbors.shape[1]
+
+    def source_ids(self):
+        return [str(b) for b in self.book_ids[self.sources]]
+
+    def neighbor_ids(self, i, k=None):
+        'Goodreads ids (strings) of the first k closest books of the i-th source'
+        row = self.neighbors[i, :k]
+        return [str(b) for b in self.book_ids[row[row >= 0]]]
+
+    def sources_touching(self, book_ids):
+        'Ids of the sources that are, or have in their results, any of book_ids'
+        in_set = np.isin(self.book_ids, np.array([int(b) for b in book_ids], dtype=np.int64))
+        touched = in_set[self.sources] | ((self.neighbors >= 0) & in_set[self.neighbors]).any(axis=1)
+        return [str(b) for b in self.book_ids[self.sources[touched]]]
+
+    def to_dict(self):
+        'The {source book id: [[book id, distance, hops], ...]} json layout'
+        book_id_to_closest = {}
+        for i, source in enumerate(self.source_ids()):
+            found = self.neighbors[i] >= 0
+            book_id_to_closest[source] = [[str(b), float(d), int(h)] for b, d, h in zip(
+                self.book_ids[self.neighbors[i][found]], self.distances[i][found], self.hops[i][found])]
+        return book_id_to_closest
+
+    def export_json(self, fn):
+        write_json_atomic(fn, self.to_dict(), indent=4)
+
+
+# approximate is None for exact distances, or the method of an approximate ranking
+def closest_results_path(output_directory_path, genre, approximate=None):
+    suffix = CLOSEST_SUFFIX if approximate is None else APPROXIMATE_SUFFIX + approximate
+    return os.path.join(output_directory_path, genre + suffix)
+
+
+def write_closest_results(output_directory_path, genre, results, extra=None, approximate=None):
+    extra = dict(extra or {}, approximate=approximate)
+    write_array_cache(closest_results_path(output_directory_path, genre, approximate), results.to_arrays(), extra=extra)
+
+
+# memory-mapped results for a genre, or the json written by older runs
+# raises FileNotFoundError if there are neither, and ValueError if the header says
+# they are of another kind (approximate scores where distances are expected, or the reverse)
+def load_closest_results(output_directory_path, genre, mmap_mode='r', approximate=None):
+    path = closest_results_path(output_directory_path, genre, approximate)
+    arrays, header = read_array_cache(path, mmap_mode=mmap_mode)
+    if arrays is not None:
+        saved = header['extra'].get('approximate')
+        if saved != approximate:
+            raise ValueError('{} holds {} results, expected {}'.format(
+                path, 'approximate ({})'.format(saved) if saved else 'exact', 'approximate ({})'.format(approximate) if approximate else 'exact'))
+        return ClosestResults.from_arrays(arrays)
+    with open(path + '.json', 'r') as f:
+        return ClosestResults.from_dict(json.load(f))
+
+
+# genres with saved closest-books results in either format
+def closest_result_genres(output_directory_path):
+    genres = set()
+    for path in glob.glob(os.path.join(output_directory_path, '*' + CLOSEST_SUFFIX)) + glob.glob(os.path.join(output_directory_path, '*' + CLOSEST_SUFFIX + '.json')):
+        name = os.path.basename(path)
+        genres.add(name[:name.index(CLOSEST_SUFFIX)])
+    return sorted(genres)
+
+
+# streaming output of a closest-books run, so an interrupted run can resume:
+# one json line {"book_id": ..., "closest": [[book id, distance, hops], ...]}
+# per finished source in <output_directory_path>/checkpoints/<name>-<key>.jsonl,
+# where key hashes params (graph version, k, weighting, ...) so results for a
+# different graph or settings are never picked up; params are also written
+# next to it as <name>-<key>.params.json
+def closest_checkpoint_path(output_directory_path, name, params):
+    key = hashlib.sha1(json.dumps(params, sort_keys=True).encode()).hexdigest()[:16]
+    return os.path.join(output_directory_path, CHECKPOINT_DIRECTORY, '{}-{}.jsonl'.format(name, key))
+
+
+# returns a JsonLinesStore keyed on book_id, with the sources already finished
+# by an earlier run with the same params; restart=True discards those
+def open_closest_checkpoint(output_directory_path, name, params, restart=False):
+    path = closest_checkpoint_path(output_directory_path, name, params)
+    if restart and os.path.exists(path):
+        os.remove(path)
+    store = JsonLinesStore(path, 'book_id')
+    params_fn = os.path.splitext(path)[0] + '.params.json'
+    if not os.path.exists(params_fn):
+        write_json_atomic(params_fn, params, indent=4)
+    return store
+
+
+# {source book id: [(book id, distance, hops), ...]} of every checkpointed source
+def read_closest_checkpoint(store):
+    return {record['book_id']: [tuple(c) for c in record['closest']] for record in store.records()}
+
+
+# once the results are written out, the checkpoint is not needed any more
+def remove_closest_checkpoint(store):
+    store.close()
+    os.remove(store.path)
+    params_fn = os.path.splitext(store.path)[0] + '.params.json'
+    if os.path.exists(params_fn):
+        os.remove(params_fn)
@@ -0,0 +1,85 @@
+import json
+import argparse
+import random
+import statistics
+
+from book_graph_utils import *
+
+# recall of the approximate closest-books rankings against the exact search,
+# and how much faster they are, on sampled books of every genre
+#   python compare-approximate-closest-books.py --sources_per_genre 20 --output_path approximate-recall.json
+# recall@k is the fraction of the exact k closest books that the approximate top k also finds
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--k', type=int, default=100)
+parser.add_argument('--sources_per_genre', type=int, default=20)
+parser.add_argument('--epsilons', type=float, nargs='*', default=[1e-4, 1e-5, 1e-6])
+parser.add_argument('--walk_counts', type=int, nargs='*', default=[1000, 10000, 100000])
+parser.add_argument('--alpha', type=float, default=0.15)
+parser.add_argument('--hub_reduction', type=str, default=None, help='compare on a reduced graph, e.g. cap-1000 (see hub_users.py)')
+parser.add_argument('--precomputed_edges', action='store_true', help='run the exact search over the cached co-review matrix')
+parser.add_argument('--books_dict_path', type=str, default='librarything-books/genre_matched_books_dict.json')
+parser.add_argument('--output_path', type=str, default=None, help='also write the report as json here')
+parser.add_argument('--seed', type=int, default=0)
+
+
+def main():
+    args = parser.parse_args()
+    graph = open_book_graph(args.hub_reduction)
+    if args.precomputed_edges:
+        graph.attach_coreview_matrix(get_coreview_matrix(graph))
+    with open(args.books_dict_path, 'r') as f:
+        genre_to_book_ids = json.load(f)
+
+    rng = random.Random(args.seed)
+    genre_to_sources = {}
+    for genre, book_ids in genre_to_book_ids.items():
+        book_ids = [b for b in book_ids if graph.has_reviews(b)]
+        genre_to_sources[genre] = rng.sample(book_ids, min(args.sources_per_genre, len(book_ids)))
+
+    configs = [('push', {'epsilon': epsilon}) for epsilon in args.epsilons]
+    configs += [('walks', {'num_walks': num_walks}) for num_walks in args.walk_counts]
+
+    report = {'k': args.k, 'alpha': args.alpha, 'graph_version': graph.version, 'genres': {}, 'overall': {}}
+    all_seconds = defaultdict(list)
+    all_recalls = defaultdict(list)
+    for genre, sources in genre_to_sources.items():
+        print('{}: {} sources'.format(genre, len(sources)))
+        exact = {}
+        for book_id in sources:
+            start = time.perf_counter()
+            exact[book_id] = [b for b, _, _ in get_k_closest_books_in_graph(book_id, graph, k=args.k)]
+            all_seconds['exact'].append(time.perf_counter() - start)
+        genre_report = {'exact_seconds_per_source': statistics.mean(all_seconds['exact'][-len(sources):]) if sources else None}
+        for method, params in configs:
+            name = '{} {}'.format(method, ' '.join('{}={}'.format(key, value) for key, value in params.items()))
+            seconds = []
+            recalls = []
+            for book_id in sources:
+                start = time.perf_counter()
+                approximate = get_k_closest_books_approximate(book_id, graph, k=args.k, method=method, alpha=args.alpha, **params)
+                seconds.append(time.perf_counter() - start)
+                found = set(b for b, _, _ in approximate)
+                recalls.append(len(found.intersection(exact[book_id])) / max(len(exact[book_id]), 1))
+            all_seconds[name].extend(seconds)
+            all_recalls[name].extend(recalls)
+            if sources:
+                genre_report[name] = {'recall': statistics.mean(recalls), 'seconds_per_source': statistics.mean(seconds)}
+                print('    {}: recall@{} {:.3f}, {:.3f}s per source'.format(name, args.k, genre_report[name]['recall'], genre_report[name]['seconds_per_source']))
+        report['genres'][genre] = genre_report
+
+    exact_seconds = statistics.mean(all_seconds['exact'])
+    report['overall']['exact_seconds_per_source'] = exact_seconds
+    print('Overall, exact search takes {:.3f}s per source:'.format(exact_seconds))
+    for name in all_recalls:
+        seconds = statistics.mean(all_seconds[name])
+        report['overall'][name] = {'recall': statistics.mean(all_recalls[name]), 'seconds_per_source': seconds, 'speedup': exact_seconds / seconds}
+        print('    {}: recall@{} {:.3f}, {:.1f}x faster'.format(name, args.k, report['overall'][name]['recall'], exact_seconds / seconds))
+
+    if args.output_path:
+        with open(args.output_path, 'w') as f:
+            json.dump(report, f, indent=4)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,214 @@
+from collections.abc import Mapping
+import numpy as np
+import scipy.sparse as sp
+
+import hyperloglog
+
+
+# weighted co-reviewer counts are summed in float64 and stored as float32, by every path
+WEIGHTED_COUNT_DTYPE = np.float32
+
+
+# user x book review matrix (CSR) and its transpose book x user (CSR) sharing the graph's index arrays
+# with graph.user_weights, book_by_user holds each reviewer's weight, so products count weighted co-reviewers
+def review_matrices(graph):
+    ones = np.ones(graph.num_reviews, dtype=np.int32)
+    user_by_book = sp.csr_matrix((ones, graph.user_indices, graph.user_indptr),
+                                 shape=(graph.num_users, graph.num_books))
+    weights = ones if graph.user_weights is None else np.asarray(graph.user_weights)[graph.book_indices]
+    book_by_user = sp.csr_matrix((weights, graph.book_indices, graph.book_indptr),
+                                 shape=(graph.num_books, graph.num_users))
+    return user_by_book, book_by_user
+
+
+# number of multiply-adds the product spends on each book's row
+def coreview_work_per_book(graph):
+    cumulative = np.zeros(graph.num_reviews + 1, dtype=np.int64)
+    np.cumsum(graph.user_degrees()[graph.book_indices], out=cumulative[1:])
+    return cumulative[graph.book_indptr[1:]] - cumulative[graph.book_indptr[:-1]]
+
+
+# split book rows into consecutive blocks that each do at most max_block_work products
+# a single book heavier than the limit gets a block of its own
+def coreview_row_blocks(graph, max_block_work):
+    cumulative_work = np.cumsum(coreview_work_per_book(graph))
+    blocks = []
+    start = 0
+    while start < graph.num_books:
+        done = cumulative_work[start - 1] if start > 0 else 0
+        end = int(np.searchsorted(cumulative_work, done + max_block_work, side='right'))
+        end = max(end, start + 1)
+        blocks.append((start, end))
+        start = end
+    return blocks
+
+
+# keep the top_n largest entries in each row of a csr matrix (ties go to the lower column)
+def keep_top_n_per_row(m, top_n):
+    row_lengths = np.diff(m.indptr)
+    if row_lengths.max(initial=0) <= top_n:
+        return m
+    rows = np.repeat(np.arange(m.shape[0]), row_lengths)
+    order = np.lexsort((m.indices, -m.data, rows))
+    rank_in_row = np.arange(len(order)) - np.repeat(m.indptr[:-1], row_lengths)
+    kept = np.sort(order[rank_in_row < top_n])
+    indptr = np.zeros(m.shape[0] + 1, dtype=m.indptr.dtype)
+    np.cumsum(np.minimum(row_lengths, top_n), out=indptr[1:])
+    return sp.csr_matrix((m.data[kept], m.indices[kept], indptr), shape=m.shape)
+
+
+# book x book co-review counts (B^T B without the diagonal), computed in row blocks
+# min_count drops pairs with fewer co-reviewers, top_n keeps only each row's heaviest edges
+# returns a csr matrix with int32 counts (float32 weighted counts with graph.user_weights)
+def compute_coreview_matrix(graph, min_count=1, top_n=None, max_block_work=50000000):
+    user_by_book, book_by_user = review_matrices(graph)
+    blocks = coreview_row_blocks(graph, max_block_work)
+    indptr_chunks = [np.zeros(1, dtype=np.int64)]
+    indices_chunks = []
+    data_chunks = []
+    nnz = 0
+    dtype = np.int32 if graph.user_weights is None else WEIGHTED_COUNT_DTYPE
+    for i, (start, end) in enumerate(blocks):
+        if i % 10 == 0:
+            print('    co-review block {}/{} (books {}-{})'.format(i, len(blocks), start, end))
+        block = (book_by_user[start:end] @ user_by_book).tocsr()
+        # drop each book's edge to itself and pairs under the threshold
+        rows = np.repeat(np.arange(start, end), np.diff(block.indptr))
+        block.data[block.indices == rows] = 0
+        if min_count > 1:
+            block.data[block.data < min_count] = 0
+        block.eliminate_zeros()
+        block.sort_indices()
+        if top_n is not None:
+            block = keep_top_n_per_row(block, top_n)
+        indptr_chunks.append(block.indptr[1:].astype(np.int64) + nnz)
+        indices_chunks.append(block.indices.astype(np.int32))
+        data_chunks.append(block.data.astype(dtype))
+        nnz += block.nnz
+    indptr = np.concatenate(indptr_chunks)
+    indices = np.concatenate(indices_chunks) if indices_chunks else np.zeros(0, dtype=np.int32)
+    data = np.concatenate(data_chunks) if data_chunks else np.zeros(0, dtype=dtype)
+    return sp.csr_matrix((data, indices, indptr), shape=(graph.num_books, graph.num_books))
+
+
+# number of distinct co-reviewed books for every book, without building neighbor sets
+# each block of rows of B^T B is only used for its row lengths
+def coreview_degrees(graph, max_block_work=50000000):
+    if graph.coreview_matrix is not None:
+        return np.diff(graph.coreview_matrix.indptr).astype(np.int64)
+    user_by_book, book_by_user = review_matrices(graph)
+    degrees = np.zeros(graph.num_books, dtype=np.int64)
+    blocks = coreview_row_blocks(graph, max_block_work)
+    for i, (start, end) in enumerate(blocks):
+        if i % 10 == 0:
+            print('    degree block {}/{} (books {}-{})'.format(i, len(blocks), start, end))
+        block = book_by_user[start:end] @ user_by_book
+        # every book with a reviewer is its own co-reviewed book once
+        degrees[start:end] = np.maximum(np.diff(block.indptr) - 1, 0)
+    return degrees
+
+
+# approximate degrees from HyperLogLog sketches
+# each user gets a sketch of the books they reviewed, and a book's sketch is the
+# register-wise max over its reviewers' sketches; relative_error sets the precision
+# memory is about num_users * 2^p bytes for the user sketches
+def approximate_coreview_degrees(graph, relative_error=0.05, max_block_reviews=1000000):
+    p = hyperloglog.precision_for_error(relative_error)
+    print('    HyperLogLog with {} registers per sketch (standard error {:.3f})'.format(1 << p, hyperloglog.standard_error(p)))
+    review_users = np.repeat(np.arange(graph.num_users), graph.user_degrees())
+    user_sketches = hyperloglog.build_sketches(review_users, graph.user_indices, graph.num_users, p)
+    del review_users
+
+    degrees = np.zeros(graph.num_books, dtype=np.int64)
+    start = 0
+    while start < graph.num_books:
+        # books whose reviews fit in the block (at least one book)
+        end = int(np.searchsorted(graph.book_indptr, graph.book_indptr[start] + max_block_reviews, side='right')) - 1
+        end = min(max(end, start + 1), graph.num_books)
+        first, last = graph.book_indptr[start], graph.book_indptr[end]
+        # reduceat needs non-empty segments, books with no reviewers keep degree 0
+        reviewed = np.flatnonzero(np.diff(graph.book_indptr[start:end + 1]) > 0)
+        if len(reviewed):
+            reviewer_sketches = user_sketches[graph.book_indices[first:last]]
+            book_sketches = np.maximum.reduceat(reviewer_sketches, graph.book_indptr[start + reviewed] - first, axis=0)
+            # the book itself is always in the union
+            degrees[start + reviewed] = np.maximum(np.rint(hyperloglog.estimate(book_sketches)) - 1, 0)
+        start = end
+    return degrees
+
+
+# indices of the k largest values of one sparse row, largest first, ties to the lower column
+# (the same order as a stable sort on decreasing count)
+def top_k_of_row(columns, values, k):
+    if len(values) > k:
+        kth_value = values[np.argpartition(-values, k - 1)[k - 1]]
+        above = np.flatnonzero(values > kth_value)
+        ties = np.flatnonzero(values == kth_value)[:k - len(above)]
+        selected = np.concatenate([above, ties])
+    else:
+        selected = np.arange(len(values))
+    return selected[np.lexsort((columns[selected], -values[selected]))]
+
+
+# one-hop co-review ranking for many sources at once
+# co-review counts of a batch of source books are a sparse row gather of
+# B^T times B (or rows of the precomputed co-review matrix)
+# returns (neighbor book indices, counts), each len(sources) x k, padded with -1 / 0
+def top_k_coreviewed(graph, sources, k, batch_size=1000):
+    sources = np.asarray(sources, dtype=np.int64)
+    neighbors = np.full((len(sources), k), -1, dtype=np.int64)
+    counts = np.zeros((len(sources), k), dtype=np.int64 if graph.user_weights is None else WEIGHTED_COUNT_DTYPE)
+    if graph.coreview_matrix is None:
+        user_by_book, book_by_user = review_matrices(graph)
+    for start in range(0, len(sources), batch_size):
+        batch = sources[start:start + batch_size]
+        if graph.coreview_matrix is not None:
+            rows = graph.coreview_matrix[batch]
+        else:
+            rows = (book_by_user[batch] @ user_by_book).tocsr()
+            rows.sort_indices()
+            if graph.user_weights is not None:
+                rows.data = rows.data.astype(WEIGHTED_COUNT_DTYPE)
+        for i, source in enumerate(batch):
+            columns = rows.indices[rows.indptr[i]:rows.indptr[i + 1]]
+            values = rows.data[rows.indptr[i]:rows.indptr[i + 1]]
+            not_self = columns != source
+            columns = columns[not_self]
+            values = values[not_self]
+            top = top_k_of_row(columns, values, k)
+            neighbors[start + i, :len(top)] = columns[top]
+            counts[start + i, :len(top)] = values[top]
+    return neighbors, counts
+
+
+def coreview_matrix_to_arrays(m):
+    return {'indptr': m.indptr, 'indices': m.indices, 'data': m.data}
+
+
+def coreview_matrix_from_arrays(arrays):
+    num_books = len(arrays['indptr']) - 1
+    return sp.csr_matrix((arrays['data'], arrays['indices'], arrays['indptr']),
+                         shape=(num_books, num_books), copy=False)
+
+
+# dict-of-dicts view of the co-review matrix, keyed by goodreads id strings
+# so it can stand in for the old book_id_to_weighted_edges json
+class WeightedEdgesView(Mapping):
+
+    def __init__(self, graph, matrix):
+        self.graph = graph
+        self.matrix = matrix
+
+    def __getitem__(self, book_id):
+        i = self.graph.book_index(book_id)
+        start, end = self.matrix.indptr[i], self.matrix.indptr[i + 1]
+        return {self.graph.book_id(b): w for b, w in zip(self.matrix.indices[start:end], self.matrix.data[start:end].tolist())}
+
+    def __contains__(self, book_id):
+        return book_id in self.graph.book_to_users
+
+    def __iter__(self):
+        return iter(self.graph.book_to_users)
+
+    def __len__(self):
+        return self.graph.num_books
@@ -0,0 +1,26 @@
+import argparse
+
+from synthetic_data import write_synthetic_book_pages
+
+# writes goodreads-like book pages, <book_id>.html, for benchmark-html-parsing.py
+# and serve-saved-book-pages.py, e.g.
+#   python generate-synthetic-book-pages.py --num_pages 40 --output_directory_path benchmark-data/book-pages
+# the book ids are also written to <output_directory_path>/book-ids.txt, for
+# get_book_genres.py --book_ids_path
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--num_pages', type=int, default=40)
+parser.add_argument('--page_kb', type=int, default=25, help='approximate size of each page')
+parser.add_argument('--seed', type=int, default=0)
+parser.add_argument('--output_directory_path', type=str, default='benchmark-data/book-pages')
+
+
+def main():
+    args = parser.parse_args()
+    book_ids = write_synthetic_book_pages(args.output_directory_path, args.num_pages, page_kb=args.page_kb, seed=args.seed)
+    with open(args.output_directory_path + '/book-ids.txt', 'w') as f:
+        f.write('\n'.join(book_ids) + '\n')
+
+
+if __name__ == '__main__':
+    main()
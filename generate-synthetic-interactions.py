@@ -0,0 +1,28 @@
+import argparse
+
+from synthetic_data import write_synthetic_interactions
+
+# writes a goodreads-like goodreads_interactions.csv and book_id_map.csv, e.g.
+#   python generate-synthetic-interactions.py --num_rows 10000000 --output_directory_path synthetic/data
+# user and book counts default to the proportions of the real dataset
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--num_rows', type=int, default=1000000)
+parser.add_argument('--num_users', type=int, default=None)
+parser.add_argument('--num_books', type=int, default=None)
+parser.add_argument('--user_exponent', type=float, default=0.8, help='user i is picked with weight (i + 1) ** -user_exponent')
+parser.add_argument('--book_exponent', type=float, default=1.0, help='book i is picked with weight (i + 1) ** -book_exponent')
+parser.add_argument('--review_fraction', type=float, default=0.4)
+parser.add_argument('--seed', type=int, default=0)
+parser.add_argument('--output_directory_path', type=str, default='data')
+
+
+def main():
+    args = parser.parse_args()
+    write_synthetic_interactions(args.output_directory_path, args.num_rows, num_users=args.num_users, num_books=args.num_books,
+                                 user_exponent=args.user_exponent, book_exponent=args.book_exponent,
+                                 review_fraction=args.review_fraction, seed=args.seed)
+
+
+if __name__ == '__main__':
+    main()
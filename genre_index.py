@@ -0,0 +1,103 @@
+import numpy as np
+
+# per-book genre membership over a fixed genre vocabulary, so scoring neighbor
+# lists is a numpy gather instead of substring scans over the scraped genre strings
+#
+# a book is in genre g at cutoff c if g is a substring of one of its first c
+# scraped genres (the test process-all-results.py has always used, with c = 5)
+# the index stores the first rank at which each genre matches, so any cutoff
+# up to max_rank turns into a bitmask per book without rescanning the strings
+
+
+# rank value meaning the genre is not in the book's first max_rank genres
+NOT_MATCHED = np.iinfo(np.uint8).max
+
+
+class GenreIndex:
+
+    def __init__(self, book_ids, first_ranks, genres):
+        'first_ranks[i, g] is the rank of the first of book_ids[i] genres containing genres[g]'
+        if len(genres) > 64:
+            raise ValueError('at most 64 genres fit in a bitmask, got {}'.format(len(genres)))
+        self.genres = list(genres)
+        self.book_ids = list(book_ids)
+        self.book_id_to_row = {book_id: i for i, book_id in enumerate(self.book_ids)}
+        # one extra all-unmatched row that padding (-1) in a row matrix gathers from
+        self.first_ranks = np.vstack([first_ranks, np.full((1, len(self.genres)), NOT_MATCHED, dtype=np.uint8)])
+        self.mask_cache = {}
+
+    @classmethod
+    def from_top_genres(cls, book_id_to_top_genres, genres, max_rank=10):
+        'Build the index from read_scraped_top_genres output'
+        book_ids = list(book_id_to_top_genres.keys())
+        first_ranks = np.full((len(book_ids), len(genres)), NOT_MATCHED, dtype=np.uint8)
+        for i, book_id in enumerate(book_ids):
+            # walk backwards so the lowest matching rank is the one left standing
+            top_genres = book_id_to_top_genres[book_id][:max_rank]
+            for rank in reversed(range(len(top_genres))):
+                for g, genre in enumerate(genres):
+                    if genre in top_genres[rank]:
+                        first_ranks[i, g] = rank
+        return cls(book_ids, first_ranks, genres)
+
+    def __contains__(self, book_id):
+        return book_id in self.book_id_to_row
+
+    def __len__(self):
+        return len(self.book_ids)
+
+    def genre_bit(self, genre):
+        return np.uint64(1) << np.uint64(self.genres.index(genre))
+
+    def masks(self, cutoff=5):
+        'Bitmask of the genres in the first cutoff genres of each book (plus the padding row)'
+        if cutoff not in self.mask_cache:
+            bits = np.uint64(1) << np.arange(len(self.genres), dtype=np.uint64)
+            matched = self.first_ranks < cutoff
+            self.mask_cache[cutoff] = np.bitwise_or.reduce(np.where(matched, bits, np.uint64(0)), axis=1)
+        return self.mask_cache[cutoff]
+
+    def rows(self, book_ids):
+        'Index rows for book ids. Raise KeyError for a book without scraped genres.'
+        return np.array([self.book_id_to_row[book_id] for book_id in book_ids], dtype=np.int64)
+
+    def row_matrix(self, neighbor_lists, k):
+        'n x k matrix of the rows of the first k ids of each list, padded with -1'
+        matrix = np.full((len(neighbor_lists), k), -1, dtype=np.int64)
+        for i, book_ids in enumerate(neighbor_lists):
+            book_ids = book_ids[:k]
+            matrix[i, :len(book_ids)] = self.rows(book_ids)
+        return matrix
+
+    def table_row_matrix(self, table_book_ids, table_indices, k):
+        'Like row_matrix, for lists stored as indices into a table of integer book ids (-1 for padding)'
+        table_rows = np.array([self.book_id_to_row.get(str(b), -1) for b in table_book_ids], dtype=np.int64)
+        table_indices = np.asarray(table_indices[:, :k])
+        matrix = np.where(table_indices >= 0, table_rows[table_indices], -1)
+        missing = (table_indices >= 0) & (matrix < 0)
+        if missing.any():
+            raise KeyError(str(table_book_ids[table_indices[missing][0]]))
+        return matrix
+
+    def in_genre(self, rows, genre, cutoff=5):
+        'Boolean array of the same shape as rows: is each book in genre'
+        return (self.masks(cutoff)[rows] & self.genre_bit(genre)) != 0
+
+    def genre_counts(self, rows, cutoff=5):
+        'Number of the given books in each genre, as {genre: count}'
+        masks = self.masks(cutoff)[rows]
+        return {genre: int(np.count_nonzero(masks & self.genre_bit(genre))) for genre in self.genres}
+
+    def fraction_in_genre(self, row_matrix, genre, num_neighbors=10, cutoff=5):
+        'Per source, the fraction of its first num_neighbors neighbors that are in genre'
+        # short lists count their missing neighbors as not in the genre
+        return self.in_genre(row_matrix[:, :num_neighbors], genre, cutoff).sum(axis=1) / num_neighbors
+
+    def fraction_in_genre_sweep(self, row_matrix, genre, neighbor_counts, cutoffs):
+        'Mean fraction_in_genre over sources for every (cutoff, num_neighbors) pair, as a 2d array'
+        means = np.zeros((len(cutoffs), len(neighbor_counts)))
+        for i, cutoff in enumerate(cutoffs):
+            hits = np.cumsum(self.in_genre(row_matrix, genre, cutoff), axis=1)
+            for j, num_neighbors in enumerate(neighbor_counts):
+                means[i, j] = np.mean(hits[:, min(num_neighbors, row_matrix.shape[1]) - 1] / num_neighbors)
+        return means
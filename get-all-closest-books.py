@@ -0,0 +1,154 @@
+import json
+import argparse
+import multiprocessing
+import os
+import time
+
+from book_graph_utils import *
+
+# loads the graph once per worker from the memory-mapped cache, so every
+# process shares the same page cache instead of holding its own copy,
+# then fans the sampled books of all genres out to the pool
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--genres', type=str, nargs='*', default=None, help='defaults to every genre in the books dict')
+parser.add_argument('--jobs', type=int, default=os.cpu_count())
+parser.add_argument('--k', type=int, default=100)
+parser.add_argument('--hub_reduction', type=str, default=None, help='search a reduced graph, e.g. cap-1000 or percentile-99.9-idf (see hub_users.py)')
+parser.add_argument('--precomputed_edges', action='store_true', help='search over the cached co-review matrix')
+parser.add_argument('--queue', type=str, default='heapq', choices=PRIORITY_QUEUES)
+parser.add_argument('--bounded', action='store_true', help='prune candidates that cannot reach the top k (same results)')
+parser.add_argument('--landmarks', type=int, default=0, help='bound the searches with distances from this many landmark books (same results, see landmark_index.py)')
+parser.add_argument('--approximate', type=str, default=None, choices=APPROXIMATE_METHODS, help='rank by personalized PageRank instead (scores, higher is closer, saved as <genre>-closest-books-approximate-<method>)')
+parser.add_argument('--epsilon', type=float, default=1e-6, help='accuracy of --approximate push')
+parser.add_argument('--num_walks', type=int, default=10000, help='walks per source for --approximate walks')
+parser.add_argument('--neighbor_cache_mb', type=int, default=1024, help='per-worker LRU cache of expanded neighbor lists (0 to disable)')
+parser.add_argument('--books_dict_path', type=str, default='librarything-books/genre_matched_books_dict.json')
+parser.add_argument('--output_directory_path', type=str, default='librarything-books')
+parser.add_argument('--json', action='store_true', help='also write the closest books as json')
+parser.add_argument('--restart', action='store_true', help='ignore the checkpoint of an interrupted run and start over')
+parser.add_argument('--search_log_path', type=str, default=None, help='profile every exact search into this jsonl log (plus a -summary.json)')
+parser.add_argument('--invalidated_path', type=str, default=None, help='report from update-graph.py: only recompute the stale results and merge them into the saved ones')
+
+
+# set in each worker by init_worker
+worker_graph = None
+
+def init_worker(hub_reduction, precomputed_edges, neighbor_cache_mb, num_landmarks):
+    global worker_graph
+    worker_graph = open_search_graph(hub_reduction, precomputed_edges, neighbor_cache_mb, num_landmarks)
+
+def search_source(task):
+    book_id, k, queue, bounded, approximate, epsilon, num_walks, profiled = task
+    start = time.perf_counter()
+    search_stats = {}
+    profile = None
+    if approximate:
+        closest_books = get_k_closest_books_approximate(book_id, worker_graph, k=k, method=approximate, epsilon=epsilon, num_walks=num_walks, stats=search_stats)
+    else:
+        profile = {} if profiled else None
+        closest_books = get_k_closest_books(book_id, worker_graph, worker_graph, k=k, queue=queue, bounded=bounded, stats=search_stats, profile=profile)
+    cache_stats = worker_graph.neighbor_cache.stats() if worker_graph.neighbor_cache is not None else None
+    return book_id, closest_books, time.perf_counter() - start, search_stats, profile, (os.getpid(), cache_stats)
+
+
+def main():
+    args = parser.parse_args()
+    if args.approximate and args.invalidated_path:
+        parser.error('--invalidated_path merges into the saved exact results, it cannot be used with --approximate')
+
+    # build (or validate) the caches once before the workers open them
+    num_landmarks = 0 if args.approximate else args.landmarks
+    graph = open_search_graph(args.hub_reduction, args.precomputed_edges, num_landmarks=num_landmarks)
+
+    with open(args.books_dict_path, 'r') as f:
+        genre_to_book_ids = json.load(f)
+    genres = args.genres if args.genres else list(genre_to_book_ids.keys())
+    stale = None
+    if args.invalidated_path:
+        with open(args.invalidated_path, 'r') as f:
+            invalidated = json.load(f)['invalidated']
+        stale = {genre: set(invalidated['closest'].get(genre, [])) | set(invalidated['coreviewed'].get(genre, [])) for genre in genres}
+
+    # a book sampled for several genres is only searched once
+    sources = []
+    seen = set()
+    for genre in genres:
+        for book_id in genre_to_book_ids[genre]:
+            if stale is not None and book_id not in stale[genre]:
+                continue
+            if book_id not in graph.book_to_users:
+                print('Skipping book not connected in book graph: {}'.format(book_id))
+                continue
+            if not graph.has_reviews(book_id):
+                print('Skipping book with no reviewers left in the reduced graph: {}'.format(book_id))
+                continue
+            if book_id not in seen:
+                seen.add(book_id)
+                sources.append(book_id)
+    print('Searching from {} books across {} genres with {} jobs.'.format(len(sources), len(genres), args.jobs))
+
+    # the one-hop baseline is a batched sparse product, cheap enough to do here in one go
+    print('Getting most co-reviewed books.')
+    start = time.perf_counter()
+    book_id_to_most_coreviewed_neighbors = get_k_neighbors_with_most_same_reviewers_batch(sources, graph, k=args.k)
+    print('    done in {:.1f}s'.format(time.perf_counter() - start))
+
+    # every finished source is appended to a checkpoint, so an interrupted run
+    # only searches the remaining sources when rerun on the same graph with the same settings
+    params = {'graph_version': graph.version, 'k': args.k, 'weighting': CLOSEST_WEIGHTING, 'approximate': args.approximate}
+    if args.approximate:
+        params.update({'epsilon': args.epsilon} if args.approximate == 'push' else {'num_walks': args.num_walks})
+    checkpoint = open_closest_checkpoint(args.output_directory_path, 'all-closest-books', params, restart=args.restart)
+    remaining = [book_id for book_id in sources if book_id not in checkpoint]
+    if len(remaining) < len(sources):
+        print('Resuming from {}: {} of {} sources done.'.format(checkpoint.path, len(sources) - len(remaining), len(sources)))
+
+    # latest neighbor cache counters reported by each worker process
+    worker_cache_stats = {}
+    total_search_stats = defaultdict(int)
+    search_log = SearchLog(args.search_log_path) if args.search_log_path and not args.approximate else None
+    start = time.perf_counter()
+    with multiprocessing.Pool(args.jobs, initializer=init_worker, initargs=(args.hub_reduction, args.precomputed_edges, args.neighbor_cache_mb, num_landmarks)) as pool:
+        tasks = [(book_id, args.k, args.queue, args.bounded, args.approximate, args.epsilon, args.num_walks, search_log is not None) for book_id in remaining]
+        for i, (book_id, closest_books, seconds, search_stats, profile, (pid, cache_stats)) in enumerate(pool.imap_unordered(search_source, tasks)):
+            worker_cache_stats[pid] = cache_stats
+            for key, value in search_stats.items():
+                total_search_stats[key] += value
+            checkpoint.append({'book_id': book_id, 'closest': closest_books})
+            if search_log is not None:
+                search_log.record(book_id, profile, worker=pid)
+            print('{} / {}: {} in {:.1f}s ({:.2f} books/s overall)'.format(i + 1, len(remaining), book_id, seconds, (i + 1) / (time.perf_counter() - start)))
+
+    if search_log is not None:
+        print_search_summary(search_log.close())
+    if not args.approximate:
+        print('{} relaxations, {} avoided by the k bound.'.format(total_search_stats['relaxations'], total_search_stats['relaxations_avoided']))
+    if not args.precomputed_edges and args.neighbor_cache_mb > 0:
+        totals = {key: sum(stats[key] for stats in worker_cache_stats.values()) for key in ('hits', 'misses', 'evictions')}
+        lookups = totals['hits'] + totals['misses']
+        print('Neighbor cache over {} workers: {} hits, {} misses, {} evictions ({:.1f}% hit rate)'.format(
+            len(worker_cache_stats), totals['hits'], totals['misses'], totals['evictions'], 100 * totals['hits'] / max(lookups, 1)))
+
+    # same per-genre outputs, in the same book order, as get-closest-books.py
+    book_id_to_closest = read_closest_checkpoint(checkpoint)
+    for genre in genres:
+        coreviewed_fn = os.path.join(args.output_directory_path, '{}-most-coreviewed-neighbors.json'.format(genre))
+        if stale is not None:
+            # keep the saved results that are still valid
+            saved = load_closest_results(args.output_directory_path, genre).to_dict()
+            book_id_to_closest.update({b: c for b, c in saved.items() if b not in stale[genre]})
+            with open(coreviewed_fn, 'r') as f:
+                book_id_to_most_coreviewed_neighbors.update({b: n for b, n in json.load(f).items() if b not in stale[genre]})
+        book_ids = [b for b in genre_to_book_ids[genre] if b in book_id_to_closest]
+        closest_results = ClosestResults.from_dict({b: book_id_to_closest[b] for b in book_ids}, k=args.k)
+        write_closest_results(args.output_directory_path, genre, closest_results, extra={'graph_version': graph.version}, approximate=args.approximate)
+        if args.json:
+            closest_results.export_json(closest_results_path(args.output_directory_path, genre, args.approximate) + '.json')
+        write_json_atomic(coreviewed_fn, {b: book_id_to_most_coreviewed_neighbors[b] for b in book_ids}, indent=4)
+        print('Done with {}!'.format(genre))
+    remove_closest_checkpoint(checkpoint)
+
+
+if __name__ == '__main__':
+    main()
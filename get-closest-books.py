@@ -9,82 +9,35 @@ import gzip
 import os
 
 from book_graph_utils import *
-
-from priority_queue import PriorityQueue
+from closest_books_service import ClosestBooksClient
 
 parser = argparse.ArgumentParser()
 parser.add_argument('--genre', type=str, required=True)
+parser.add_argument('--hub_reduction', type=str, default=None, help='search a reduced graph, e.g. cap-1000 or percentile-99.9-idf (see hub_users.py)')
+parser.add_argument('--output_directory_path', type=str, default='librarything-books')
+parser.add_argument('--precomputed_edges', action='store_true', help='search over the cached co-review matrix')
+parser.add_argument('--queue', type=str, default='heapq', choices=PRIORITY_QUEUES)
+parser.add_argument('--bounded', action='store_true', help='prune candidates that cannot reach the top k (same results)')
+parser.add_argument('--landmarks', type=int, default=0, help='bound the searches with distances from this many landmark books (same results, see landmark_index.py)')
+parser.add_argument('--json', action='store_true', help='also write the closest books as json')
+parser.add_argument('--neighbor_cache_mb', type=int, default=1024, help='LRU cache of expanded neighbor lists (0 to disable)')
+parser.add_argument('--restart', action='store_true', help='ignore the checkpoint of an interrupted run and start over')
+parser.add_argument('--search_log_path', type=str, default=None, help='profile every search into this jsonl log (plus a -summary.json)')
+parser.add_argument('--server_url', type=str, default=None, help='ask a running serve-closest-books.py instead of loading the graph (the graph and search options are then the server\'s)')
 args = parser.parse_args()
+if args.server_url and args.search_log_path:
+    parser.error('--search_log_path profiles local searches, it cannot be used with --server_url')
 
-def get_k_closest_books(source_book_id, user_to_books, book_to_users, k=10):
-    # priority queue containing (book_id, number of hops from source) prioritized by distance
-    pq = PriorityQueue()
-    pq.add_or_update_vertex((source_book_id, 0), 0)
-
-    closest_books = []
-    popped_books = set()
-
-    for i in range(k + 1):
-        #print('    {}/{}'.format(i, k))
-        try:
-            (current_node, current_hops), current_distance = pq.pop_vertex()
-        except KeyError as e:
-            print(e)
-            print('Only {} connected vertices.'.format(i))
-            break
-        # closest_books.append({'goodreads_book_id': current_node,
-        #                       'distance': current_distance,
-        #                       'num_hops': current_hops})
-        closest_books.append((current_node, current_distance, current_hops))
-        popped_books.add(current_node)
-        #print('    {}th closest: {} at {} away'.format(i, current_node, current_distance))
-
-        # now get all books reviewed by anyone who reviewed this book
-        # implicit to each pair is the current_node
-        #print('    Mapping neighbors to distances.')
-        pair_to_num_users = defaultdict(int)
-        for u in book_to_users[current_node]:
-            for b in user_to_books[u]:
-                if b == source_book_id:
-                    continue
-                pair_to_num_users[b] += 1
-
-        neighbors = set([b for u in book_to_users[current_node] for b in user_to_books[u] if b != current_node])
-        #print('    Number of neighbors: {}'.format(len(neighbors)))
-
-        # update distances for all those books
-        #print('    Updating neighbors in priority queue.')
-        for book in neighbors:
-            # skip edges to books that were already visited
-            if book in popped_books:
-                continue
-            pq.add_or_update_vertex((book, current_hops + 1), current_distance + (1.0 / pair_to_num_users[book]))
-
-        #print()
-
-
-
-    # skip the first entry because it's just the source node
-    return closest_books[1:]
-
-# get just one-hop paths with low edge weights
-# returns a list of (neighbor, num_reviewers)
-def get_k_neighbors_with_most_same_reviewers(source_book_id, user_to_books, book_to_users, k=10):
-    pair_to_num_users = defaultdict(int)
-    for u in book_to_users[source_book_id]:
-        for b in user_to_books[u]:
-            if b == source_book_id:
-                continue
-            pair_to_num_users[b] += 1
-    sorted_neighbors = sorted(list(pair_to_num_users.items()), key=operator.itemgetter(1), reverse=True)
-    k_truncated = min(k, len(sorted_neighbors))
-    return sorted_neighbors[:k_truncated]
-
-
-
-
-# the basic data from the book graph
-user_to_books, book_to_users = get_cached_goodreads_events()
+client = None
+if args.server_url:
+    client = ClosestBooksClient(args.server_url)
+    graph_version = client.graph_version()
+    print('Using the closest-books service at {} (graph {}).'.format(args.server_url, graph_version))
+else:
+    # the basic data from the book graph
+    graph = open_search_graph(args.hub_reduction, args.precomputed_edges, args.neighbor_cache_mb, args.landmarks)
+    graph_version = graph.version
+    user_to_books, book_to_users = graph.user_to_books, graph.book_to_users
 
 
 # read in manually verified goodreads book ids
@@ -92,34 +45,66 @@ with open('librarything-books/genre_matched_books_dict.json', 'r') as f:
     genre_to_book_ids = json.load(f)
 book_ids = genre_to_book_ids[args.genre]
 
-book_id_to_closest = {}
-book_id_to_most_coreviewed_neighbors = {}
+# one-hop baseline for all books at once
+print('Getting most co-reviewed books.')
+if client is not None:
+    # the service reports books that are not in its graph as errors
+    book_id_to_most_coreviewed_neighbors, _ = client.query('coreviewed', book_ids, 100)
+    connected_book_ids = set(book_id_to_most_coreviewed_neighbors)
+else:
+    connected_book_ids = set(b for b in book_ids if graph.has_reviews(b))
+    book_id_to_most_coreviewed_neighbors = get_k_neighbors_with_most_same_reviewers_batch([b for b in book_ids if b in connected_book_ids], graph, k=100)
+
+# every finished source is appended to a checkpoint, so an interrupted run
+# picks up where it stopped when rerun on the same graph with the same settings
+checkpoint = open_closest_checkpoint(args.output_directory_path, args.genre, {'graph_version': graph_version, 'genre': args.genre, 'k': 100, 'weighting': CLOSEST_WEIGHTING}, restart=args.restart)
+if len(checkpoint) > 0:
+    print('Resuming from {} with {} sources done.'.format(checkpoint.path, len(checkpoint)))
+
+search_log = SearchLog(args.search_log_path) if args.search_log_path else None
 for i, book_id in enumerate(book_ids):
     print('{} / {}'.format(i, len(book_ids)))
-    if book_id not in book_to_users:
+    if book_id not in connected_book_ids:
         print('Skipping book not connected in book graph: {}'.format(book_id))
         continue
+    if book_id in checkpoint:
+        continue
+
+    if client is not None:
+        print('    Getting closest books from the service.')
+        results, _ = client.query('closest', [book_id], 100)
+        checkpoint.append({'book_id': book_id, 'closest': results[book_id]})
+        continue
 
     print('    Getting closest books in graph.')
-    closest_books = get_k_closest_books(book_id, user_to_books, book_to_users, k=100)
-    book_id_to_closest[book_id] = closest_books
+    search_stats = {}
+    profile = {} if search_log is not None else None
+    closest_books = get_k_closest_books(book_id, user_to_books, book_to_users, k=100, queue=args.queue, bounded=args.bounded, stats=search_stats, profile=profile)
+    if args.bounded or args.landmarks > 0:
+        print('    {} relaxations, {} avoided.'.format(search_stats['relaxations'], search_stats['relaxations_avoided']))
+    if search_log is not None:
+        search_log.record(book_id, profile, genre=args.genre)
+        print('    {:.3f}s: {} pops, {} edges scanned, peak queue {}.'.format(profile['seconds'], profile['pops'], profile['edges_scanned'], profile['peak_queue_size']))
+    checkpoint.append({'book_id': book_id, 'closest': closest_books})
     #closest_degrees = [book_id_to_degree[b] for b, _, _ in closest_books]
     #print(closest_books)
 
-    print('    Getting most co-reviewed books.')
-    most_coreviewed_neighbors = get_k_neighbors_with_most_same_reviewers(book_id, user_to_books, book_to_users, k=100)
-    book_id_to_most_coreviewed_neighbors[book_id] = most_coreviewed_neighbors
-    #neighbor_degrees = [book_id_to_degree[b] for b, _ in most_coreviewed_neighbors]
-    #print(most_coreviewed_neighbors)
-    #print(neighbor_degrees)
-
-with open('librarything-books/{}-closest-books-network-distance-weighted.json'.format(args.genre), 'w') as f:
-    json.dump(book_id_to_closest, f, indent=4)
+# same book order as the books dict
+book_id_to_checkpointed = read_closest_checkpoint(checkpoint)
+book_id_to_closest = {b: book_id_to_checkpointed[b] for b in book_ids if b in book_id_to_checkpointed}
+closest_results = ClosestResults.from_dict(book_id_to_closest, k=100)
+write_closest_results(args.output_directory_path, args.genre, closest_results, extra={'graph_version': graph_version})
+if args.json:
+    closest_results.export_json(os.path.join(args.output_directory_path, '{}-closest-books-network-distance-weighted.json'.format(args.genre)))
 
-with open('librarything-books/{}-most-coreviewed-neighbors.json'.format(args.genre), 'w') as f:
-    json.dump(book_id_to_most_coreviewed_neighbors, f, indent=4)
+write_json_atomic(os.path.join(args.output_directory_path, '{}-most-coreviewed-neighbors.json'.format(args.genre)), book_id_to_most_coreviewed_neighbors, indent=4)
+remove_closest_checkpoint(checkpoint)
 
 
+if search_log is not None:
+    print_search_summary(search_log.close())
+if client is None and graph.neighbor_cache is not None:
+    print('Neighbor cache: {}'.format(graph.neighbor_cache.stats()))
 print('Done with {}!'.format(args.genre))
 
 
@@ -2,16 +2,23 @@
 # only scrapes top genres for books
 
 import argparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
 import json
 import os
+import random
 import re
+import sys
+import threading
 import time
 
 from urllib.request import urlopen
 from urllib.error import HTTPError
 import bs4
 import pandas as pd
+import requests
+
+from result_store import JsonLinesStore
 
 
 def get_all_lists(soup):
@@ -101,23 +108,33 @@ def get_series_uri(soup):
         return ""
 
 
+# the regex helpers below accept the raw page (str or bytes) as well as a soup,
+# so callers that already have the page text don't re-serialize the whole tree
+def page_text(soup):
+    if isinstance(soup, str):
+        return soup
+    if isinstance(soup, bytes):
+        return soup.decode('utf-8', errors='replace')
+    return str(soup)
+
+
 def get_isbn(soup):
     try:
-        isbn = re.findall(r'nisbn: [0-9]{10}' , str(soup))[0].split()[1]
+        isbn = re.findall(r'nisbn: [0-9]{10}' , page_text(soup))[0].split()[1]
         return isbn
     except:
         return "isbn not found"
 
 def get_isbn13(soup):
     try:
-        isbn13 = re.findall(r'nisbn13: [0-9]{13}' , str(soup))[0].split()[1]
+        isbn13 = re.findall(r'nisbn13: [0-9]{13}' , page_text(soup))[0].split()[1]
         return isbn13
     except:
         return "isbn13 not found"
 
 
 def get_rating_distribution(soup):
-    distribution = re.findall(r'renderRatingGraph\([\s]*\[[0-9,\s]+', str(soup))[0]
+    distribution = re.findall(r'renderRatingGraph\([\s]*\[[0-9,\s]+', page_text(soup))[0]
     distribution = ' '.join(distribution.split())
     distribution = [int(c.strip()) for c in distribution.split('[')[1].split(',')]
     distribution_dict = {'5 Stars': distribution[0],
@@ -147,28 +164,184 @@ def get_id(bookid):
     pattern = re.compile("([^.-]+)")
     return pattern.search(bookid).group()
     
-def scrape_book(book_id):
-    url = 'https://www.goodreads.com/book/show/' + book_id
+def scrape_book(book_id, backend='bs4', base_url='https://www.goodreads.com'):
+    url = base_url + '/book/show/' + book_id
     source = urlopen(url)
-    soup = bs4.BeautifulSoup(source, 'html.parser')
+    book = parse_book(book_id, source, backend)
 
     time.sleep(1)
 
+    return book
+
+# extraction backends: each parses the page once and returns the scraped fields
+# bs4: BeautifulSoup with the pure-python html.parser (the original behaviour)
+# bs4-lxml: the same soup lookups on a tree built by lxml's parser
+# lxml: lxml's parser plus targeted xpath lookups, no soup at all
+EXTRACTION_BACKENDS = ('bs4', 'bs4-lxml', 'lxml')
+
+def parse_book(book_id, source, backend='bs4'):
+    if backend == 'lxml':
+        fields = extract_fields_lxml(source)
+    elif backend in ('bs4', 'bs4-lxml'):
+        fields = extract_fields_soup(bs4.BeautifulSoup(source, 'html.parser' if backend == 'bs4' else 'lxml'))
+    else:
+        raise ValueError('unknown extraction backend {}, expected one of {}'.format(backend, EXTRACTION_BACKENDS))
     return {'book_id_title':        book_id,
             'book_id':              get_id(book_id),
-            'book_title':           ' '.join(soup.find('h1', {'id': 'bookTitle'}).text.split()),
+            **fields
+            }
+
+def extract_fields_soup(soup):
+    return {'book_title':           ' '.join(soup.find('h1', {'id': 'bookTitle'}).text.split()),
             'author':               ' '.join(soup.find('span', {'itemprop': 'name'}).text.split()),
             'genres':               get_genres(soup)
             }
 
+# xpath equivalents of the soup lookups: a class match on 'left' like bs4's
+# multi-valued class matching, and an exact class string for the genre links
+TITLE_XPATH = '//h1[@id="bookTitle"]'
+AUTHOR_XPATH = '//span[@itemprop="name"]'
+GENRE_BLOCKS_XPATH = '//div[contains(concat(" ", normalize-space(@class), " "), " left ")]'
+GENRE_LINKS_XPATH = './/a[@class="actionLinkLite bookPageGenreLink"]'
+# pages are utf-8; without this lxml reads bytes with no charset declaration as latin-1
+# lxml is only imported by the lxml backends, so the default bs4 one works without it
+lxml_parser = None
+
+def extract_fields_lxml(source):
+    global lxml_parser
+    import lxml.html
+    if lxml_parser is None:
+        lxml_parser = lxml.html.HTMLParser(encoding='utf-8')
+    if hasattr(source, 'read'):
+        source = source.read()
+    tree = lxml.html.fromstring(source, parser=lxml_parser)
+    genres = []
+    for node in tree.xpath(GENRE_BLOCKS_XPATH):
+        current_genre = ' > '.join([g.text_content() for g in node.xpath(GENRE_LINKS_XPATH)])
+        if current_genre.strip():
+            genres.append(current_genre)
+    return {'book_title':           ' '.join(tree.xpath(TITLE_XPATH)[0].text_content().split()),
+            'author':               ' '.join(tree.xpath(AUTHOR_XPATH)[0].text_content().split()),
+            'genres':               genres
+            }
+
+# token bucket shared by all scraping threads: at most `rate` requests per second
+# on average, with bursts of up to `burst` requests
+class TokenBucket:
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.last = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate)
+                self.last = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class ScrapeError(Exception):
+    pass
+
+
+# each thread keeps its own session so connections are reused across books
+thread_local = threading.local()
+
+def get_session():
+    if not hasattr(thread_local, 'session'):
+        thread_local.session = requests.Session()
+    return thread_local.session
+
+# get a page, retrying timeouts, connection errors, 429s and 5xxs with
+# exponential backoff and full jitter; other HTTP errors fail straight away
+def fetch_with_backoff(url, rate_limiter, timeout=30, max_retries=5, backoff_base=1.0, backoff_max=60.0):
+    for attempt in range(max_retries + 1):
+        rate_limiter.acquire()
+        try:
+            response = get_session().get(url, timeout=timeout)
+            if response.status_code == 200:
+                return response.content
+            error = 'HTTP {}'.format(response.status_code)
+            if response.status_code != 429 and response.status_code < 500:
+                raise ScrapeError('{} for {}'.format(error, url))
+        except (requests.ConnectionError, requests.Timeout) as e:
+            error = repr(e)
+        if attempt == max_retries:
+            break
+        delay = random.uniform(0, min(backoff_max, backoff_base * 2 ** attempt))
+        print(str(datetime.now()) + ': {} for {}, retrying in {:.1f}s'.format(error, url, delay))
+        time.sleep(delay)
+    raise ScrapeError('Exceeded {} retries for {}: {}'.format(max_retries, url, error))
+
+def scrape_book_with_backoff(book_id, rate_limiter, base_url='https://www.goodreads.com', backend='bs4', **fetch_kwargs):
+    source = fetch_with_backoff(base_url + '/book/show/' + book_id, rate_limiter, **fetch_kwargs)
+    return parse_book(book_id, source, backend)
+
+# scrape books on a thread pool, appending each book to the store as soon as it is done
+# returns the ids that could not be scraped
+def scrape_books_concurrently(book_ids, store, concurrency=4, requests_per_second=1.0, base_url='https://www.goodreads.com', backend='bs4', **fetch_kwargs):
+    rate_limiter = TokenBucket(requests_per_second, burst=concurrency)
+    failed = []
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        futures = {executor.submit(scrape_book_with_backoff, book_id, rate_limiter, base_url, backend, **fetch_kwargs): book_id for book_id in book_ids}
+        for i, future in enumerate(as_completed(futures)):
+            book_id = futures[future]
+            try:
+                book = future.result()
+            except Exception as e:
+                print(str(datetime.now()) + ': Failed to scrape {}: {}'.format(book_id, e))
+                failed.append(book_id)
+                continue
+            store.append(book)
+            print(str(datetime.now()) + ': #{} out of {} books: {}'.format(i + 1, len(book_ids), book_id))
+    return failed
+
+# results of all scraping runs, one json line per book, keyed by the id it was scraped with
+def open_books_store(books_directory_path):
+    return JsonLinesStore(books_directory_path + '/books.jsonl', key='book_id_title')
+
+# move books scraped as one json file each (the old output layout) into the store
+# each file is moved to <books_directory_path>/imported-json once the store has its
+# book, so later runs only list the directory and resume from the store's key index
+IMPORTED_BOOK_FILES_DIRECTORY = 'imported-json'
+
+def import_book_files(store, books_directory_path):
+    file_names = book_file_names(books_directory_path)
+    if not file_names:
+        return
+    imported_directory_path = books_directory_path + '/' + IMPORTED_BOOK_FILES_DIRECTORY
+    os.makedirs(imported_directory_path, exist_ok=True)
+    imported = 0
+    for file_name in file_names:
+        with open(books_directory_path + '/' + file_name, 'r') as f:
+            book = json.load(f)
+        if book['book_id_title'] not in store:
+            store.append(book)
+            imported += 1
+        os.replace(books_directory_path + '/' + file_name, imported_directory_path + '/' + file_name)
+    print('Imported {} per-book json files into {} and moved all {} to {}.'.format(
+        imported, store.path, len(file_names), imported_directory_path))
+
+def book_file_names(books_directory_path):
+    return [file_name for file_name in os.listdir(books_directory_path)
+            if file_name.endswith('.json') and not file_name.startswith('.') and file_name != "all_books.json"]
+
 def condense_books(books_directory_path):
 
     books = []
 
-    for file_name in os.listdir(books_directory_path):
-        if file_name.endswith('.json') and not file_name.startswith('.') and file_name != "all_books.json":
-            _book = json.load(open(books_directory_path + '/' + file_name, 'r')) #, encoding='utf-8', errors='ignore'))
-            books.append(_book)
+    for file_name in book_file_names(books_directory_path):
+        _book = json.load(open(books_directory_path + '/' + file_name, 'r')) #, encoding='utf-8', errors='ignore'))
+        books.append(_book)
 
     return books
 
@@ -183,6 +356,15 @@ def main():
     parser.add_argument('--format', type=str, action="store", default="json",
                         dest="format", choices=["json", "csv"],
                         help="set file output format")
+    parser.add_argument('--concurrency', type=int, default=None,
+                        help="scrape on this many threads with rate limiting and backoff (default: one at a time)")
+    parser.add_argument('--requests_per_second', type=float, default=1.0)
+    parser.add_argument('--timeout', type=float, default=30.0, help="per-request timeout in seconds")
+    parser.add_argument('--max_retries', type=int, default=5)
+    parser.add_argument('--base_url', type=str, default='https://www.goodreads.com',
+                        help="e.g. a local server from serve-saved-book-pages.py")
+    parser.add_argument('--extraction_backend', type=str, default='bs4', choices=EXTRACTION_BACKENDS,
+                        help="how pages are parsed, see benchmark-html-parsing.py")
     args = parser.parse_args()
 
     # create the output directory if it doesn't exist yet
@@ -190,39 +372,54 @@ def main():
         os.makedirs(args.output_directory_path)
 
     book_ids              = [line.strip() for line in open(args.book_ids_path, 'r') if line.strip()]
-    books_already_scraped =  [file_name.replace('.json', '') for file_name in os.listdir(args.output_directory_path) if file_name.endswith('.json') and not file_name.startswith('all_books')]
-    books_to_scrape       = [book_id for book_id in book_ids if book_id not in books_already_scraped]
+    store                 = open_books_store(args.output_directory_path)
+    import_book_files(store, args.output_directory_path)
+    books_to_scrape       = [book_id for book_id in book_ids if book_id not in store]
+    num_already_scraped   = len(book_ids) - len(books_to_scrape)
     condensed_books_path   = args.output_directory_path + '/all_books'
 
-    for i, book_id in enumerate(books_to_scrape):
-        num_tries = 0
-        while True:
-            try:
-                print(str(datetime.now()) + ' ' + script_name + ': Scraping ' + book_id + '...')
-                print(str(datetime.now()) + ' ' + script_name + ': #' + str(i+1+len(books_already_scraped)) + ' out of ' + str(len(book_ids)) + ' books')
-
-                book = scrape_book(book_id)
-                json.dump(book, open(args.output_directory_path + '/' + book_id + '.json', 'w'))
-
-                print('=============================')
-                break
-            except HTTPError as e:
-                print(e)
-                if num_tries >= 5:
-                    print('Exceeded five retries!!!')
-                    exit(0)
-                print('Retrying!')
-                num_tries += 1 
-
-
-    books = condense_books(args.output_directory_path)
-    if args.format == 'json':
-        json.dump(books, open(f"{condensed_books_path}.json", 'w'))
-    elif args.format == 'csv':
-        json.dump(books, open(f"{condensed_books_path}.json", 'w'))
-        book_df = pd.read_json(f"{condensed_books_path}.json")
-        book_df.to_csv(f"{condensed_books_path}.csv", index=False, encoding='utf-8')
-        
+    if args.concurrency is not None:
+        failed = scrape_books_concurrently(books_to_scrape, store,
+                                           concurrency=args.concurrency,
+                                           requests_per_second=args.requests_per_second,
+                                           base_url=args.base_url,
+                                           backend=args.extraction_backend,
+                                           timeout=args.timeout,
+                                           max_retries=args.max_retries)
+    else:
+        failed = []
+        for i, book_id in enumerate(books_to_scrape):
+            num_tries = 0
+            while True:
+                try:
+                    print(str(datetime.now()) + ' ' + script_name + ': Scraping ' + book_id + '...')
+                    print(str(datetime.now()) + ' ' + script_name + ': #' + str(i+1+num_already_scraped) + ' out of ' + str(len(book_ids)) + ' books')
+
+                    book = scrape_book(book_id, args.extraction_backend, args.base_url)
+                    store.append(book)
+
+                    print('=============================')
+                    break
+                except HTTPError as e:
+                    print(e)
+                    if num_tries >= 5:
+                        print('Exceeded five retries!!!')
+                        failed.append(book_id)
+                        break
+                    print('Retrying!')
+                    num_tries += 1 
+
+
+    store.export_json(f"{condensed_books_path}.json")
+    if args.format == 'csv':
+        store.export_csv(f"{condensed_books_path}.csv")
+    store.close()
+
+    if failed:
+        # rerunning the same command retries just these
+        print(str(datetime.now()) + ' ' + script_name + ': Could not scrape {} of {} books: {}'.format(len(failed), len(book_ids), failed))
+        print(f'The other books have been output to /{args.output_directory_path}\nGoodreads scraping run time = ⏰ ' + str(datetime.now() - start_time) + ' ⏰')
+        sys.exit(1)
     print(str(datetime.now()) + ' ' + script_name + f':\n\n🎉 Success! All book metadata scraped. 🎉\n\nMetadata files have been output to /{args.output_directory_path}\nGoodreads scraping run time = ⏰ ' + str(datetime.now() - start_time) + ' ⏰')
 
 
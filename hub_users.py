@@ -0,0 +1,90 @@
+import numpy as np
+
+from book_graph import BookGraph
+
+# reduced copies of the review graph that tame hub users: a user with d reviews
+# puts d * d co-review pairs behind every expansion through them, so the few
+# users who reviewed thousands of books dominate the neighbor expansions of
+# get_k_closest_books, get_k_neighbors_with_most_same_reviewers and get_book_to_edges
+#
+# a reduction is named by a string, which is also the suffix of its caches:
+#   cap-<n>          keep only the n least-reviewed books of each user (the most specific ones)
+#   sample-<n>       keep a uniform random n books of each user (seeded, so always the same ones)
+#   percentile-<p>   drop every user whose number of reviews is above the p-th percentile
+#   idf              keep every review
+# any of the first three can end in -idf, e.g. cap-500-idf: each remaining user's
+# co-reviews then count 1 / log2(1 + d) instead of 1, with d the user's number of
+# reviews in the full graph, like the inverse document frequency of a term
+# the reduced graph keeps every user and book id (some with no reviews left), so
+# book indices are the same as in the full graph
+
+HUB_MODES = ('cap', 'sample', 'percentile')
+
+
+def parse_hub_reduction(name):
+    'Turn a reduction name into {"mode": ..., "limit": ..., "idf": ...}, raising ValueError for a bad name'
+    parts = name.split('-')
+    idf = parts[-1] == 'idf'
+    if idf:
+        parts = parts[:-1]
+    if not parts and idf:
+        return {'mode': None, 'limit': None, 'idf': True}
+    if len(parts) != 2 or parts[0] not in HUB_MODES:
+        raise ValueError('bad hub reduction {}, expected one of {} followed by a number, or idf'.format(name, ['{}-<n>'.format(mode) for mode in HUB_MODES]))
+    mode, limit = parts
+    try:
+        limit = float(limit) if mode == 'percentile' else int(limit)
+    except ValueError:
+        raise ValueError('bad limit {} in hub reduction {}'.format(limit, name))
+    return {'mode': mode, 'limit': limit, 'idf': idf}
+
+
+def idf_user_weights(user_degrees):
+    return (1.0 / np.log2(1.0 + np.maximum(user_degrees, 1))).astype(np.float32)
+
+
+# position of every review within its user's row after sorting the rows by key
+def rank_within_users(user_index, key, user_degrees):
+    order = np.lexsort((key, user_index))
+    starts = np.repeat(np.cumsum(user_degrees) - user_degrees, user_degrees)
+    ranks = np.empty(len(order), dtype=np.int64)
+    ranks[order] = np.arange(len(order)) - starts
+    return ranks
+
+
+# returns (reduced BookGraph, report of what was removed)
+# seed only matters for sample-<n>
+def reduce_hub_users(graph, reduction, seed=0):
+    user_degrees = graph.user_degrees()
+    user_index = np.repeat(np.arange(graph.num_users, dtype=np.int32), user_degrees)
+    book_index = np.asarray(graph.user_indices)
+    mode, limit = reduction['mode'], reduction['limit']
+    threshold = None
+    if mode == 'cap':
+        # the least-reviewed books first, ties by book index
+        popularity = graph.book_degrees_in_reviews()[book_index]
+        keep = rank_within_users(user_index, popularity * graph.num_books + book_index, user_degrees) < limit
+        threshold = limit
+    elif mode == 'sample':
+        rng = np.random.default_rng(seed)
+        keep = rank_within_users(user_index, rng.random(len(book_index)), user_degrees) < limit
+        threshold = limit
+    elif mode == 'percentile':
+        threshold = float(np.percentile(user_degrees, limit))
+        keep = user_degrees[user_index] <= threshold
+    else:
+        keep = np.ones(len(book_index), dtype=bool)
+    user_weights = idf_user_weights(user_degrees) if reduction['idf'] else None
+    reduced = BookGraph.from_review_indices(graph.user_ids, graph.book_ids, user_index[keep], book_index[keep], user_weights=user_weights)
+
+    reduced_degrees = reduced.user_degrees()
+    report = {'reviews': int(graph.num_reviews),
+              'reviews_kept': int(reduced.num_reviews),
+              'user_degree_threshold': threshold,
+              'hub_users': int(np.count_nonzero(reduced_degrees < user_degrees)),
+              'max_user_degree': int(user_degrees.max(initial=0)),
+              'max_user_degree_kept': int(reduced_degrees.max(initial=0)),
+              # co-review pairs behind expanding every book once, sum of d * d over users
+              'coreview_pairs': int(np.sum(user_degrees.astype(np.int64) ** 2)),
+              'coreview_pairs_kept': int(np.sum(reduced_degrees.astype(np.int64) ** 2))}
+    return reduced, report
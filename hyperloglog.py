@@ -0,0 +1,62 @@
+import math
+import numpy as np
+
+# vectorized HyperLogLog sketches: one row of 2^p uint8 registers per sketch
+# (Flajolet et al. 2007, with the usual linear-counting correction for small sets)
+
+
+# smallest precision whose standard error 1.04 / sqrt(2^p) is at most relative_error
+def precision_for_error(relative_error):
+    p = math.ceil(2 * math.log2(1.04 / relative_error))
+    return min(max(p, 4), 16)
+
+
+def standard_error(p):
+    return 1.04 / math.sqrt(1 << p)
+
+
+# splitmix64 finalizer, a good 64-bit mix of integer ids
+def hash64(values):
+    with np.errstate(over='ignore'):
+        z = np.asarray(values).astype(np.uint64) + np.uint64(0x9e3779b97f4a7c15)
+        z = (z ^ (z >> np.uint64(30))) * np.uint64(0xbf58476d1ce4e5b9)
+        z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94d049bb133111eb)
+        return z ^ (z >> np.uint64(31))
+
+
+# register index and rank (position of the first set bit) for each hash
+# the rank looks at the next 32 bits after the index, plenty for cardinalities
+# far beyond the number of books
+def register_updates(hashes, p):
+    index = (hashes >> np.uint64(64 - p)).astype(np.int64)
+    rest = ((hashes >> np.uint64(32 - p)) & np.uint64(0xffffffff)).astype(np.float64)
+    # frexp gives the bit length exactly since every uint32 fits in a float64
+    _, bit_length = np.frexp(rest)
+    rank = (33 - bit_length).astype(np.uint8)
+    return index, rank
+
+
+# sketches[g] summarizes the set of items with group == g
+def build_sketches(groups, items, num_groups, p):
+    sketches = np.zeros((num_groups, 1 << p), dtype=np.uint8)
+    index, rank = register_updates(hash64(items), p)
+    np.maximum.at(sketches, (groups, index), rank)
+    return sketches
+
+
+# estimated cardinality of each row of sketches
+def estimate(sketches):
+    m = sketches.shape[1]
+    if m == 16:
+        alpha = 0.673
+    elif m == 32:
+        alpha = 0.697
+    elif m == 64:
+        alpha = 0.709
+    else:
+        alpha = 0.7213 / (1 + 1.079 / m)
+    raw = alpha * m * m / np.exp2(-sketches.astype(np.float64)).sum(axis=1)
+    zeros = (sketches == 0).sum(axis=1)
+    small = (raw <= 2.5 * m) & (zeros > 0)
+    corrected = m * np.log(m / np.maximum(zeros, 1))
+    return np.where(small, corrected, raw)
@@ -0,0 +1,114 @@
+import glob
+import json
+import os
+import numpy as np
+import scipy.sparse as sp
+
+from book_graph import BookGraph
+from closest_results import closest_result_genres, load_closest_results
+from coreview import review_matrices
+
+# folding a delta of new reviews into an existing graph and its derived arrays
+# without recomputing the co-review matrix or the degrees from scratch
+#
+# with B the user x book review matrix and D the reviews that are new in the
+# delta, B_new = B_old + D and the co-review counts change by
+#   B_new^T B_new - B_old^T B_old = D^T B_new + B_new^T D - D^T D
+# which only touches the rows of books that gained a co-reviewer
+
+
+# merge reviews (csv user ids, goodreads book ids) into the graph
+# returns (new graph, user and book indices of the reviews that were not in the graph
+# before, map from old book index to new book index)
+# ids are kept sorted, so old books keep their relative order in the new graph
+def merge_reviews(graph, csv_user_ids, goodreads_book_ids):
+    old_user_ids, old_book_ids = graph.review_ids()
+    new_graph = BookGraph.from_reviews(np.concatenate([old_user_ids, csv_user_ids]),
+                                       np.concatenate([old_book_ids, goodreads_book_ids]))
+    old_to_new_user = np.searchsorted(new_graph.user_ids, graph.user_ids)
+    old_to_new_book = np.searchsorted(new_graph.book_ids, graph.book_ids)
+
+    # both key arrays are sorted by user then book, since the index maps are increasing
+    old_rows = np.repeat(np.arange(graph.num_users), graph.user_degrees())
+    old_keys = old_to_new_user[old_rows].astype(np.int64) * new_graph.num_books + old_to_new_book[graph.user_indices]
+    new_rows = np.repeat(np.arange(new_graph.num_users), new_graph.user_degrees())
+    new_keys = new_rows.astype(np.int64) * new_graph.num_books + new_graph.user_indices
+    added = ~np.isin(new_keys, old_keys, assume_unique=True)
+    return new_graph, new_rows[added], new_graph.user_indices[added], old_to_new_book
+
+
+# change in book x book co-review counts (diagonal dropped) from adding the
+# reviews (added_users[i], added_books[i]) that are already part of graph
+def coreview_delta(graph, added_users, added_books):
+    ones = np.ones(len(added_users), dtype=np.int32)
+    added = sp.csr_matrix((ones, (added_users, added_books)), shape=(graph.num_users, graph.num_books))
+    user_by_book, _ = review_matrices(graph)
+    one_sided = (added.T @ user_by_book).tocsr()
+    delta = (one_sided + one_sided.T - added.T @ added).tocsr()
+    delta.setdiag(0)
+    delta.eliminate_zeros()
+    delta.sort_indices()
+    return delta
+
+
+# books whose co-review neighbors or counts changed
+def affected_books(delta):
+    return np.flatnonzero(np.diff(delta.indptr))
+
+
+# renumber the rows and columns of a square csr matrix with an increasing index map
+# new rows (books not in old_to_new) are empty
+def remap_square_matrix(matrix, old_to_new, size):
+    row_lengths = np.zeros(size, dtype=np.int64)
+    row_lengths[old_to_new] = np.diff(matrix.indptr)
+    indptr = np.zeros(size + 1, dtype=np.int64)
+    np.cumsum(row_lengths, out=indptr[1:])
+    indices = old_to_new[matrix.indices].astype(np.int32)
+    return sp.csr_matrix((matrix.data, indices, indptr), shape=(size, size))
+
+
+# only valid for the unpruned matrix (min_count=1, top_n=None); pruned ones
+# depend on counts outside the changed rows and have to be recomputed
+def update_coreview_matrix(matrix, delta, old_to_new_book):
+    num_books = delta.shape[0]
+    if num_books != matrix.shape[0]:
+        matrix = remap_square_matrix(matrix, old_to_new_book, num_books)
+    updated = (matrix + delta).tocsr()
+    updated.sort_indices()
+    return sp.csr_matrix((updated.data.astype(np.int32), updated.indices.astype(np.int32), updated.indptr.astype(np.int64)),
+                         shape=updated.shape)
+
+
+# exact degrees after the update, recounting only the affected rows of B^T B
+# returns (degree per book index, book indices sorted by decreasing degree) like get_graph_degrees
+def update_degrees(graph, degrees, old_to_new_book, affected, batch_size=1000):
+    new_degrees = np.zeros(graph.num_books, dtype=np.int64)
+    new_degrees[old_to_new_book] = degrees
+    if graph.coreview_matrix is not None:
+        new_degrees[affected] = np.diff(graph.coreview_matrix.indptr)[affected]
+    else:
+        user_by_book, book_by_user = review_matrices(graph)
+        for start in range(0, len(affected), batch_size):
+            rows = affected[start:start + batch_size]
+            block = book_by_user[rows] @ user_by_book
+            new_degrees[rows] = np.maximum(np.diff(block.indptr) - 1, 0)
+    return new_degrees, np.argsort(-new_degrees, kind='stable')
+
+
+# sources of saved results that an update made stale, as
+# {'closest': {genre: [book ids]}, 'coreviewed': {genre: [book ids]}}
+# a closest-books search only reads the edges of the books it pops, which are the
+# source and its results, so it is stale only if one of those books is affected
+# a most-coreviewed list only depends on its source's own row
+def invalidated_results(results_directory_path, affected_book_ids):
+    affected_book_ids = set(affected_book_ids)
+    invalidated = {'closest': {}, 'coreviewed': {}}
+    for genre in closest_result_genres(results_directory_path):
+        invalidated['closest'][genre] = load_closest_results(results_directory_path, genre).sources_touching(affected_book_ids)
+    suffix = '-most-coreviewed-neighbors.json'
+    for fn in sorted(glob.glob(os.path.join(results_directory_path, '*' + suffix))):
+        genre = os.path.basename(fn)[:-len(suffix)]
+        with open(fn, 'r') as f:
+            book_id_to_neighbors = json.load(f)
+        invalidated['coreviewed'][genre] = [book_id for book_id in book_id_to_neighbors if book_id in affected_book_ids]
+    return invalidated
@@ -0,0 +1,85 @@
+import numpy as np
+import scipy.sparse as sp
+from scipy.sparse.csgraph import dijkstra
+
+# landmark (ALT) distances for the closest-books search: exact 1 / co-reviewers
+# distances from a few landmark books to every book, one float32 row per landmark
+#   landmarks   int32   L, book index of each landmark
+#   distances   float32 L x num_books, inf where a book is not connected to the landmark
+# distances are rounded up to float32, so the upper bounds below stay upper bounds
+#
+# by the triangle inequality, for a source s, any book v and landmark l:
+#   |d(l, s) - d(l, v)| <= d(s, v) <= d(s, l) + d(l, v)
+# for a k-closest search the lower bound never prunes more than the distance the
+# search already has in hand (a relaxed book's tentative distance is at least its
+# true distance, which is at least the lower bound), so the search uses the upper
+# bound: the k + 1 smallest upper bounds bound the k-th closest distance before the
+# first book is expanded, and candidates beyond it are dropped from the start
+# lower_bounds is kept for measuring how tight the landmarks are
+
+# upper bounds are widened by this much to stay above the distances the search
+# sums up along its own paths, which can round differently
+UPPER_BOUND_SLACK = 1 + 1e-6
+
+
+# exact distances from each landmark to every book, over a co-review matrix
+def landmark_distances(coreview_matrix, landmarks):
+    lengths = sp.csr_matrix((1.0 / np.asarray(coreview_matrix.data, dtype=np.float64), coreview_matrix.indices, coreview_matrix.indptr),
+                            shape=coreview_matrix.shape)
+    distances = dijkstra(lengths, directed=True, indices=np.asarray(landmarks, dtype=np.int64))
+    rounded = distances.astype(np.float32)
+    below = rounded < distances
+    rounded[below] = np.nextafter(rounded[below], np.float32(np.inf))
+    return rounded
+
+
+class LandmarkIndex:
+
+    ARRAY_NAMES = ('landmarks', 'distances')
+
+    def __init__(self, landmarks, distances):
+        self.landmarks = landmarks
+        self.distances = distances
+
+    @classmethod
+    def build(cls, coreview_matrix, landmarks):
+        landmarks = np.asarray(landmarks, dtype=np.int32)
+        return cls(landmarks, landmark_distances(coreview_matrix, landmarks))
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        return cls(*[arrays[name] for name in cls.ARRAY_NAMES])
+
+    def to_arrays(self):
+        return {name: getattr(self, name) for name in self.ARRAY_NAMES}
+
+    @property
+    def nbytes(self):
+        return self.landmarks.nbytes + self.distances.nbytes
+
+    def upper_bounds(self, source):
+        'Upper bound on the distance from source to every book, through its nearest landmark'
+        bounds = np.full(self.distances.shape[1], np.inf)
+        for row in self.distances:
+            np.minimum(bounds, row.astype(np.float64) + float(row[source]), out=bounds)
+        bounds *= UPPER_BOUND_SLACK
+        bounds[source] = 0
+        return bounds
+
+    def lower_bounds(self, source):
+        'Lower bound on the distance from source to every book (0 where no landmark reaches both)'
+        bounds = np.zeros(self.distances.shape[1])
+        for row in self.distances:
+            difference = np.abs(row.astype(np.float64) - float(row[source]))
+            np.maximum(bounds, np.where(np.isfinite(difference), difference, 0), out=bounds)
+        return bounds
+
+    def closest_upper_bounds(self, source, k):
+        'The k books other than source with the smallest finite upper bounds, as (book index, bound) pairs'
+        bounds = self.upper_bounds(source)
+        bounds[source] = np.inf
+        k = min(k, int(np.isfinite(bounds).sum()))
+        if k == 0:
+            return []
+        books = np.argpartition(bounds, k - 1)[:k]
+        return list(zip(books.tolist(), bounds[books].tolist()))
@@ -0,0 +1,82 @@
+from collections import OrderedDict
+import sys
+import numpy as np
+
+
+# rough size in bytes of a cached value: numpy arrays (or tuples of them) exactly,
+# dicts of book id -> count approximately
+def estimate_nbytes(value):
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, (tuple, list)):
+        return sys.getsizeof(value) + sum(estimate_nbytes(v) for v in value)
+    if isinstance(value, dict):
+        # keys are short strings / ints and values small ints
+        return sys.getsizeof(value) + 80 * len(value)
+    return sys.getsizeof(value)
+
+
+# bounded least-recently-used cache with hit / miss / eviction counters
+# bounded by number of entries, total estimated bytes, or both
+class LRUCache:
+
+    def __init__(self, max_entries=None, max_bytes=None, sizeof=estimate_nbytes):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self.entries = OrderedDict()         # key -> (value, nbytes), least recently used first
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def get(self, key, default=None):
+        'Return the cached value and mark it recently used, or default on a miss'
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return default
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return entry[0]
+
+    def put(self, key, value):
+        nbytes = self.sizeof(value)
+        if key in self.entries:
+            self.nbytes -= self.entries.pop(key)[1]
+        # a value bigger than the whole cache is never stored
+        if self.max_bytes is not None and nbytes > self.max_bytes:
+            return
+        self.entries[key] = (value, nbytes)
+        self.nbytes += nbytes
+        while ((self.max_entries is not None and len(self.entries) > self.max_entries)
+               or (self.max_bytes is not None and self.nbytes > self.max_bytes)):
+            _, (_, evicted_nbytes) = self.entries.popitem(last=False)
+            self.nbytes -= evicted_nbytes
+            self.evictions += 1
+
+    def get_or_compute(self, key, compute):
+        entry = self.entries.get(key)
+        if entry is not None:
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return entry[0]
+        self.misses += 1
+        value = compute(key)
+        self.put(key, value)
+        return value
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {'entries': len(self.entries),
+                'nbytes': self.nbytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / lookups if lookups else 0.0}
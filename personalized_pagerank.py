@@ -0,0 +1,112 @@
+import numpy as np
+
+from book_graph import gather_rows
+
+# approximate closest books by personalized PageRank over the user-book
+# bipartite graph: a walk steps from a book to a random reviewer, then to a
+# random book of theirs, and restarts at the source with probability alpha
+# before every step
+# books with a high visiting probability are the ones joined to the source by
+# many short, heavily co-reviewed paths, the same books the exact search ranks first
+#
+# scores are estimates of the visiting probability (higher is closer)
+# hops is the fewest book-to-book steps over which any mass or walk arrived
+
+
+# book-to-book step of a batch of mass: from books with the given mass, spread
+# it evenly over their reviewers and then over those reviewers' books
+# returns (books reached, mass each receives)
+def spread_mass(graph, books, mass):
+    book_degrees = graph.book_indptr[books + 1] - graph.book_indptr[books]
+    users = gather_rows(graph.book_indptr, graph.book_indices, books)
+    users, inverse = np.unique(users, return_inverse=True)
+    user_mass = np.bincount(inverse, weights=np.repeat(mass / book_degrees, book_degrees))
+    user_degrees = graph.user_indptr[users + 1] - graph.user_indptr[users]
+    reached = gather_rows(graph.user_indptr, graph.user_indices, users)
+    reached, inverse = np.unique(reached, return_inverse=True)
+    return reached, np.bincount(inverse, weights=np.repeat(user_mass / user_degrees, user_degrees))
+
+
+# forward push (Andersen, Chung and Lang 2006), pushing every book whose residual
+# is above epsilon times its number of reviewers in one vectorized round
+# smaller epsilon is more accurate and slower; each score is short of the
+# true probability by at most about epsilon times the book's number of reviewers
+# the mass left un-pushed counts too: a book's residual would put at least alpha of
+# itself on the book when pushed, so scores get alpha * residual added and stay
+# below the true probability, and a coarse epsilon still ranks the books mass reached
+# returns (scores, hops) as dense arrays over book indices, hops -1 where not reached
+def forward_push(graph, source, alpha=0.15, epsilon=1e-6, stats=None):
+    book_degrees = graph.book_degrees_in_reviews()
+    scores = np.zeros(graph.num_books)
+    residual = np.zeros(graph.num_books)
+    residual[source] = 1.0
+    hops = np.full(graph.num_books, -1, dtype=np.int64)
+    hops[source] = 0
+    num_rounds = 0
+    num_pushes = 0
+    # a book with no reviewers (possible in a reduced graph) has nowhere to push
+    active = np.array([source] if book_degrees[source] > 0 else [], dtype=np.int64)
+    while len(active):
+        num_rounds += 1
+        num_pushes += len(active)
+        # push hop level by hop level, so every book reached knows which level it came from
+        active_hops = hops[active]
+        for h in np.unique(active_hops):
+            group = active[active_hops == h]
+            mass = residual[group]
+            residual[group] = 0
+            scores[group] += alpha * mass
+            reached, received = spread_mass(graph, group, (1 - alpha) * mass)
+            residual[reached] += received
+            hops[reached] = np.where(hops[reached] < 0, h + 1, np.minimum(hops[reached], h + 1))
+        active = np.flatnonzero(residual > epsilon * book_degrees)
+    if stats is not None:
+        stats['rounds'] = stats.get('rounds', 0) + num_rounds
+        stats['pushes'] = stats.get('pushes', 0) + num_pushes
+    return scores + alpha * residual, hops
+
+
+# Monte-Carlo estimate from num_walks walks started at the source, run side by side
+# every book a walk lands on counts as a visit; the error shrinks like 1 / sqrt(num_walks)
+# returns (scores, hops) like forward_push
+def random_walks(graph, source, alpha=0.15, num_walks=10000, seed=0, stats=None):
+    # a book with no reviewers (possible in a reduced graph) reaches nothing
+    if graph.book_indptr[source + 1] == graph.book_indptr[source]:
+        hops = np.full(graph.num_books, -1, dtype=np.int64)
+        hops[source] = 0
+        return np.zeros(graph.num_books), hops
+    rng = np.random.default_rng(seed)
+    current = np.full(num_walks, source, dtype=np.int64)
+    visited_chunks = []
+    step_chunks = []
+    step = 0
+    while len(current):
+        current = current[rng.random(len(current)) >= alpha]
+        step += 1
+        starts = graph.book_indptr[current]
+        users = graph.book_indices[starts + (rng.random(len(current)) * (graph.book_indptr[current + 1] - starts)).astype(np.int64)]
+        starts = graph.user_indptr[users]
+        current = graph.user_indices[starts + (rng.random(len(users)) * (graph.user_indptr[users + 1] - starts)).astype(np.int64)].astype(np.int64)
+        visited_chunks.append(current)
+        step_chunks.append(np.full(len(current), step, dtype=np.int64))
+    visited = np.concatenate(visited_chunks)
+    scores = np.bincount(visited, minlength=graph.num_books) / num_walks
+    hops = np.full(graph.num_books, np.iinfo(np.int64).max)
+    np.minimum.at(hops, visited, np.concatenate(step_chunks))
+    hops[hops == np.iinfo(np.int64).max] = -1
+    hops[source] = 0
+    if stats is not None:
+        stats['walks'] = stats.get('walks', 0) + num_walks
+        stats['steps'] = stats.get('steps', 0) + len(visited)
+    return scores, hops
+
+
+# indices of the k highest scores other than the source, ties to the lower index
+def top_k_scores(scores, source, k):
+    candidates = np.flatnonzero(scores > 0)
+    candidates = candidates[candidates != source]
+    if len(candidates) > k:
+        kth = np.partition(-scores[candidates], k - 1)[k - 1]
+        candidates = candidates[-scores[candidates] <= kth]
+    order = np.lexsort((candidates, -scores[candidates]))
+    return candidates[order[:k]]
@@ -39,4 +39,215 @@ class PriorityQueue:
             if task != '<removed-task>':
                 del self.entry_finder[name]
                 return task, priority
-        raise KeyError('pop from an empty priority queue')
\ No newline at end of file
+        raise KeyError('pop from an empty priority queue')
+
+# array-backed binary heap over integer vertex ids 0..num_vertices-1
+# with true decrease-key: each vertex has at most one heap slot, so
+# repeated updates from hub neighborhoods never leave dead entries behind
+# same interface as PriorityQueue, with tasks (vertex, hops)
+# ties are broken by insertion / update order, exactly like PriorityQueue
+# the arrays take num_vertices entries each, so a search that is done with a
+# queue can reset() it for the next one instead of allocating new ones
+class IndexedPriorityQueue:
+
+    def __init__(self, num_vertices):
+        self.num_vertices = num_vertices
+        self.position = [-1] * num_vertices      # index of each vertex in heap, -1 if absent
+        self.priority = [0.0] * num_vertices     # priority of each vertex, while in the heap
+        self.order = [0] * num_vertices          # tie-breaking sequence number of each vertex
+        self.hops = [0] * num_vertices           # rest of the task of each vertex
+        self.heap = []                           # vertices arranged in a heap
+        self.counter = itertools.count()
+
+    def reset(self):
+        'Empty the queue, in time proportional to the vertices still queued'
+        # popped vertices are already -1, and priority, order and hops are only
+        # read while a vertex is queued, so stale values in them do no harm
+        position = self.position
+        for vertex in self.heap:
+            position[vertex] = -1
+        self.heap = []
+        self.counter = itertools.count()
+
+    def __len__(self):
+        return len(self.heap)
+
+    def _less(self, a, b):
+        pa = self.priority[a]
+        pb = self.priority[b]
+        return pa < pb or (pa == pb and self.order[a] < self.order[b])
+
+    def _sift_up(self, i):
+        heap = self.heap
+        position = self.position
+        vertex = heap[i]
+        while i > 0:
+            parent = (i - 1) >> 1
+            if not self._less(vertex, heap[parent]):
+                break
+            heap[i] = heap[parent]
+            position[heap[i]] = i
+            i = parent
+        heap[i] = vertex
+        position[vertex] = i
+
+    def _sift_down(self, i):
+        heap = self.heap
+        position = self.position
+        n = len(heap)
+        vertex = heap[i]
+        while True:
+            child = 2 * i + 1
+            if child >= n:
+                break
+            if child + 1 < n and self._less(heap[child + 1], heap[child]):
+                child += 1
+            if not self._less(heap[child], vertex):
+                break
+            heap[i] = heap[child]
+            position[heap[i]] = i
+            i = child
+        heap[i] = vertex
+        position[vertex] = i
+
+    def add_or_update_vertex(self, task, priority):
+        'Add a new vertex or lower the priority of a queued one'
+        vertex = task[0]
+        i = self.position[vertex]
+        if i >= 0:
+            if priority >= self.priority[vertex]:
+                return
+            self.priority[vertex] = priority
+            self.order[vertex] = next(self.counter)
+            self.hops[vertex] = task[1]
+            self._sift_up(i)
+            return
+        self.priority[vertex] = priority
+        self.order[vertex] = next(self.counter)
+        self.hops[vertex] = task[1]
+        self.heap.append(vertex)
+        self._sift_up(len(self.heap) - 1)
+
+    def pop_vertex(self):
+        'Remove and return the lowest priority task. Raise KeyError if empty.'
+        if not self.heap:
+            raise KeyError('pop from an empty priority queue')
+        heap = self.heap
+        vertex = heap[0]
+        last = heap.pop()
+        if heap:
+            heap[0] = last
+            self._sift_down(0)
+        self.position[vertex] = -1
+        return (vertex, self.hops[vertex]), self.priority[vertex]
+
+
+# the same queues, also counting what a search does to them, for profiling:
+# pushes are new heap entries, stale pops are dead entries popped and skipped
+# (only PriorityQueue leaves them behind, IndexedPriorityQueue updates in place),
+# decrease_keys are updates that lowered a queued priority (a fresh push for
+# PriorityQueue, not one for IndexedPriorityQueue), and peak_size is the largest heap length
+class CountingPriorityQueue(PriorityQueue):
+
+    def __init__(self):
+        super().__init__()
+        self.pushes = 0
+        self.stale_pops = 0
+        self.decrease_keys = 0
+        self.peak_size = 0
+
+    def __len__(self):
+        return len(self.entry_finder)
+
+    # same logic as PriorityQueue.add_or_update_vertex, with the counting inline
+    # since most calls are rejected updates and a wrapper would double their cost
+    def add_or_update_vertex(self, task, priority):
+        name = task[0]
+        entry = self.entry_finder.get(name)
+        if entry is not None:
+            if priority >= entry[0]:
+                return
+            entry[-1] = '<removed-task>'
+            self.decrease_keys += 1
+        entry = [priority, next(self.counter), task]
+        self.entry_finder[name] = entry
+        heappush(self.pq, entry)
+        self.pushes += 1
+        if len(self.pq) > self.peak_size:
+            self.peak_size = len(self.pq)
+
+    def pop_vertex(self):
+        size = len(self.pq)
+        try:
+            result = super().pop_vertex()
+        except KeyError:
+            self.stale_pops += size
+            raise
+        self.stale_pops += size - len(self.pq) - 1
+        return result
+
+class CountingIndexedPriorityQueue(IndexedPriorityQueue):
+
+    def __init__(self, num_vertices):
+        super().__init__(num_vertices)
+        self.reset_counts()
+
+    def reset(self):
+        super().reset()
+        self.reset_counts()
+
+    def reset_counts(self):
+        self.pushes = 0
+        self.stale_pops = 0
+        self.decrease_keys = 0
+        self.peak_size = 0
+
+    def add_or_update_vertex(self, task, priority):
+        vertex = task[0]
+        i = self.position[vertex]
+        if i >= 0:
+            if priority >= self.priority[vertex]:
+                return
+            self.decrease_keys += 1
+        else:
+            self.pushes += 1
+        super().add_or_update_vertex(task, priority)
+        if len(self.heap) > self.peak_size:
+            self.peak_size = len(self.heap)
+
+
+# upper bound on the k-th smallest distance a search will settle
+# tracks the k smallest tentative distances seen so far, one per vertex:
+# tentative distances only go down, so those k vertices will all settle at or
+# below the largest of them, and any candidate farther than that can be dropped
+class KthDistanceBound:
+
+    def __init__(self, k):
+        self.k = k
+        self.members = {}        # vertex -> best tentative distance, for the k best vertices
+        self.heap = []           # (-distance, vertex), max-heap with stale entries
+        self.bound = float('inf')
+
+    def _refresh(self):
+        heap = self.heap
+        members = self.members
+        while heap and members.get(heap[0][1]) != -heap[0][0]:
+            heappop(heap)
+        if len(members) == self.k:
+            self.bound = -heap[0][0]
+
+    def update(self, vertex, distance):
+        'Record a tentative distance for vertex'
+        members = self.members
+        if vertex in members:
+            if distance >= members[vertex]:
+                return
+        elif len(members) == self.k:
+            if distance >= self.bound:
+                return
+            # evict the current farthest member
+            _, farthest = heappop(self.heap)
+            del members[farthest]
+        members[vertex] = distance
+        heappush(self.heap, (-distance, vertex))
+        self._refresh()
@@ -10,174 +10,251 @@ import os
 import glob
 import numpy as np
 from book_graph_utils import *
-# don't let matplotlib use xwindows
-import matplotlib
-matplotlib.use('Agg')
-import matplotlib.pyplot as plt
-from matplotlib.pylab import savefig
-import seaborn as sns
-sns.set_style("whitegrid")
-sns.set_palette(sns.color_palette("hls", 8))
+from genre_index import GenreIndex
+
+# the report is split into stages that can be run on their own, e.g.
+#   python process-all-results.py --stages plot
+# each stage only loads what it uses, and every input is loaded at most once
+# only the degree baseline opens the book graph; the plot stage reads the
+# per-source percentages saved by the closest stage when they are there
 
 all_genres_uppercase = ['Romance', 'Fantasy', 'Historical Fiction', 'Science Fiction', 'Vampires', 'Memoir', 'Horror', 'Mystery']
 all_genres = [genre.lower() for genre in all_genres_uppercase]
 
-# the basic data from the book graph
-user_to_books, book_to_users = get_cached_goodreads_events()
-
-
-# read in book metadata
-book_id_to_metadata = get_metadata()
-# get degrees
-book_id_to_degree, book_id_to_degree_rank, book_ids_sorted_by_degree = get_books_to_degrees(user_to_books, book_to_users)
-# genres
-book_id_to_top_genres = read_scraped_top_genres()
-
-
-# save highest-degree books for human-reading and scraping genres
-print('Saving highest-degree books')
-book_titles_sorted_by_degree = [(book_id_to_metadata[book_id]['title'], degree) for book_id, degree in book_ids_sorted_by_degree]
-df = pd.DataFrame(book_titles_sorted_by_degree, columns = ['book_id', 'degree'])
-df.to_csv('./librarything-books/book-titles-sorted-by-degree.csv', index=False)
-with open('librarything-books/highest-degree-top-500-books-to-scrape.txt', 'w') as f:
-    f.write('\n'.join([book_id for book_id, _ in book_ids_sorted_by_degree[:500]]))
-
-# get percentage of top-degree books in each genre
-print('Baseline membership in genres for highest-degree books:')
-genre_numbers = []
-for genre in all_genres_uppercase:
-    num_with_genre_in_top_k = 0
-    for book_id, _ in book_ids_sorted_by_degree[:500]:
-        top_five_genres = book_id_to_top_genres[book_id][:5]
-        num_with_genre_in_top_k += int(any([genre in g for g in top_five_genres]))
-    genre_numbers.append((genre, num_with_genre_in_top_k))
-for genre, num in sorted(genre_numbers, key=operator.itemgetter(1), reverse=True):
-    print('    {}: {} ({:.2f}%)'.format(genre, num, num / 500 * 100))
-
-
-genre_to_percent_mean = {}
-genre_to_percent_std = {}
-
-genre_mean_std = []
-
-tidy_percents = []
-print('Getting average percentage of closest books that are in the same genre')
-for genre in all_genres_uppercase:
-    print('    ', genre)
-
-    lowercase_genre = genre.lower()
-    with open('librarything-books/{}-closest-books-network-distance-weighted.json'.format(lowercase_genre), 'r') as f:
-        book_id_to_closest = json.load(f)
-
-    percents = []
-    for book_id, closest in book_id_to_closest.items():
-        # get whether the same genre is in top k of each top 10 neighbor's user shelves
-        num_with_genre_in_top_k = 0
-        num_neighbors_checked = 10
-        for i, (target_book_id, _, _) in enumerate(closest[:num_neighbors_checked]):
-            top_five_genres = book_id_to_top_genres[target_book_id][:5]
-            num_with_genre_in_top_k += int(any([genre in g for g in top_five_genres]))
-        percent_with_genre_in_top_k = num_with_genre_in_top_k / num_neighbors_checked
-        percents.append(percent_with_genre_in_top_k * 100)
-        tidy_percents.append([lowercase_genre, percent_with_genre_in_top_k])
-    genre_to_percent_mean[lowercase_genre] = np.mean(percents)
-    genre_to_percent_std[lowercase_genre] = np.std(percents)
-    genre_mean_std.append((lowercase_genre, np.mean(percents), np.std(percents)))
-print('Sorted average percentage of closest books that are in the same genre:')
-sorted_genre_tuples = sorted(genre_mean_std, key=operator.itemgetter(1), reverse=True)
-for genre, mean, std in sorted_genre_tuples:
-    print('    {}: {:.2f} ± {:.2f} std'.format(genre, mean, std))
-genre_order = [genre for genre, _, _ in sorted_genre_tuples]
+closest_percents_fn = './librarything-books/closest-books-same-genre-percents.csv'
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--stages', type=str, nargs='*', default=None, help='defaults to every stage, in order')
+parser.add_argument('--num_neighbors_checked', type=int, default=10)
+parser.add_argument('--top_genres_cutoff', type=int, default=5, help='a book is in a genre if it is in its first this many scraped genres')
+parser.add_argument('--sweep', action='store_true', help='also save the closest-books precision for many neighbor counts and cutoffs')
+parser.add_argument('--books_directory_path', type=str, default='all-books')
+
+
+# inputs of the stages, loaded on first use
+class Artifacts:
+
+    def __init__(self, args):
+        self.args = args
+        self.loaded = {}
+        self.unscraped_titles = set()    # ids shown in place of titles, reported at the end
+
+    def get(self, name, load):
+        if name not in self.loaded:
+            self.loaded[name] = load()
+        return self.loaded[name]
+
+    def books_sorted_by_degree(self):
+        'List of (book_id, degree) sorted by decreasing degree'
+        def load():
+            # the basic data from the book graph
+            graph = get_cached_book_graph()
+            _, _, book_ids_sorted_by_degree = get_books_to_degrees(graph.user_to_books, graph.book_to_users)
+            return book_ids_sorted_by_degree
+        return self.get('degrees', load)
+
+    def metadata(self):
+        'Scraped book records by book id'
+        def load():
+            return {book['book_id']: book for book in read_scraped_books(self.args.books_directory_path)}
+        return self.get('metadata', load)
+
+    def title(self, book_id):
+        # parse_book stores the title as book_title; books that were never scraped show up by id
+        book = self.metadata().get(book_id)
+        if book is None:
+            self.unscraped_titles.add(book_id)
+            return book_id
+        return book['book_title']
+
+    def genre_index(self):
+        def load():
+            book_id_to_top_genres = read_scraped_top_genres(self.args.books_directory_path)
+            return GenreIndex.from_top_genres(book_id_to_top_genres, all_genres_uppercase, max_rank=max(10, self.args.top_genres_cutoff))
+        return self.get('genre_index', load)
+
+    def closest(self, genre):
+        'Memory-mapped ClosestResults'
+        return self.get(('closest', genre), lambda: load_closest_results('librarything-books', genre))
+
+    def coreviewed(self, genre):
+        def load():
+            with open('librarything-books/{}-most-coreviewed-neighbors.json'.format(genre), 'r') as f:
+                return json.load(f)
+        return self.get(('coreviewed', genre), load)
+
+
+# save highest-degree books for human-reading and scraping genres,
+# and the percentage of top-degree books in each genre
+def degree_baseline(artifacts):
+    args = artifacts.args
+    book_ids_sorted_by_degree = artifacts.books_sorted_by_degree()
+    print('Saving highest-degree books')
+    book_titles_sorted_by_degree = [(artifacts.title(book_id), degree) for book_id, degree in book_ids_sorted_by_degree]
+    df = pd.DataFrame(book_titles_sorted_by_degree, columns = ['book_id', 'degree'])
+    df.to_csv('./librarything-books/book-titles-sorted-by-degree.csv', index=False)
+    with open('librarything-books/highest-degree-top-500-books-to-scrape.txt', 'w') as f:
+        f.write('\n'.join([book_id for book_id, _ in book_ids_sorted_by_degree[:500]]))
+
+    print('Baseline membership in genres for highest-degree books:')
+    genre_index = artifacts.genre_index()
+    top_degree_rows = genre_index.rows([book_id for book_id, _ in book_ids_sorted_by_degree[:500]])
+    genre_numbers = genre_index.genre_counts(top_degree_rows, cutoff=args.top_genres_cutoff)
+    for genre, num in sorted(genre_numbers.items(), key=operator.itemgetter(1), reverse=True):
+        print('    {}: {} ({:.2f}%)'.format(genre, num, num / 500 * 100))
+
+
+# per-source fraction of the closest books in the source's genre, saved for the plot stage
+def closest_scoring(artifacts):
+    args = artifacts.args
+    genre_index = artifacts.genre_index()
+    tidy_percents = []
+    sweep_rows = []
+    print('Getting average percentage of closest books that are in the same genre')
+    for genre in all_genres_uppercase:
+        print('    ', genre)
+        lowercase_genre = genre.lower()
+        closest_results = artifacts.closest(lowercase_genre)
+
+        # whether the same genre is in the top genres of each of the closest neighbors' user shelves
+        closest_rows = genre_index.table_row_matrix(closest_results.book_ids, closest_results.neighbors, args.num_neighbors_checked)
+        fractions = genre_index.fraction_in_genre(closest_rows, genre, args.num_neighbors_checked, args.top_genres_cutoff)
+        tidy_percents.extend([lowercase_genre, fraction] for fraction in fractions.tolist())
+        if args.sweep:
+            neighbor_counts = list(range(1, closest_results.k + 1))
+            cutoffs = list(range(1, 11))
+            all_rows = genre_index.table_row_matrix(closest_results.book_ids, closest_results.neighbors, closest_results.k)
+            means = genre_index.fraction_in_genre_sweep(all_rows, genre, neighbor_counts, cutoffs)
+            for i, cutoff in enumerate(cutoffs):
+                sweep_rows.extend([lowercase_genre, cutoff, num_neighbors, mean] for num_neighbors, mean in zip(neighbor_counts, means[i]))
+    if args.sweep:
+        sweep_df = pd.DataFrame(sweep_rows, columns=['genre', 'top_genres_cutoff', 'num_neighbors_checked', 'fraction_in_same_genre'])
+        sweep_df.to_csv('./librarything-books/closest-books-same-genre-sweep.csv', index=False)
+
+    percents_df = pd.DataFrame(tidy_percents, columns=['Genre', 'Percentage of closest books in same genre'])
+    percents_df.to_csv(closest_percents_fn, index=False)
+    print('Sorted average percentage of closest books that are in the same genre:')
+    for genre, mean, std in genre_means(percents_df):
+        print('    {}: {:.2f} ± {:.2f} std'.format(genre, mean, std))
+    return percents_df
+
+
+# (genre, mean percent, std percent) sorted by decreasing mean
+def genre_means(percents_df):
+    percents = percents_df.groupby('Genre', sort=False)['Percentage of closest books in same genre']
+    genre_mean_std = [(genre, np.mean(p.to_numpy() * 100), np.std(p.to_numpy() * 100)) for genre, p in percents]
+    return sorted(genre_mean_std, key=operator.itemgetter(1), reverse=True)
+
 
 # plot results!
-percents_df = pd.DataFrame(tidy_percents, columns=['Genre', 'Percentage of closest books in same genre'])
-print(percents_df.head())
-print(genre_order)
-plt.figure(figsize=(14,2.4))
-ax = sns.barplot(x='Genre', y='Percentage of closest books in same genre', data=percents_df, order=genre_order, palette=hypothesis_color_order)
-ax.set_ylim((0,1))
-ax.set_xlabel('Genre', fontsize=16)
-ax.set_ylabel('Percentage of closest\nbooks in same genre', fontsize=16)
-ax.set_xticklabels(ax.get_xticklabels(), fontsize=14)
-ax.set_yticklabels(ax.get_yticklabels(), fontsize=14)
-ax.yaxis.set_major_formatter(matplotlib.ticker.PercentFormatter(1.0))
-ax.grid(b=True, which='minor', axis='y')
-ax.yaxis.set_minor_locator(matplotlib.ticker.MultipleLocator(0.1))
-bar_labels = ['{:.1f}%'.format(m) for _, m, _ in sorted_genre_tuples]
-for rect, label in zip(ax.patches, bar_labels):
-    ax.text(rect.get_x() + rect.get_width() / 2, rect.get_height() + 0.06, label,
-            ha='center', va='bottom', fontsize=14)
-savefig('./average-percentage-closest-books-same-genre.pdf', bbox_inches='tight')
-plt.close()
-
-print('Getting average percentage of closest 1-hop neighbor books that are in the same genre')
-genre_mean_std = []
-for genre in all_genres_uppercase:
-    print('    ', genre)
-
-    lowercase_genre = genre.lower()
-    with open('librarything-books/{}-most-coreviewed-neighbors.json'.format(lowercase_genre), 'r') as f:
-        book_id_to_most_coreviewed_neighbors = json.load(f)
-
-    percents = []
-    for book_id, coreviewed in book_id_to_most_coreviewed_neighbors.items():
-        # get whether the same genre is in top k of each top 10 neighbor's user shelves
-        num_with_genre_in_top_k = 0
-        num_neighbors_checked = 10
-        for i, (target_book_id, _) in enumerate(coreviewed[:num_neighbors_checked]):
-            top_five_genres = book_id_to_top_genres[target_book_id][:5]
-            num_with_genre_in_top_k += int(any([genre in g for g in top_five_genres]))
-        percent_with_genre_in_top_k = num_with_genre_in_top_k / num_neighbors_checked * 100
-        percents.append(percent_with_genre_in_top_k)
-    genre_to_percent_mean[genre] = np.mean(percents)
-    genre_to_percent_std[genre] = np.std(percents)
-    genre_mean_std.append((genre, np.mean(percents), np.std(percents)))
-print('Sorted average percentage of closest 1-hop neighbor books that are in the same genre:')
-for genre, mean, std in sorted(genre_mean_std, key=operator.itemgetter(1), reverse=True):
-    print('    {}: {:.2f} ± {:.2f} std'.format(genre, mean, std))
+def plot(artifacts):
+    # don't let matplotlib use xwindows
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    from matplotlib.pylab import savefig
+    import seaborn as sns
+    sns.set_style("whitegrid")
+    sns.set_palette(sns.color_palette("hls", 8))
+
+    if 'closest_percents' in artifacts.loaded or not os.path.exists(closest_percents_fn):
+        percents_df = artifacts.get('closest_percents', lambda: closest_scoring(artifacts))
+    else:
+        print('Reading {}'.format(closest_percents_fn))
+        percents_df = pd.read_csv(closest_percents_fn)
+    sorted_genre_tuples = genre_means(percents_df)
+    genre_order = [genre for genre, _, _ in sorted_genre_tuples]
+    print(percents_df.head())
+    print(genre_order)
+    plt.figure(figsize=(14,2.4))
+    ax = sns.barplot(x='Genre', y='Percentage of closest books in same genre', data=percents_df, order=genre_order)
+    ax.set_ylim((0,1))
+    ax.set_xlabel('Genre', fontsize=16)
+    ax.set_ylabel('Percentage of closest\nbooks in same genre', fontsize=16)
+    ax.set_xticklabels(ax.get_xticklabels(), fontsize=14)
+    ax.set_yticklabels(ax.get_yticklabels(), fontsize=14)
+    ax.yaxis.set_major_formatter(matplotlib.ticker.PercentFormatter(1.0))
+    ax.grid(b=True, which='minor', axis='y')
+    ax.yaxis.set_minor_locator(matplotlib.ticker.MultipleLocator(0.1))
+    bar_labels = ['{:.1f}%'.format(m) for _, m, _ in sorted_genre_tuples]
+    for rect, label in zip(ax.patches, bar_labels):
+        ax.text(rect.get_x() + rect.get_width() / 2, rect.get_height() + 0.06, label,
+                ha='center', va='bottom', fontsize=14)
+    savefig('./average-percentage-closest-books-same-genre.pdf', bbox_inches='tight')
+    plt.close()
+
+
+def coreviewed_scoring(artifacts):
+    args = artifacts.args
+    genre_index = artifacts.genre_index()
+    print('Getting average percentage of closest 1-hop neighbor books that are in the same genre')
+    genre_mean_std = []
+    for genre in all_genres_uppercase:
+        print('    ', genre)
+        book_id_to_most_coreviewed_neighbors = artifacts.coreviewed(genre.lower())
+        coreviewed_rows = genre_index.row_matrix([[b for b, _ in coreviewed] for coreviewed in book_id_to_most_coreviewed_neighbors.values()], args.num_neighbors_checked)
+        percents = genre_index.fraction_in_genre(coreviewed_rows, genre, args.num_neighbors_checked, args.top_genres_cutoff) * 100
+        genre_mean_std.append((genre, np.mean(percents), np.std(percents)))
+    print('Sorted average percentage of closest 1-hop neighbor books that are in the same genre:')
+    for genre, mean, std in sorted(genre_mean_std, key=operator.itemgetter(1), reverse=True):
+        print('    {}: {:.2f} ± {:.2f} std'.format(genre, mean, std))
+
 
 # get this intersection across all genres
 # row in the csv: title, # times top total, # times top in romance, # times top in fantasy, ...
-totals = {}
-# book_id_to_number_of_times_in_top_k[book_id][genre]
-book_id_to_number_of_times_in_top_k = defaultdict(lambda: defaultdict(int))
-for genre in all_genres:
-    print('Getting results for {}'.format(genre))
-    with open('librarything-books/{}-closest-books-network-distance-weighted.json'.format(genre), 'r') as f:
-        book_id_to_closest = json.load(f)
-    totals[genre] = len(book_id_to_closest)
-    # which books are near-neighbors of all of the sampled books???
-    for source_book_id, closest in book_id_to_closest.items():
-        for book_id, distance, num_hops in closest[:10]:
-            book_id_to_number_of_times_in_top_k[book_id][genre] += 1
-book_id_tuples = [tuple([book_id_to_metadata[b]['title'], sum(genre_dict.values())] + ['{} ({:.1f}%)'.format(genre_dict[g], genre_dict[g] / totals[g] * 100) for g in all_genres]) for b, genre_dict in book_id_to_number_of_times_in_top_k.items()]
-book_id_tuples.sort(key=operator.itemgetter(1), reverse=True)
-df = pd.DataFrame(book_id_tuples[:500], columns = ['book_id', 'total'] + all_genres)
-df.to_csv('./librarything-books/top-10-closest-books-all-genres.csv', index=False)
-
-# now sort by top for each genre
-book_id_tuples = [tuple([book_id_to_metadata[b]['title'], sum(genre_dict.values())] + [genre_dict[g] / totals[g] * 100 for g in all_genres]) for b, genre_dict in book_id_to_number_of_times_in_top_k.items()]
-for i, genre in enumerate(all_genres):
-    print('Sorting by {}'.format(genre))
-    all_rows = book_id_tuples.copy()
-    all_rows.sort(key=operator.itemgetter(2 + i), reverse=True)
-    # now stringify percentage floats and take the top 500
-    all_genre_strings = [tuple('{:.0f}%'.format(percent) for percent in row[2:]) for row in all_rows[:500]]
-    rows = [row[:2] + genre_strings for row, genre_strings in zip(all_rows[:500], all_genre_strings)]
-    df = pd.DataFrame(rows, columns = ['book_id', 'total'] + all_genres)
-    df.to_csv('./librarything-books/top-10-closest-books-all-genres_sorted-by-{}.csv'.format(genre), index=False)
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
+def top_10_tables(artifacts):
+    totals = {}
+    # book_id_to_number_of_times_in_top_k[book_id][genre]
+    book_id_to_number_of_times_in_top_k = defaultdict(lambda: defaultdict(int))
+    for genre in all_genres:
+        print('Getting results for {}'.format(genre))
+        closest_results = artifacts.closest(genre)
+        totals[genre] = len(closest_results)
+        # which books are near-neighbors of all of the sampled books???
+        for i in range(len(closest_results)):
+            for book_id in closest_results.neighbor_ids(i, 10):
+                book_id_to_number_of_times_in_top_k[book_id][genre] += 1
+    book_id_tuples = [tuple([artifacts.title(b), sum(genre_dict.values())] + ['{} ({:.1f}%)'.format(genre_dict[g], genre_dict[g] / totals[g] * 100) for g in all_genres]) for b, genre_dict in book_id_to_number_of_times_in_top_k.items()]
+    book_id_tuples.sort(key=operator.itemgetter(1), reverse=True)
+    df = pd.DataFrame(book_id_tuples[:500], columns = ['book_id', 'total'] + all_genres)
+    df.to_csv('./librarything-books/top-10-closest-books-all-genres.csv', index=False)
+
+    # now sort by top for each genre
+    book_id_tuples = [tuple([artifacts.title(b), sum(genre_dict.values())] + [genre_dict[g] / totals[g] * 100 for g in all_genres]) for b, genre_dict in book_id_to_number_of_times_in_top_k.items()]
+    for i, genre in enumerate(all_genres):
+        print('Sorting by {}'.format(genre))
+        all_rows = book_id_tuples.copy()
+        all_rows.sort(key=operator.itemgetter(2 + i), reverse=True)
+        # now stringify percentage floats and take the top 500
+        all_genre_strings = [tuple('{:.0f}%'.format(percent) for percent in row[2:]) for row in all_rows[:500]]
+        rows = [row[:2] + genre_strings for row, genre_strings in zip(all_rows[:500], all_genre_strings)]
+        df = pd.DataFrame(rows, columns = ['book_id', 'total'] + all_genres)
+        df.to_csv('./librarything-books/top-10-closest-books-all-genres_sorted-by-{}.csv'.format(genre), index=False)
+
+
+STAGES = {
+    'degree-baseline': degree_baseline,
+    'closest': lambda artifacts: artifacts.get('closest_percents', lambda: closest_scoring(artifacts)),
+    'plot': plot,
+    'coreviewed': coreviewed_scoring,
+    'top-10-tables': top_10_tables,
+}
+
+
+def main():
+    args = parser.parse_args()
+    stages = args.stages if args.stages else list(STAGES.keys())
+    for stage in stages:
+        if stage not in STAGES:
+            parser.error('unknown stage {}, choose from {}'.format(stage, ', '.join(STAGES)))
+    artifacts = Artifacts(args)
+    for stage in stages:
+        start = time.perf_counter()
+        STAGES[stage](artifacts)
+        print('Stage {} done in {:.1f}s'.format(stage, time.perf_counter() - start))
+    if artifacts.unscraped_titles:
+        print('Warning: {} books were never scraped and are listed by id instead of title.'.format(len(artifacts.unscraped_titles)))
+
+
+if __name__ == '__main__':
+    main()
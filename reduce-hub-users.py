@@ -0,0 +1,105 @@
+import json
+import argparse
+import random
+import statistics
+
+from book_graph_utils import *
+from genre_index import GenreIndex
+
+# builds (or opens) a reduced graph with hub users capped, sampled or dropped, and
+# reports how many reviews and co-review edges it removes and what that does to
+# the genre precision that process-all-results.py measures, e.g.
+#   python reduce-hub-users.py --hub_reduction cap-1000
+#   python get-all-closest-books.py --hub_reduction cap-1000 --output_directory_path librarything-books/cap-1000
+# see hub_users.py for the reduction names
+# precision is the mean fraction of each sampled source's closest books that are
+# in the source's genre, on the full and on the reduced graph, over the sources
+# that still have reviewers on the reduced graph (the others are reported as
+# disconnected); closest books that were never scraped count as not in the genre,
+# so scrape the missing ones (see the README) for the reduced graph's numbers to be final
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--hub_reduction', type=str, required=True)
+parser.add_argument('--sources_per_genre', type=int, default=20, help='0 skips the precision comparison')
+parser.add_argument('--num_neighbors_checked', type=int, default=10)
+parser.add_argument('--top_genres_cutoff', type=int, default=5)
+parser.add_argument('--skip_edge_counts', action='store_true', help='do not count the co-review edges of both graphs (slow on the full graph without cached degrees)')
+parser.add_argument('--books_dict_path', type=str, default='librarything-books/genre_matched_books_dict.json')
+parser.add_argument('--books_directory_path', type=str, default='all-books')
+parser.add_argument('--output_path', type=str, default=None, help='defaults to librarything-books/hub-reduction-<name>.json')
+parser.add_argument('--seed', type=int, default=0)
+
+
+# closest books of every source, and the mean seconds per search
+def search_all(graph, sources, k):
+    book_id_to_closest = {}
+    start = time.perf_counter()
+    for book_id in sources:
+        book_id_to_closest[book_id] = [b for b, _, _ in get_k_closest_books_in_graph(book_id, graph, k=k)]
+    return book_id_to_closest, (time.perf_counter() - start) / max(len(sources), 1)
+
+
+def genre_precision(genre_index, genre, neighbor_lists, args):
+    # unscraped books gather the all-unmatched padding row
+    rows = np.full((len(neighbor_lists), args.num_neighbors_checked), -1, dtype=np.int64)
+    for i, neighbors in enumerate(neighbor_lists):
+        rows[i, :len(neighbors)] = [genre_index.book_id_to_row.get(b, -1) for b in neighbors]
+    fractions = genre_index.fraction_in_genre(rows, genre, args.num_neighbors_checked, args.top_genres_cutoff)
+    scraped = sum(b in genre_index for neighbors in neighbor_lists for b in neighbors)
+    return float(fractions.mean()), scraped / max(sum(len(neighbors) for neighbors in neighbor_lists), 1)
+
+
+def main():
+    args = parser.parse_args()
+    graph = get_cached_book_graph()
+    reduced = get_cached_reduced_book_graph(args.hub_reduction)
+    report = {'hub_reduction': args.hub_reduction, 'graph_version': graph.version, 'reduced_graph_version': reduced.version}
+    report.update(read_cache_header('data/cached_book-graph_' + args.hub_reduction)['extra']['report'])
+    print('Kept {} of {} reviews ({:.1f}%), {} hub users lost reviews.'.format(
+        report['reviews_kept'], report['reviews'], 100 * report['reviews_kept'] / max(report['reviews'], 1), report['hub_users']))
+    print('Co-review pairs behind expanding every book: {} -> {} ({:.1f}%).'.format(
+        report['coreview_pairs'], report['coreview_pairs_kept'], 100 * report['coreview_pairs_kept'] / max(report['coreview_pairs'], 1)))
+
+    if not args.skip_edge_counts:
+        # each co-review edge is counted from both ends
+        report['coreview_edges'] = int(get_graph_degrees(graph)[0].sum()) // 2
+        report['coreview_edges_kept'] = int(get_graph_degrees(reduced)[0].sum()) // 2
+        print('Co-review edges: {} -> {} ({:.1f}%).'.format(
+            report['coreview_edges'], report['coreview_edges_kept'], 100 * report['coreview_edges_kept'] / max(report['coreview_edges'], 1)))
+
+    if args.sources_per_genre > 0:
+        with open(args.books_dict_path, 'r') as f:
+            genre_to_book_ids = json.load(f)
+        genre_index = GenreIndex.from_top_genres(read_scraped_top_genres(args.books_directory_path), [genre.title() for genre in genre_to_book_ids])
+        rng = random.Random(args.seed)
+        report['genres'] = {}
+        for genre, book_ids in genre_to_book_ids.items():
+            book_ids = [b for b in book_ids if graph.has_reviews(b)]
+            sampled = rng.sample(book_ids, min(args.sources_per_genre, len(book_ids)))
+            # sources with no reviewers left have no neighbors on the reduced graph, they are
+            # counted apart rather than as zero precision
+            sources = [b for b in sampled if reduced.has_reviews(b)]
+            if not sources:
+                report['genres'][genre] = {'sources': 0, 'sources_disconnected': len(sampled)}
+                print('{}: all {} sources disconnected on the reduced graph'.format(genre, len(sampled)))
+                continue
+            full_closest, full_seconds = search_all(graph, sources, args.num_neighbors_checked)
+            reduced_closest, reduced_seconds = search_all(reduced, sources, args.num_neighbors_checked)
+            full_precision, _ = genre_precision(genre_index, genre.title(), [full_closest[b] for b in sources], args)
+            reduced_precision, scraped = genre_precision(genre_index, genre.title(), [reduced_closest[b] for b in sources], args)
+            overlap = [len(set(full_closest[b]) & set(reduced_closest[b])) / max(len(full_closest[b]), 1) for b in sources]
+            report['genres'][genre] = {'sources': len(sources), 'sources_disconnected': len(sampled) - len(sources), 'precision': full_precision, 'precision_reduced': reduced_precision,
+                                       'reduced_scraped_fraction': scraped, 'overlap': statistics.mean(overlap) if overlap else None,
+                                       'seconds_per_source': full_seconds, 'seconds_per_source_reduced': reduced_seconds}
+            print('{}: precision {:.3f} -> {:.3f} ({:.0f}% of the reduced neighbors scraped), {:.0f}% of neighbors kept, {:.3f}s -> {:.3f}s per source, {} of {} sources disconnected'.format(
+                genre, full_precision, reduced_precision, 100 * scraped, 100 * statistics.mean(overlap) if overlap else 0, full_seconds, reduced_seconds,
+                len(sampled) - len(sources), len(sampled)))
+
+    output_path = args.output_path or 'librarything-books/hub-reduction-{}.json'.format(args.hub_reduction)
+    with open(output_path, 'w') as f:
+        json.dump(report, f, indent=4)
+    print('Saved {}.'.format(output_path))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+import json
+import os
+import threading
+
+import pandas as pd
+
+
+# append-only JSON-lines store of records with a unique key field
+# every append is flushed and fsynced, so a crash loses at most the record
+# being written; a torn last line is cut off the next time the store is opened
+# the set of stored keys is kept in memory for O(1) resume checks
+class JsonLinesStore:
+
+    def __init__(self, path, key):
+        self.path = path
+        self.key = key
+        self.keys = set()
+        self.lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        self._recover()
+        self.f = open(path, 'a', encoding='utf-8')
+
+    # index the complete records and drop anything after the last one
+    def _recover(self):
+        if not os.path.exists(self.path):
+            return
+        good_bytes = 0
+        with open(self.path, 'rb') as f:
+            for line in f:
+                if not line.endswith(b'\n'):
+                    break
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    break
+                self.keys.add(record[self.key])
+                good_bytes += len(line)
+        if good_bytes < os.path.getsize(self.path):
+            print('Dropping a partially written record at the end of {}.'.format(self.path))
+            with open(self.path, 'r+b') as f:
+                f.truncate(good_bytes)
+
+    def __contains__(self, key):
+        return key in self.keys
+
+    def __len__(self):
+        return len(self.keys)
+
+    def append(self, record):
+        line = json.dumps(record) + '\n'
+        with self.lock:
+            self.f.write(line)
+            self.f.flush()
+            os.fsync(self.f.fileno())
+            self.keys.add(record[self.key])
+
+    def close(self):
+        self.f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # one record per key; if a key was appended twice the last one wins
+    def records(self):
+        with self.lock:
+            self.f.flush()
+        key_to_record = {}
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                record = json.loads(line)
+                key_to_record[record[self.key]] = record
+        return list(key_to_record.values())
+
+    def export_json(self, fn):
+        with open(fn, 'w') as f:
+            json.dump(self.records(), f)
+
+    def export_csv(self, fn):
+        pd.DataFrame(self.records()).to_csv(fn, index=False, encoding='utf-8')
+
+
+# json.dump to a temporary file renamed over fn, so fn is either the old or the new file
+def write_json_atomic(fn, obj, **kwargs):
+    tmp_fn = '{}.tmp-{}'.format(fn, os.getpid())
+    with open(tmp_fn, 'w') as f:
+        json.dump(obj, f, **kwargs)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_fn, fn)
+
+
+# read every record of a store without opening it for writing
+def read_json_lines(fn):
+    records = []
+    with open(fn, 'r', encoding='utf-8') as f:
+        for line in f:
+            if not line.endswith('\n'):
+                break
+            records.append(json.loads(line))
+    return records
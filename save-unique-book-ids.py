@@ -0,0 +1,46 @@
+import argparse
+import json
+import os
+
+import numpy as np
+
+from closest_results import closest_result_genres, load_closest_results
+
+# unique goodreads ids of every source book and its closest and most co-reviewed
+# books over all genres, one per line, for get_book_genres.py to scrape
+# reads the closest books in either saved format (array directories or the old json)
+#   python save-unique-book-ids.py
+#   python get_book_genres.py --book_ids_path librarything-books/all-unique-books-to-scrape.txt --output_directory_path all-books
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--results_directory_path', type=str, default='librarything-books')
+parser.add_argument('--num_neighbors', type=int, default=None, help='only the first n closest / most co-reviewed books of each source (default: all)')
+parser.add_argument('--output_path', type=str, default='librarything-books/all-unique-books-to-scrape.txt')
+
+
+def main():
+    args = parser.parse_args()
+    book_ids = set()
+    genres = closest_result_genres(args.results_directory_path)
+    for genre in genres:
+        results = load_closest_results(args.results_directory_path, genre)
+        neighbors = np.asarray(results.neighbors[:, :args.num_neighbors])
+        rows = np.union1d(results.sources, neighbors[neighbors >= 0])
+        book_ids.update(int(b) for b in results.book_ids[rows])
+
+        coreviewed_fn = os.path.join(args.results_directory_path, '{}-most-coreviewed-neighbors.json'.format(genre))
+        if os.path.exists(coreviewed_fn):
+            with open(coreviewed_fn, 'r') as f:
+                book_id_to_coreviewed = json.load(f)
+            for source, coreviewed in book_id_to_coreviewed.items():
+                book_ids.add(int(source))
+                book_ids.update(int(b) for b, _ in coreviewed[:args.num_neighbors])
+        print('{}: {} sources, {} unique books so far.'.format(genre, len(results), len(book_ids)))
+
+    with open(args.output_path, 'w') as f:
+        f.write(''.join('{}\n'.format(b) for b in sorted(book_ids)))
+    print('Saved {} unique book ids from {} genres to {}.'.format(len(book_ids), len(genres), args.output_path))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+import json
+import os
+import numpy as np
+
+# structured log of closest-book searches, one json line per source book with
+# the profile filled in by get_k_closest_books(..., profile={}), plus an
+# aggregate summary written next to it when the log is closed:
+#   <name>.jsonl          {"book_id": ..., "seconds": ..., "pops": ..., ...}
+#   <name>-summary.json   totals and time percentiles over all sources
+
+# counters that are summed in the summary
+SUMMED_COUNTERS = ('pops', 'stale_pops', 'pushes', 'decrease_keys', 'edges_scanned', 'relaxations',
+                   'books_touched', 'users_touched', 'reviews_scanned')
+
+
+def search_summary_path(path):
+    return os.path.splitext(path)[0] + '-summary.json'
+
+
+class SearchLog:
+    'Append-only JSONL log of per-source search profiles'
+
+    def __init__(self, path, num_slowest=10):
+        self.path = path
+        self.num_slowest = num_slowest
+        self.records = []
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        self.f = open(path, 'w', encoding='utf-8')
+
+    def record(self, book_id, profile, **extra):
+        'Log the profile of the search from book_id, with any extra fields (genre, worker, ...)'
+        record = dict(book_id=book_id, **extra)
+        record.update(profile)
+        self.records.append(record)
+        self.f.write(json.dumps(record) + '\n')
+        self.f.flush()
+
+    def summary(self):
+        'Totals over every logged search, time percentiles and the slowest sources'
+        seconds = np.array([r['seconds'] for r in self.records], dtype=np.float64)
+        summary = {'sources': len(self.records)}
+        if len(seconds) == 0:
+            return summary
+        summary['seconds'] = {'total': float(seconds.sum()), 'mean': float(seconds.mean()),
+                              'p50': float(np.percentile(seconds, 50)), 'p95': float(np.percentile(seconds, 95)),
+                              'max': float(seconds.max())}
+        for key in SUMMED_COUNTERS:
+            values = [r[key] for r in self.records if r.get(key) is not None]
+            if values:
+                summary[key] = int(sum(values))
+        peaks = [r['peak_queue_size'] for r in self.records if r.get('peak_queue_size') is not None]
+        if peaks:
+            summary['max_peak_queue_size'] = int(max(peaks))
+        slowest = np.argsort(-seconds, kind='stable')[:self.num_slowest]
+        summary['slowest'] = [self.records[i] for i in slowest]
+        return summary
+
+    def close(self):
+        'Close the log and write the summary, which is also returned'
+        self.f.close()
+        summary = self.summary()
+        with open(search_summary_path(self.path), 'w') as f:
+            json.dump(summary, f, indent=4)
+        return summary
+
+
+def print_search_summary(summary):
+    print('Search profile over {} sources:'.format(summary['sources']))
+    if 'seconds' not in summary:
+        return
+    seconds = summary['seconds']
+    print('    {:.1f}s total, {:.3f}s mean, {:.3f}s p50, {:.3f}s p95, {:.3f}s max'.format(
+        seconds['total'], seconds['mean'], seconds['p50'], seconds['p95'], seconds['max']))
+    print('    ' + ', '.join('{} {}'.format(summary[key], key.replace('_', ' ')) for key in SUMMED_COUNTERS if key in summary))
+    for record in summary['slowest'][:3]:
+        print('    slow: {} in {:.3f}s ({} edges scanned, peak queue {})'.format(
+            record['book_id'], record['seconds'], record['edges_scanned'], record.get('peak_queue_size')))
@@ -0,0 +1,51 @@
+import argparse
+
+from book_graph_utils import *
+from closest_books_service import ClosestBooksService, make_server
+
+# keeps the graph open and answers closest-books queries over http on localhost, e.g.
+#   python serve-closest-books.py --jobs 8 --precomputed_edges
+#   curl 'http://127.0.0.1:8765/closest?book_id=1&k=10'
+#   curl -d '{"mode": "coreviewed", "k": 10, "book_ids": ["1", "2"]}' http://127.0.0.1:8765/query
+#   curl http://127.0.0.1:8765/stats
+#   python get-closest-books.py --genre horror --server_url http://127.0.0.1:8765
+# see closest_books_service.py for the endpoints
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--host', type=str, default='127.0.0.1')
+parser.add_argument('--port', type=int, default=8765)
+parser.add_argument('--jobs', type=int, default=os.cpu_count())
+parser.add_argument('--k', type=int, default=100, help='k when a query does not give one')
+parser.add_argument('--cache_entries', type=int, default=100000, help='answers kept in the LRU result cache')
+parser.add_argument('--hub_reduction', type=str, default=None, help='serve a reduced graph, e.g. cap-1000 (see hub_users.py)')
+parser.add_argument('--precomputed_edges', action='store_true', help='search over the cached co-review matrix')
+parser.add_argument('--queue', type=str, default='heapq', choices=PRIORITY_QUEUES)
+parser.add_argument('--bounded', action='store_true', help='prune candidates that cannot reach the top k (same results)')
+parser.add_argument('--landmarks', type=int, default=0, help='bound the searches with distances from this many landmark books (same results, see landmark_index.py)')
+parser.add_argument('--epsilon', type=float, default=1e-6, help='accuracy of push queries')
+parser.add_argument('--num_walks', type=int, default=10000, help='walks per source for walks queries')
+parser.add_argument('--neighbor_cache_mb', type=int, default=1024, help='per-worker LRU cache of expanded neighbor lists (0 to disable)')
+
+
+def main():
+    args = parser.parse_args()
+    # build (or validate) the caches once before the workers open them
+    graph = open_search_graph(args.hub_reduction, args.precomputed_edges, num_landmarks=args.landmarks)
+
+    service = ClosestBooksService(graph.version, args.jobs, args.cache_entries, hub_reduction=args.hub_reduction,
+                                  precomputed_edges=args.precomputed_edges, neighbor_cache_mb=args.neighbor_cache_mb,
+                                  num_landmarks=args.landmarks, queue=args.queue, bounded=args.bounded, epsilon=args.epsilon, num_walks=args.num_walks)
+    try:
+        server = make_server(service, args.host, args.port, default_k=args.k)
+        print('Serving graph {} on http://{}:{} with {} jobs'.format(graph.version, args.host, server.server_port, args.jobs))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        server.server_close()
+    finally:
+        service.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,59 @@
+# serves saved goodreads book pages at /book/show/<book_id>, so the scraper can be
+# exercised locally:
+#   python serve-saved-book-pages.py --pages_directory_path saved-pages --port 8000
+#   python get_book_genres.py --book_ids_path ids.txt --output_directory_path out \
+#       --concurrency 8 --requests_per_second 50 --base_url http://127.0.0.1:8000
+# pages are read from <pages_directory_path>/<book_id>.html
+
+import argparse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import os
+import random
+import time
+
+
+def make_handler(pages_directory_path, error_rate, delay):
+
+    class SavedBookPageHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_GET(self):
+            if delay > 0:
+                time.sleep(delay)
+            prefix = '/book/show/'
+            book_id = self.path[len(prefix):] if self.path.startswith(prefix) else None
+            fn = os.path.join(pages_directory_path, '{}.html'.format(book_id))
+            if random.random() < error_rate:
+                self.send_body(503, b'try again later')
+            elif book_id and os.path.basename(fn) == '{}.html'.format(book_id) and os.path.exists(fn):
+                with open(fn, 'rb') as f:
+                    self.send_body(200, f.read())
+            else:
+                self.send_body(404, b'not found')
+
+        def send_body(self, status, body):
+            self.send_response(status)
+            self.send_header('Content-Type', 'text/html; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    return SavedBookPageHandler
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--pages_directory_path', type=str, required=True)
+    parser.add_argument('--host', type=str, default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--error_rate', type=float, default=0.0, help='fraction of requests answered with a 503')
+    parser.add_argument('--delay', type=float, default=0.0, help='seconds to wait before answering')
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(args.pages_directory_path, args.error_rate, args.delay))
+    print('Serving {} on http://{}:{}'.format(args.pages_directory_path, args.host, server.server_port))
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,132 @@
+import os
+import time
+import numpy as np
+import pandas as pd
+
+# synthetic stand-ins for goodreads_interactions.csv and book_id_map.csv, with
+# power-law user and book degrees, so the pipeline can be run and benchmarked
+# without the UCSD download
+# the full dataset has about 228M rows, 876k users and 2.36M books, which the
+# default user and book counts scale down to
+
+
+def default_num_users(num_rows):
+    return max(num_rows // 250, 100)
+
+
+def default_num_books(num_rows):
+    return max(num_rows // 100, 100)
+
+
+# indices in [0, size) with P(i) proportional to (i + 1) ** -exponent, scattered
+# by a fixed permutation so the popular ids are not all small numbers
+class PowerLawSampler:
+
+    def __init__(self, rng, size, exponent):
+        weights = np.arange(1, size + 1, dtype=np.float64) ** -exponent
+        self.cdf = np.cumsum(weights)
+        self.cdf /= self.cdf[-1]
+        self.permutation = rng.permutation(size)
+
+    def sample(self, rng, n):
+        ranks = np.searchsorted(self.cdf, rng.random(n), side='right')
+        return self.permutation[np.minimum(ranks, len(self.cdf) - 1)]
+
+
+# writes <directory_path>/goodreads_interactions.csv and book_id_map.csv
+# rows are (user_id, book_id, is_read, rating, is_reviewed) with csv ids like the real file
+# the same arguments always give the same files
+def write_synthetic_interactions(directory_path, num_rows, num_users=None, num_books=None, user_exponent=0.8, book_exponent=1.0,
+                                 review_fraction=0.4, seed=0, chunksize=5000000):
+    num_users = num_users or default_num_users(num_rows)
+    num_books = num_books or default_num_books(num_rows)
+    if not os.path.exists(directory_path):
+        os.makedirs(directory_path)
+    rng = np.random.default_rng(seed)
+
+    print('Writing book id map for {} books.'.format(num_books))
+    # goodreads ids are unique and spread over a larger range than the csv ids
+    goodreads_book_ids = rng.choice(20 * num_books, size=num_books, replace=False) + 1
+    pd.DataFrame({'book_id_csv': np.arange(num_books), 'book_id': goodreads_book_ids}).to_csv(
+        os.path.join(directory_path, 'book_id_map.csv'), index=False)
+
+    print('Writing {} interactions for {} users.'.format(num_rows, num_users))
+    users = PowerLawSampler(rng, num_users, user_exponent)
+    books = PowerLawSampler(rng, num_books, book_exponent)
+    fn = os.path.join(directory_path, 'goodreads_interactions.csv')
+    start = time.perf_counter()
+    for chunk_start in range(0, num_rows, chunksize):
+        n = min(chunksize, num_rows - chunk_start)
+        is_reviewed = (rng.random(n) < review_fraction).astype(np.int8)
+        rating = rng.integers(0, 6, n, dtype=np.int8)
+        chunk = pd.DataFrame({'user_id': users.sample(rng, n),
+                              'book_id': books.sample(rng, n),
+                              'is_read': (rating > 0).astype(np.int8),
+                              'rating': rating,
+                              'is_reviewed': is_reviewed})
+        chunk.to_csv(fn, mode='w' if chunk_start == 0 else 'a', header=chunk_start == 0, index=False)
+        print('    wrote {} rows ({:.0f} rows/s)'.format(chunk_start + n, (chunk_start + n) / (time.perf_counter() - start)))
+    return fn
+
+
+# goodreads-like book pages, for benchmarking the extraction backends of
+# get_book_genres.py and serving with serve-saved-book-pages.py: the title,
+# author and genre markup the scraper reads, the isbn, rating graph, page count and
+# year that its regex helpers read, and filler review markup up to about page_kb
+SYNTHETIC_GENRES = ['Fiction', 'Horror', 'Fantasy', 'Science Fiction', 'Mystery', 'Thriller', 'Romance', 'Historical',
+                    'Nonfiction', 'Memoir', 'Biography', 'Paranormal', 'Vampires', 'Young Adult', 'Classics', 'Poetry']
+SYNTHETIC_WORDS = ['the', 'night', 'house', 'of', 'a', 'river', 'dark', 'last', 'letters', 'city', 'winter', 'garden',
+                   'secret', 'and', 'stars', 'bones', 'queen', 'silent', 'road', 'memory', 'fire', 'glass', 'l’été']
+
+
+def synthetic_book_page(book_id, rng, page_kb=25):
+    def words(n):
+        return ' '.join(rng.choice(SYNTHETIC_WORDS, n))
+    title = words(int(rng.integers(1, 6))).title()
+    author = '{} {}'.format(words(1).title(), words(1).title())
+    genre_blocks = []
+    for _ in range(int(rng.integers(0, 10))):
+        # top-level genres and "Parent > Child" pairs, like the real genre list
+        genres = rng.choice(SYNTHETIC_GENRES, int(rng.integers(1, 3)), replace=False)
+        links = '\n          &gt;\n          '.join(
+            '<a class="actionLinkLite bookPageGenreLink" href="/genres/{}">{}</a>'.format(g.lower().replace(' ', '-'), g) for g in genres)
+        genre_blocks.append('<div class="elementList">\n  <div class="left">\n          {}\n  </div>\n'
+                            '  <div class="right"><a class="actionLinkLite greyText bookPageGenreLink" href="/shelf/users">{} users</a></div>\n'
+                            '</div>'.format(links, int(rng.integers(1, 5000))))
+    distribution = ', '.join(str(int(c)) for c in rng.integers(0, 100000, 5))
+    head = ('<!DOCTYPE html>\n<html>\n<head>\n<title>{title} by {author} | Goodreads</title>\n'
+            '<script>\n//<![CDATA[\n  var nisbn: {isbn}\n  var nisbn13: {isbn13}\n//]]>\n</script>\n</head>\n<body>\n'
+            '<div id="metacol">\n<h1 id="bookTitle" class="gr-h1 gr-h1--serif" itemprop="name">\n      {title}\n</h1>\n'
+            '<h2 id="bookSeries"><a class="greyText" href="/series/{series}">({series_title} #1)</a></h2>\n'
+            '<div id="bookAuthors"><span itemprop="author"><a class="authorName" href="/author/show/1"><span itemprop="name">{author}</span></a></span></div>\n'
+            '<div id="details"><span itemprop="numberOfPages">{pages} pages</span>\n'
+            '<nobr class="greyText">\n        (first published {year})\n      </nobr></div>\n'
+            '<script>renderRatingGraph([{distribution}]);</script>\n</div>\n'
+            '<div class="rightContainer"><h2 class="brownBackground">Genres</h2>\n{genres}\n</div>\n').format(
+        title=title, author=author, isbn=int(rng.integers(10 ** 9, 10 ** 10)), isbn13=int(rng.integers(10 ** 12, 10 ** 13)),
+        series=int(rng.integers(1, 10 ** 6)), series_title=words(2).title(), pages=int(rng.integers(50, 1200)),
+        year=int(rng.integers(1800, 2020)), distribution=distribution, genres='\n'.join(genre_blocks))
+    reviews = []
+    size = len(head)
+    while size < page_kb * 1024:
+        review = ('<div class="friendReviews elementListBrown"><div class="left bodycol">'
+                  '<a class="user" href="/user/show/{}">{}</a> rated it <span class="staticStars">{} stars</span>'
+                  '<div class="reviewText stacked"><span class="readable">{}</span></div></div></div>\n').format(
+            int(rng.integers(1, 10 ** 8)), words(1).title(), int(rng.integers(1, 6)), words(int(rng.integers(20, 120))))
+        reviews.append(review)
+        size += len(review)
+    return head + ''.join(reviews) + '</body>\n</html>\n'
+
+
+# writes <directory_path>/<book_id>.html for num_pages made-up book ids
+# the same arguments always give the same pages
+def write_synthetic_book_pages(directory_path, num_pages, page_kb=25, seed=0):
+    if not os.path.exists(directory_path):
+        os.makedirs(directory_path)
+    rng = np.random.default_rng(seed)
+    book_ids = rng.choice(10 ** 7, size=num_pages, replace=False) + 1
+    for book_id in book_ids:
+        with open(os.path.join(directory_path, '{}.html'.format(book_id)), 'w', encoding='utf-8') as f:
+            f.write(synthetic_book_page(book_id, rng, page_kb))
+    print('Wrote {} book pages to {}.'.format(num_pages, directory_path))
+    return [str(b) for b in book_ids]
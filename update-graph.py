@@ -0,0 +1,34 @@
+import json
+import argparse
+
+from book_graph_utils import *
+
+# folds a file of new interactions into the cached graph, co-review matrix and
+# degrees, then lists the saved closest-books and most-coreviewed results that
+# the new reviews made stale; pass that list to
+#   python get-all-closest-books.py --invalidated_path <report>
+# to recompute just those sources
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--delta_path', type=str, required=True, help='new rows with the columns of goodreads_interactions.csv')
+parser.add_argument('--results_directory_path', type=str, default='librarything-books')
+parser.add_argument('--report_path', type=str, default='librarything-books/invalidated-sources.json')
+
+
+def main():
+    args = parser.parse_args()
+    graph, affected_book_ids = update_cached_book_graph(args.delta_path)
+
+    invalidated = invalidated_results(args.results_directory_path, affected_book_ids)
+    for kind, genre_to_book_ids in invalidated.items():
+        for genre, book_ids in genre_to_book_ids.items():
+            print('{} {} results invalidated for {}.'.format(len(book_ids), kind, genre))
+    report = {'graph_version': graph.version, 'delta_path': args.delta_path,
+              'num_affected_books': len(affected_book_ids), 'invalidated': invalidated}
+    with open(args.report_path, 'w') as f:
+        json.dump(report, f, indent=4)
+    print('Wrote {}.'.format(args.report_path))
+
+
+if __name__ == '__main__':
+    main()